@@ -0,0 +1,79 @@
+"""Times the parsing of %%sql results into pandas dataframes.
+
+Usage: python benchmarks/records_to_dataframe.py [--rows 10000 100000 1000000] [--columns 10]
+
+For each row count, a result with the given number of columns (ints, floats, strings, dates and a column
+that is null in every other row) is rendered the way the driver sends it back, then parsed with
+records_to_dataframe (JSON lines) and columnar_records_to_dataframe (columnar), with and without coercion."""
+from __future__ import print_function
+import argparse
+import json
+import random
+import timeit
+
+from sparkmagic.utils.constants import SESSION_KIND_PYSPARK
+from sparkmagic.utils.utils import records_to_dataframe, columnar_records_to_dataframe
+
+
+def _make_rows(row_count, column_count):
+    rows = []
+    for i in range(row_count):
+        row = {}
+        for c in range(column_count):
+            kind = c % 5
+            if kind == 0:
+                row[u"int_{}".format(c)] = i
+            elif kind == 1:
+                row[u"float_{}".format(c)] = random.random()
+            elif kind == 2:
+                row[u"str_{}".format(c)] = u"value-{}".format(i % 1000)
+            elif kind == 3:
+                row[u"date_{}".format(c)] = u"2016-01-{:02d}".format(i % 28 + 1)
+            elif i % 2:
+                row[u"sparse_{}".format(c)] = i
+        rows.append(row)
+    return rows
+
+
+def _json_lines(rows):
+    return u"\n".join(json.dumps(row) for row in rows)
+
+
+def _columnar(rows):
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    data = [[row.get(column) for row in rows] for column in columns]
+    return json.dumps({u"columns": columns, u"data": data})
+
+
+def _time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(u"{:>10} {:>8} {:>16} {:>16}".format(u"rows", u"coerce", u"json lines (s)", u"columnar (s)"))
+    for row_count in args.rows:
+        rows = _make_rows(row_count, args.columns)
+        json_lines = _json_lines(rows)
+        columnar = _columnar(rows)
+        del rows
+
+        for coerce in (False, True):
+            json_lines_seconds = _time(lambda: records_to_dataframe(json_lines, SESSION_KIND_PYSPARK, coerce),
+                                       args.repeat)
+            columnar_seconds = _time(lambda: columnar_records_to_dataframe(columnar, coerce), args.repeat)
+            print(u"{:>10} {:>8} {:>16.3f} {:>16.3f}".format(row_count, str(coerce), json_lines_seconds,
+                                                             columnar_seconds))
+
+
+if __name__ == "__main__":
+    main()
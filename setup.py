@@ -96,7 +96,8 @@ setup(name=NAME,
           'ipykernel>=4.2.2,<5',
           'ipywidgets>5.0.0,<8.0',
           'notebook>=4.2,<6.0',
-          'tornado>=4',
-          'requests_kerberos>=0.8.0'
+          'tornado>=5',
+          'requests_kerberos>=0.8.0',
+          'futures; python_version < "3"'
       ])
 
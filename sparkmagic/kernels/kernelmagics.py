@@ -6,6 +6,7 @@ Provides the %spark magic."""
 
 from __future__ import print_function
 import json
+from time import sleep
 from IPython.core.magic import magics_class
 from IPython.core.magic import needs_local_scope, cell_magic, line_magic
 from IPython.core.magic_arguments import argument, magic_arguments
@@ -21,7 +22,7 @@ from sparkmagic.livyclientlib.command import Command
 from sparkmagic.livyclientlib.endpoint import Endpoint
 from sparkmagic.magics.sparkmagicsbase import SparkMagicBase
 from sparkmagic.livyclientlib.exceptions import handle_expected_exceptions, wrap_unexpected_exceptions, \
-    BadUserDataException
+    BadUserDataException, HttpClientStatusException
 
 
 def _event(f):
@@ -96,6 +97,12 @@ class KernelMagics(SparkMagicBase):
     <td>%%logs</td>
     <td>Outputs the current session's Livy logs.</td>
   </tr>
+  <tr>
+    <td>timing</td>
+    <td>%%timing</td>
+    <td>Shows where the time of the last statement went: waiting for the session, posting and polling it, running
+    it on Spark and turning its result into a dataframe.</td>
+  </tr>
   <tr>
     <td>configure</td>
     <td>%%configure -f<br/>{"executorMemory": "1000M", "executorCores": 4}</td>
@@ -165,18 +172,58 @@ class KernelMagics(SparkMagicBase):
 
     @magic_arguments()
     @cell_magic
+    @argument("-t", "--tail", type=int, default=None, help="If present, only the last TAIL lines of the logs are shown.")
+    @argument("-f", "--follow", type=bool, default=False, nargs="?", const=True,
+              help="If present, lines are shown as they are logged until the cell is interrupted or the session ends.")
     @wrap_unexpected_exceptions
     @handle_expected_exceptions
     @_event
     def logs(self, line, cell="", local_ns=None):
-        parse_argstring_or_throw(self.logs, line)
+        args = parse_argstring_or_throw(self.logs, line)
         self._assure_cell_body_is_empty(KernelMagics.logs.__name__, cell)
         if self.session_started:
-            out = self.spark_controller.get_logs()
+            if args.tail is None:
+                out = self.spark_controller.get_logs()
+            else:
+                out = self.spark_controller.get_logs(tail=args.tail)
             self.ipython_display.write(out)
+            if args.follow:
+                self._follow_logs()
         else:
             self.ipython_display.write(u"No logs yet.")
 
+    @magic_arguments()
+    @cell_magic
+    @wrap_unexpected_exceptions
+    @handle_expected_exceptions
+    @_event
+    def timing(self, line, cell="", local_ns=None):
+        parse_argstring_or_throw(self.timing, line)
+        self._assure_cell_body_is_empty(KernelMagics.timing.__name__, cell)
+        timing = self.spark_controller.last_statement_timing
+        if timing is None:
+            self.ipython_display.write(u"No statement has run yet.")
+        else:
+            self.ipython_display.html(timing.to_html())
+
+    def _follow_logs(self):
+        # The session %%logs printed the log of, so that the lines followed continue it.
+        session = self.spark_controller.get_session_by_name_or_default(None)
+        try:
+            while session.status not in constants.FINAL_STATUS:
+                sleep(conf.logs_follow_interval_seconds())
+                new_lines = session.get_new_logs()
+                if new_lines:
+                    self.ipython_display.write(u"\n" + u"\n".join(new_lines))
+                # Without heartbeats nothing else updates the status.
+                session.refresh_status_and_info()
+        except HttpClientStatusException as e:
+            # The session was deleted.
+            if e.status_code != 404:
+                raise
+        except KeyboardInterrupt:
+            pass
+
     @magic_arguments()
     @cell_magic
     @argument("-f", "--force", type=bool, default=False, nargs="?", const=True, help="If present, user understands.")
@@ -306,6 +353,9 @@ class KernelMagics(SparkMagicBase):
         # No need to add the handle_expected_exceptions decorator to this since we manually catch all
         # exceptions when starting the session.
 
+        if not self._await_session_bootstrap():
+            return False
+
         if self.fatal_error:
             self.ipython_display.send_error(self.fatal_error_message)
             return False
@@ -330,6 +380,15 @@ class KernelMagics(SparkMagicBase):
     @handle_expected_exceptions
     def _do_not_call_delete_session(self, line, cell="", local_ns=None):
         try:
+            # Deleting the session does not stop a bootstrap that is already creating one, so wait for it and
+            # delete what it created.
+            bootstrap_session_name = self.cancel_livy_session_bootstrap()
+        except Exception as e:
+            bootstrap_session_name = None
+            self.logger.error(u"Error initializing livy session: {}".format(e))
+        try:
+            if bootstrap_session_name is not None:
+                self.spark_controller.delete_session_by_name(bootstrap_session_name)
             if self.session_started:
                 self.spark_controller.delete_session_by_name(self.session_name)
         except:
@@ -366,7 +425,24 @@ class KernelMagics(SparkMagicBase):
             self.ipython_display.send_error(u"'{}' language not supported in kernel magics.".format(language))
             return
         # init livy session
-        self.init_livy_session(language)
+        if conf.init_livy_session_in_background():
+            # Let the kernel report it is ready right away; the first cell that needs the session waits for it.
+            self.start_livy_session_bootstrap(language)
+        else:
+            self.init_livy_session(language)
+
+    def _await_session_bootstrap(self):
+        # Waits for the session created in the background at kernel start, if any. Returns False, and records a
+        # fatal error as a failed synchronous init would have, if creating it failed.
+        try:
+            self.await_livy_session_bootstrap()
+        except Exception as e:
+            self.fatal_error = True
+            self.fatal_error_message = conf.fatal_error_suggestion().format(e)
+            self.logger.error(u"Error initializing livy session: {}".format(e))
+            self.ipython_display.send_error(self.fatal_error_message)
+            return False
+        return True
 
     @magic_arguments()
     @line_magic
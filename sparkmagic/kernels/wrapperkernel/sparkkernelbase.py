@@ -2,18 +2,24 @@
 # Copyright (c) 2015  aggftw@gmail.com
 # Distributed under the terms of the Modified BSD License.
 from threading import Thread
+import asyncio
+import inspect
+import signal
+import traceback
 import requests
 import getpass
 import re
+import ipykernel
 from ipykernel.ipkernel import IPythonKernel
 from hdijupyterutils.ipythondisplay import IpythonDisplay
 from sparkmagic.livyclientlib.sparkcontroller import SparkController
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils.sparklogger import SparkLog
-from sparkmagic.utils.constants import MAGICS_LOGGER_NAME
-from sparkmagic.livyclientlib.exceptions import wrap_unexpected_exceptions
+from sparkmagic.utils.constants import MAGICS_LOGGER_NAME, EXPECTED_ERROR_MSG, INTERNAL_ERROR_MSG
+from sparkmagic.livyclientlib.exceptions import wrap_unexpected_exceptions, EXPECTED_EXCEPTIONS
 from sparkmagic.kernels.wrapperkernel.usercodeparser import UserCodeParser
 from tornado import gen
+from tornado.ioloop import IOLoop
 from ipykernel.jsonutil import json_clean
 from IPython.core.completer import provisionalcompleter
 from IPython.core.completer import position_to_cursor
@@ -87,10 +93,52 @@ class SparkKernelBase(IPythonKernel):
     def _do_execute(self, code, silent, store_history, user_expressions, allow_stdin):
         code_to_run = self.user_code_parser.get_code_to_run(code)
 
+        if self._runs_asynchronously(code, code_to_run):
+            future = gen.convert_yielded(self._execute_spark_cell_async(code))
+            self._cancel_on_interrupt(future)
+            return future
+
         res = self._execute_cell(code_to_run, silent, store_history, user_expressions, allow_stdin)
 
         return res
 
+    def _runs_asynchronously(self, code, code_to_run):
+        """Plain Spark cells are awaited instead of run through %%spark, so the kernel keeps serving
+        other requests while Livy works. Only kernels from ipykernel 5 on await do_execute."""
+        return conf.async_cell_execution() and ipykernel.version_info >= (5,) and \
+            code_to_run == u"%%spark\n{}".format(code)
+
+    async def _execute_spark_cell_async(self, code):
+        magics = self.shell.magics_manager.registry[u"RemoteSparkMagics"]
+        try:
+            session_name = await IOLoop.current().run_in_executor(None, magics.init_livy_session,
+                                                                  self.session_language)
+            await magics.execute_spark_async(code, session_name)
+        except asyncio.CancelledError:
+            self.ipython_display.send_error(u"The cell was interrupted while waiting for Livy.")
+        except tuple(EXPECTED_EXCEPTIONS) as err:
+            self.ipython_display.send_error(EXPECTED_ERROR_MSG.format(err))
+        except Exception as e:
+            self.logger.error(u"ENCOUNTERED AN INTERNAL ERROR: {}\n\tTraceback:\n{}".format(e, traceback.format_exc()))
+            self.ipython_display.send_error(INTERNAL_ERROR_MSG.format(e))
+
+        reply_content = self._complete_cell()
+        if inspect.isawaitable(reply_content):
+            reply_content = await reply_content
+        return reply_content
+
+    @staticmethod
+    def _cancel_on_interrupt(future):
+        """An interrupt arrives as SIGINT on the kernel's main thread; while a cell is awaited it should cancel
+        that cell rather than raise into the event loop."""
+        loop = IOLoop.current()
+
+        def handle_sigint(*args):
+            loop.add_callback(future.cancel)
+
+        previous_handler = signal.signal(signal.SIGINT, handle_sigint)
+        future.add_done_callback(lambda _: signal.signal(signal.SIGINT, previous_handler))
+
     def _load_magics_extension(self):
         register_magics_code = "%load_ext sparkmagic.kernels"
         self._execute_cell(register_magics_code, True, False, shutdown_if_error=True,
@@ -124,11 +172,10 @@ class SparkKernelBase(IPythonKernel):
         self.logger.debug("Init livy session.")
 
     def _register_auto_viz(self):
-        from sparkmagic.utils.sparkevents import get_spark_events_handler
+        from sparkmagic.utils.sparkevents import get_events_bus
         import autovizwidget.utils.configuration as c
 
-        handler = get_spark_events_handler()
-        c.override("events_handler", handler)
+        c.override("events_handler", get_events_bus())
 
         register_auto_viz_code = """from autovizwidget.widget.utils import display_dataframe
 ip = get_ipython()
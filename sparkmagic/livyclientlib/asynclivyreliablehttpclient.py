@@ -0,0 +1,58 @@
+# Distributed under the terms of the Modified BSD License.
+import sparkmagic.utils.configuration as conf
+from sparkmagic.utils.constants import HTTP_OPERATION_SESSION_CREATE, HTTP_OPERATION_STATEMENT_POST, \
+    HTTP_OPERATION_POLL, HTTP_OPERATION_LIST, HTTP_OPERATION_LOGS
+from .asyncreliablehttpclient import AsyncReliableHttpClient
+from .livyreliablehttpclient import LivyReliableHttpClient
+
+
+class AsyncLivyReliableHttpClient(LivyReliableHttpClient):
+    """LivyReliableHttpClient whose requests are coroutines, to be awaited on the kernel's event loop. Wraps an
+    AsyncReliableHttpClient and propagates HttpClientExceptions up."""
+
+    @staticmethod
+    def from_endpoint(endpoint):
+        headers = {"Content-Type": "application/json" }
+        headers.update(conf.custom_headers())
+        retry_policy = LivyReliableHttpClient._get_retry_policy()
+        return AsyncLivyReliableHttpClient(AsyncReliableHttpClient(endpoint, headers, retry_policy), endpoint)
+
+    async def post_statement(self, session_id, data):
+        return (await self._http_client.post(self._statements_url(session_id), [201], data,
+                                             HTTP_OPERATION_STATEMENT_POST)).json()
+
+    async def get_statement(self, session_id, statement_id):
+        return (await self._http_client.get(self._statement_url(session_id, statement_id), [200],
+                                            HTTP_OPERATION_POLL)).json()
+
+    async def get_sessions(self):
+        return (await self._http_client.get("/sessions", [200], HTTP_OPERATION_LIST)).json()
+
+    async def post_session(self, properties):
+        return (await self._http_client.post("/sessions", [201], properties, HTTP_OPERATION_SESSION_CREATE)).json()
+
+    async def get_session(self, session_id):
+        return (await self._http_client.get(self._session_url(session_id), [200], HTTP_OPERATION_POLL)).json()
+
+    async def get_session_state(self, session_id):
+        return (await self._http_client.get(self._session_url(session_id) + "/state", [200],
+                                            HTTP_OPERATION_POLL)).json()
+
+    async def delete_session(self, session_id):
+        await self._http_client.delete(self._session_url(session_id), [200, 404])
+
+    async def get_all_session_logs(self, session_id):
+        return (await self._http_client.get(self._session_url(session_id) + "/log?from=0", [200],
+                                            HTTP_OPERATION_LOGS)).json()
+
+    async def get_session_logs(self, session_id, from_line, size):
+        return (await self._http_client.get(self._session_url(session_id) + "/log?from={}&size={}"
+                                            .format(from_line, size), [200], HTTP_OPERATION_LOGS)).json()
+
+    async def post_completion(self, session_id, kind, code, cursor):
+        data = {
+            "code": code,
+            "cursor": cursor,
+            "kind": kind
+        }
+        return (await self._http_client.post(self._completion_url(session_id), [200], data)).json()
@@ -0,0 +1,132 @@
+# Distributed under the terms of the Modified BSD License.
+import json
+from time import time
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+import sparkmagic.utils.configuration as conf
+import sparkmagic.utils.constants as constants
+from sparkmagic.utils.sparklogger import SparkLog
+from sparkmagic.utils.metrics import get_metrics, HTTP_RETRIES
+from sparkmagic.livyclientlib.exceptions import HttpClientException, HttpClientStatusException
+from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
+from .reliablehttpclient import ReliableHttpClient, check_circuit, record_attempt, can_retry
+
+
+class AsyncResponse(object):
+    """Response of an AsyncReliableHttpClient request, with the part of the requests.Response interface the Livy
+    client uses."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncReliableHttpClient(object):
+    """Asynchronous counterpart of ReliableHttpClient, built on tornado's AsyncHTTPClient so that it can be awaited
+    on the kernel's event loop. Retries wait with gen.sleep instead of blocking the loop. Shares the circuit breaker
+    and retry budget of the endpoint with ReliableHttpClient, and bounds requests with the same timeouts and
+    deadlines. Tornado's request timeout covers the whole response rather than each read.
+
+    Tornado does not speak SPNEGO, so for Kerberos endpoints each request is sent by a ReliableHttpClient on the
+    event loop's executor instead."""
+
+    def __init__(self, endpoint, headers, retry_policy):
+        self._endpoint = endpoint
+        self._headers = headers
+        self._retry_policy = retry_policy
+        self._sync_client = None
+        if self._endpoint.auth == constants.AUTH_KERBEROS:
+            self._sync_client = ReliableHttpClient(endpoint, headers, retry_policy)
+        elif self._endpoint.auth not in (constants.AUTH_BASIC, constants.NO_AUTH):
+            raise BadUserConfigurationException(u"Unsupported auth %s" %self._endpoint.auth)
+
+        self.logger = SparkLog(u"AsyncReliableHttpClient")
+        self.verify_ssl = not conf.ignore_ssl_errors()
+
+    def get_headers(self):
+        return self._headers
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+
+    def compose_url(self, relative_url):
+        r_u = "/{}".format(relative_url.rstrip(u"/").lstrip(u"/"))
+        return self._endpoint.url + r_u
+
+    async def get(self, relative_url, accepted_status_codes, operation=constants.HTTP_OPERATION_DEFAULT):
+        """Sends a get request. Returns a response."""
+        return await self._send_request(relative_url, accepted_status_codes, u"GET", operation=operation)
+
+    async def post(self, relative_url, accepted_status_codes, data, operation=constants.HTTP_OPERATION_DEFAULT):
+        """Sends a post request. Returns a response."""
+        return await self._send_request(relative_url, accepted_status_codes, u"POST", data, operation)
+
+    async def delete(self, relative_url, accepted_status_codes, operation=constants.HTTP_OPERATION_DEFAULT):
+        """Sends a delete request. Returns a response."""
+        return await self._send_request(relative_url, accepted_status_codes, u"DELETE", operation=operation)
+
+    async def _send_request(self, relative_url, accepted_status_codes, method, data=None,
+                            operation=constants.HTTP_OPERATION_DEFAULT):
+        if self._sync_client is not None:
+            function = {u"GET": self._sync_client.get, u"POST": self._sync_client.post,
+                        u"DELETE": self._sync_client.delete}[method]
+            args = (relative_url, accepted_status_codes) if data is None else \
+                (relative_url, accepted_status_codes, data)
+            return await IOLoop.current().run_in_executor(None, lambda: function(*args, operation=operation))
+        return await self._send_request_helper(self.compose_url(relative_url), accepted_status_codes, method, data, 0,
+                                               operation)
+
+    async def _send_request_helper(self, url, accepted_status_codes, method, data, retry_count,
+                                   operation=constants.HTTP_OPERATION_DEFAULT):
+        (connect_seconds, read_seconds, deadline_seconds) = conf.get_http_timeouts(operation)
+        deadline = time() + deadline_seconds
+        while True:
+            check_circuit(self._endpoint, url)
+            seconds_left = max(deadline - time(), 0.001)
+            request = self._request(url, method, data, min(connect_seconds, seconds_left),
+                                    min(read_seconds, seconds_left))
+            response = await AsyncHTTPClient().fetch(request, raise_error=False)
+            # Tornado reports connection errors and timeouts as responses with code 599.
+            if response.code == 599:
+                error = True
+                status = None
+                text = None
+
+                self.logger.error(u"Request to '{}' failed with '{}'".format(url, response.error))
+            else:
+                error = False
+                status = response.code
+                text = response.body.decode(u"utf-8") if response.body is not None else u""
+            record_attempt(self._endpoint, status, error)
+
+            if error or status not in accepted_status_codes:
+                if self._retry_policy.should_retry(status, error, retry_count):
+                    seconds_to_sleep = self._retry_policy.seconds_to_sleep(retry_count)
+                    if can_retry(self._endpoint, deadline, seconds_to_sleep):
+                        get_metrics().increment(HTTP_RETRIES, status=u"error" if error else u"{}".format(status))
+                        await gen.sleep(seconds_to_sleep)
+                        retry_count += 1
+                        continue
+
+                if error:
+                    raise HttpClientException(u"Error sending http request and maximum retry encountered.")
+                else:
+                    raise HttpClientStatusException(u"Invalid status code '{}' from {} with error payload: {}"
+                                                    .format(status, url, text), status)
+            return AsyncResponse(status, text)
+
+    def _request(self, url, method, data, connect_timeout, request_timeout):
+        kwargs = {}
+        if self._endpoint.auth == constants.AUTH_BASIC:
+            kwargs = {u"auth_username": self._endpoint.username, u"auth_password": self._endpoint.password,
+                      u"auth_mode": u"basic"}
+        body = json.dumps(data) if data is not None else None
+        return HTTPRequest(url, method=method, headers=self._headers, body=body, validate_cert=self.verify_ssl,
+                           connect_timeout=connect_timeout, request_timeout=request_timeout, **kwargs)
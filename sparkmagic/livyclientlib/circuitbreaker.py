@@ -0,0 +1,64 @@
+# Distributed under the terms of the Modified BSD License.
+import threading
+from time import time
+
+from .exceptions import CircuitOpenException
+
+
+class CircuitBreaker(object):
+    """Stops requests to an endpoint that keeps failing. After failure_threshold consecutive failures, the circuit
+    opens and requests fail fast with a CircuitOpenException. Once reset_seconds have passed, it is half-open: one
+    request is let through as a probe, closing the circuit if it succeeds and opening it again if it fails. Another
+    probe is let through if the previous one has not reported back in reset_seconds.
+
+    A failure_threshold of 0 or less disables the breaker."""
+
+    CLOSED = u"closed"
+    OPEN = u"open"
+    HALF_OPEN = u"half_open"
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self.rejected_count = 0
+        self._clock = clock
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self, url):
+        """Raises a CircuitOpenException if the request to url must not be sent."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = self._clock()
+            if now - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return
+            self.rejected_count += 1
+        raise CircuitOpenException(u"Not sending request to '{}': the last {} requests to its server failed. "
+                                   u"Will try again in {:.0f} seconds."
+                                   .format(url, self.consecutive_failures,
+                                           self.reset_seconds - (now - self._opened_at)))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        """Records a failed request. Returns True if it opened the circuit."""
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or \
+                    (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+                self.open_count += 1
+                return True
+            return False
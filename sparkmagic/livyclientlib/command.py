@@ -1,12 +1,16 @@
 import textwrap
+from time import time
 
 from hdijupyterutils.guid import ObjectWithGuid
+from tornado import gen
 
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils.sparklogger import SparkLog
 from sparkmagic.utils.sparkevents import SparkEvents
+from sparkmagic.utils.metrics import get_metrics
 from sparkmagic.utils.constants import MAGICS_LOGGER_NAME, FINAL_STATEMENT_STATUS
-from .exceptions import LivyUnexpectedStatusException
+from .exceptions import LivyUnexpectedStatusException, HttpClientStatusException
+from .statementtiming import StatementTiming
 from sparkmagic.utils.constants import MIMETYPE_TEXT_HTML, MIMETYPE_TEXT_PLAIN, MIMETYPE_APPLICATION_JSON
 
 
@@ -25,15 +29,37 @@ class Command(ObjectWithGuid):
     def __ne__(self, other):
         return not self == other
 
-    def execute(self, session):
+    def execute(self, session, timing=None):
+        """Runs the command and returns (success, output). The time it took is recorded in timing, or in a new
+        StatementTiming that is emitted as an event; either way it becomes the session's last_statement_timing."""
+        owns_timing = timing is None
+        if owns_timing:
+            timing = StatementTiming()
+        session.last_statement_timing = timing
+        start_time = time()
+
         self._spark_events.emit_statement_execution_start_event(session.guid, session.kind, session.id, self.guid)
         statement_id = -1
         try:
-            session.wait_for_idle()
+            trust_cached_state = session.is_recently_idle()
+            if not trust_cached_state:
+                self._wait_for_idle(session, timing)
             data = {u"code": self.code}
-            response = session.http_client.post_statement(session.id, data)
+            try:
+                post_time = time()
+                response = session.http_client.post_statement(session.id, data)
+            except HttpClientStatusException:
+                if not trust_cached_state:
+                    raise
+                # Livy refused the statement, so the cached state was out of date. Refresh it and post once more.
+                # Timeouts and connection errors are not retried: Livy may have accepted the statement.
+                self._wait_for_idle(session, timing)
+                post_time = time()
+                response = session.http_client.post_statement(session.id, data)
+            timing.post_seconds = time() - post_time
             statement_id = response[u'id']
-            output = self._get_statement_output(session, statement_id)
+            output = self._get_statement_output(session, statement_id, timing)
+            self._finish_timing(session, timing, output, start_time, owns_timing)
         except Exception as e:
             self._spark_events.emit_statement_execution_end_event(session.guid, session.kind, session.id,
                                                                   self.guid, statement_id, False, e.__class__.__name__,
@@ -44,34 +70,187 @@ class Command(ObjectWithGuid):
                                                                   self.guid, statement_id, True, "", "")
             return output
 
-    def _get_statement_output(self, session, statement_id):
+    async def execute_async(self, session, timing=None):
+        """Same as execute, but awaits Livy on the event loop instead of blocking it, so that the kernel stays
+        responsive while the statement runs."""
+        owns_timing = timing is None
+        if owns_timing:
+            timing = StatementTiming()
+        session.last_statement_timing = timing
+        start_time = time()
+
+        self._spark_events.emit_statement_execution_start_event(session.guid, session.kind, session.id, self.guid)
+        statement_id = -1
+        try:
+            trust_cached_state = session.is_recently_idle()
+            if not trust_cached_state:
+                await self._wait_for_idle_async(session, timing)
+            data = {u"code": self.code}
+            try:
+                post_time = time()
+                response = await session.async_http_client.post_statement(session.id, data)
+            except HttpClientStatusException:
+                if not trust_cached_state:
+                    raise
+                # Livy refused the statement, so the cached state was out of date. Refresh it and post once more.
+                # Timeouts and connection errors are not retried: Livy may have accepted the statement.
+                await self._wait_for_idle_async(session, timing)
+                post_time = time()
+                response = await session.async_http_client.post_statement(session.id, data)
+            timing.post_seconds = time() - post_time
+            statement_id = response[u'id']
+            output = await self._get_statement_output_async(session, statement_id, timing)
+            self._finish_timing(session, timing, output, start_time, owns_timing)
+        except Exception as e:
+            self._spark_events.emit_statement_execution_end_event(session.guid, session.kind, session.id,
+                                                                  self.guid, statement_id, False, e.__class__.__name__,
+                                                                  str(e))
+            raise
+        else:
+            self._spark_events.emit_statement_execution_end_event(session.guid, session.kind, session.id,
+                                                                  self.guid, statement_id, True, "", "")
+            return output
+
+    def _finish_timing(self, session, timing, output, start_time, owns_timing):
+        timing.record_output(output[1])
+        timing.total_seconds = time() - start_time
+        if owns_timing:
+            self._spark_events.emit_statement_timing_event(session.guid, session.kind, session.id, self.guid,
+                                                           timing.to_dict())
+            get_metrics().record_statement_timing(session.kind, timing)
+
+    @staticmethod
+    def execute_pipelined(commands, session):
+        """Posts all the commands to the session back to back, letting Livy queue them, then collects their outputs
+        in order. Compared to executing them one by one, this saves the idle wait before each post and the round
+        trips in between. Livy runs every posted statement, even after one of them fails.
+
+        Returns the (success, output) of each command, as execute does. Each command's StatementTiming is emitted
+        as an event, and the last one becomes the session's last_statement_timing. The first command's timing
+        includes the idle wait; the others start when they are posted."""
+        if not commands:
+            return []
+
+        start_time = time()
+        first_timing = StatementTiming()
+        trust_cached_state = session.is_recently_idle()
+        if not trust_cached_state:
+            Command._wait_for_idle(session, first_timing)
+
+        # (command, statement id, timing, start time) of the commands posted so far, and outputs of those collected
+        # so far.
+        posted = []
+        outputs = []
+        try:
+            for command in commands:
+                command._spark_events.emit_statement_execution_start_event(session.guid, session.kind, session.id,
+                                                                           command.guid)
+                timing = first_timing if not posted else StatementTiming()
+                post_time = time()
+                posted.append([command, -1, timing, start_time if not posted else post_time])
+                try:
+                    response = session.http_client.post_statement(session.id, {u"code": command.code})
+                except HttpClientStatusException:
+                    if len(posted) > 1 or not trust_cached_state:
+                        raise
+                    # As in execute: the cached state was out of date, so refresh it and post the first one again.
+                    Command._wait_for_idle(session, timing)
+                    post_time = time()
+                    response = session.http_client.post_statement(session.id, {u"code": command.code})
+                timing.post_seconds = time() - post_time
+                posted[-1][1] = response[u'id']
+
+            for (command, statement_id, timing, command_start_time) in posted:
+                # Livy runs the statements in turn, so the session is only idle once the last one completed.
+                is_last = len(outputs) == len(posted) - 1
+                output = command._get_statement_output(session, statement_id, timing, marks_session_idle=is_last)
+                timing.record_output(output[1])
+                timing.total_seconds = time() - command_start_time
+                session.last_statement_timing = timing
+                command._spark_events.emit_statement_timing_event(session.guid, session.kind, session.id,
+                                                                  command.guid, timing.to_dict())
+                get_metrics().record_statement_timing(session.kind, timing)
+                command._spark_events.emit_statement_execution_end_event(session.guid, session.kind, session.id,
+                                                                         command.guid, statement_id, True, "", "")
+                outputs.append(output)
+        except Exception as e:
+            for (command, statement_id, _, _) in posted[len(outputs):]:
+                command._spark_events.emit_statement_execution_end_event(session.guid, session.kind, session.id,
+                                                                         command.guid, statement_id, False,
+                                                                         e.__class__.__name__, str(e))
+            raise
+        return outputs
+
+    @staticmethod
+    def _wait_for_idle(session, timing):
+        start_time = time()
+        session.wait_for_idle()
+        timing.wait_for_idle_seconds += time() - start_time
+
+    @staticmethod
+    async def _wait_for_idle_async(session, timing):
+        start_time = time()
+        await session.wait_for_idle_async()
+        timing.wait_for_idle_seconds += time() - start_time
+
+    def _get_statement_output(self, session, statement_id, timing=None, marks_session_idle=True):
         retries = 1
+        start_time = time()
 
         while True:
             statement = session.http_client.get_statement(session.id, statement_id)
-            status = statement[u"state"].lower()
+            if timing is not None:
+                timing.poll_count += 1
+            if self._is_statement_final(statement_id, statement):
+                if timing is not None:
+                    timing.record_statement(statement)
+                if marks_session_idle:
+                    session.record_statement_completed()
+                return self._statement_output(statement)
 
-            self.logger.debug(u"Status of statement {} is {}.".format(statement_id, status))
+            session.sleep_for_statement(retries, statement.get(u"progress"), time() - start_time)
+            retries += 1
 
-            if status not in FINAL_STATEMENT_STATUS:
-                session.sleep(retries)
-                retries += 1
+    async def _get_statement_output_async(self, session, statement_id, timing=None):
+        retries = 1
+        start_time = time()
+
+        while True:
+            statement = await session.async_http_client.get_statement(session.id, statement_id)
+            if timing is not None:
+                timing.poll_count += 1
+            if self._is_statement_final(statement_id, statement):
+                if timing is not None:
+                    timing.record_statement(statement)
+                session.record_statement_completed()
+                return self._statement_output(statement)
+
+            await gen.sleep(session.statement_seconds_to_sleep(retries, statement.get(u"progress"),
+                                                               time() - start_time))
+            retries += 1
+
+    def _is_statement_final(self, statement_id, statement):
+        status = statement[u"state"].lower()
+        self.logger.debug(u"Status of statement {} is {}.".format(statement_id, status))
+        return status in FINAL_STATEMENT_STATUS
+
+    @staticmethod
+    def _statement_output(statement):
+        statement_output = statement[u"output"]
+
+        if statement_output is None:
+            return (True, u"")
+
+        if statement_output[u"status"] == u"ok":
+            data = statement_output[u"data"]
+            if MIMETYPE_APPLICATION_JSON in data:
+                return (True, data[MIMETYPE_APPLICATION_JSON])
             else:
-                statement_output = statement[u"output"]
-
-                if statement_output is None:
-                    return (True, u"")
-
-                if statement_output[u"status"] == u"ok":
-                    data = statement_output[u"data"]
-                    if MIMETYPE_APPLICATION_JSON in data:
-                        return (True, data[MIMETYPE_APPLICATION_JSON])
-                    else:
-                        return (True, data[MIMETYPE_TEXT_PLAIN])
-
-                elif statement_output[u"status"] == u"error":
-                    return (False,
-                           statement_output[u"evalue"] + u"\n" + u"".join(statement_output[u"traceback"]))
-                else:
-                    raise LivyUnexpectedStatusException(u"Unknown output status from Livy: '{}'"
-                                                        .format(statement_output[u"status"]))
+                return (True, data[MIMETYPE_TEXT_PLAIN])
+
+        elif statement_output[u"status"] == u"error":
+            return (False,
+                   statement_output[u"evalue"] + u"\n" + u"".join(statement_output[u"traceback"]))
+        else:
+            raise LivyUnexpectedStatusException(u"Unknown output status from Livy: '{}'"
+                                                .format(statement_output[u"status"]))
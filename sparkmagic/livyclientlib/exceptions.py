@@ -19,6 +19,18 @@ class HttpClientException(LivyClientLibException):
     """An exception thrown by the HTTP client when it fails to make a request."""
 
 
+class HttpClientStatusException(HttpClientException):
+    """An exception thrown by the HTTP client when the server answers a request with an unexpected status code."""
+
+    def __init__(self, message, status_code):
+        super(HttpClientStatusException, self).__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenException(HttpClientException):
+    """An exception thrown by the HTTP client when it does not send a request because the server keeps failing."""
+
+
 class LivyClientTimeoutException(LivyClientLibException):
     """An exception for timeouts while interacting with Livy."""
 
@@ -0,0 +1,20 @@
+# Distributed under the terms of the Modified BSD License.
+import random
+
+from .linearretrypolicy import LinearRetryPolicy
+
+
+class ExponentialRetryPolicy(LinearRetryPolicy):
+    """Retry policy that sleeps a random number of seconds between zero and a cap that doubles with every retry,
+    from initial_seconds up to max_seconds, takes all status codes 500 or above to be retriable, and retries a given
+    maximum number of times. The jitter keeps kernels that failed together from retrying together."""
+
+    def __init__(self, initial_seconds, max_seconds, max_retries, random_uniform=random.uniform):
+        super(ExponentialRetryPolicy, self).__init__(-1, max_retries)
+        self.initial_seconds = initial_seconds
+        self.max_seconds = max_seconds
+        self._random_uniform = random_uniform
+
+    def seconds_to_sleep(self, retry_count):
+        cap = min(self.max_seconds, self.initial_seconds * 2 ** min(retry_count, 32))
+        return self._random_uniform(0, cap)
@@ -0,0 +1,158 @@
+# Distributed under the terms of the Modified BSD License.
+import threading
+from time import sleep, time
+
+import sparkmagic.utils.configuration as conf
+import sparkmagic.utils.constants as constants
+from sparkmagic.utils.sparklogger import SparkLog
+from sparkmagic.utils.metrics import get_metrics, ACTIVE_HEARTBEATS
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_heartbeat_scheduler():
+    """Returns the process' HeartbeatScheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = HeartbeatScheduler(conf.heartbeat_refresh_seconds(), conf.heartbeat_retry_seconds())
+        return _scheduler
+
+
+class ScheduledHeartbeat(object):
+    """Heartbeat of one session through the process' HeartbeatScheduler, with the start/stop interface of a
+    heartbeat thread."""
+
+    def __init__(self, livy_session, scheduler=None):
+        if scheduler is None:
+            scheduler = get_heartbeat_scheduler()
+        self.livy_session = livy_session
+        self.daemon = True
+        self._scheduler = scheduler
+
+    def start(self):
+        self._scheduler.register(self.livy_session)
+
+    def stop(self):
+        self._scheduler.unregister(self.livy_session)
+
+
+class HeartbeatScheduler(object):
+    """Heartbeats the registered LivySessions from a single daemon thread, however many sessions there are.
+
+    Every refresh_seconds, the state of all the sessions of an endpoint is read with one GET /sessions. Livy only
+    records a heartbeat when a request names the session, so each session is also touched with the small
+    GET /sessions/{id}/state, but only as often as its heartbeat timeout needs: every third of the timeout, or every
+    refresh_seconds if that is longer. After a failure, the endpoint is tried again after retry_seconds."""
+
+    def __init__(self, refresh_seconds, retry_seconds, clock=time):
+        self.logger = SparkLog(u"HeartbeatScheduler")
+        self._refresh_seconds = refresh_seconds
+        self._retry_seconds = retry_seconds
+        self._clock = clock
+        # endpoint -> {id(session): session}
+        self._sessions = {}
+        self._next_heartbeat_at = {}
+        # id(session) -> time the session was last touched
+        self._touched_at = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, session):
+        now = self._clock()
+        with self._lock:
+            endpoint = session.endpoint
+            if endpoint not in self._sessions:
+                self._sessions[endpoint] = {}
+                self._next_heartbeat_at[endpoint] = now + self._refresh_seconds
+            self._sessions[endpoint][id(session)] = session
+            self._touched_at[id(session)] = now
+        heartbeat_count = self.heartbeat_count()
+        get_metrics().set(ACTIVE_HEARTBEATS, heartbeat_count)
+        self.logger.info(u'Starting heartbeat for session {}; {} sessions heartbeated'
+                         .format(session.id, heartbeat_count))
+        self._start_thread()
+
+    def unregister(self, session):
+        with self._lock:
+            endpoint = session.endpoint
+            sessions = self._sessions.get(endpoint, {})
+            if sessions.pop(id(session), None) is None:
+                return
+            self._touched_at.pop(id(session), None)
+            if not sessions:
+                del self._sessions[endpoint]
+                del self._next_heartbeat_at[endpoint]
+        heartbeat_count = self.heartbeat_count()
+        get_metrics().set(ACTIVE_HEARTBEATS, heartbeat_count)
+        self.logger.info(u'Stopping heartbeat for session {}; {} sessions heartbeated'
+                         .format(session.id, heartbeat_count))
+
+    def heartbeat_count(self):
+        """Number of sessions being heartbeated."""
+        with self._lock:
+            return sum(len(sessions) for sessions in self._sessions.values())
+
+    def run_due_heartbeats(self):
+        """Heartbeats the endpoints that are due and returns the number of seconds until the next one is."""
+        now = self._clock()
+        with self._lock:
+            due = [(endpoint, list(sessions.values())) for (endpoint, sessions) in self._sessions.items()
+                   if self._next_heartbeat_at[endpoint] <= now]
+
+        for (endpoint, sessions) in due:
+            try:
+                self._heartbeat(sessions, now)
+                next_heartbeat_at = now + self._refresh_seconds
+            except Exception as e:
+                self.logger.error(u'Heartbeat for {} failed: {}'.format(endpoint.url, e))
+                next_heartbeat_at = now + self._retry_seconds
+            with self._lock:
+                if endpoint in self._next_heartbeat_at:
+                    self._next_heartbeat_at[endpoint] = next_heartbeat_at
+
+        with self._lock:
+            if not self._next_heartbeat_at:
+                return self._refresh_seconds
+            return max(min(self._next_heartbeat_at.values()) - self._clock(), 0)
+
+    def _heartbeat(self, sessions, now):
+        http_client = sessions[0].http_client
+        listed_sessions = dict((s[u"id"], s) for s in http_client.get_sessions()[u"sessions"])
+
+        for session in sessions:
+            # One session failing, e.g. Livy forgetting it, must not keep the others from being heartbeated.
+            try:
+                self._heartbeat_session(http_client, session, listed_sessions.get(session.id), now)
+            except Exception as e:
+                self.logger.error(u'Heartbeat for session {} failed: {}'.format(session.id, e))
+
+    def _heartbeat_session(self, http_client, session, listed_session, now):
+        if listed_session is not None:
+            session.update_status_and_info(listed_session)
+
+        with self._lock:
+            touched_at = self._touched_at.get(id(session))
+        if touched_at is not None and now - touched_at >= self._touch_interval(session):
+            http_client.get_session_state(session.id)
+            with self._lock:
+                if id(session) in self._touched_at:
+                    self._touched_at[id(session)] = now
+
+    def _touch_interval(self, session):
+        heartbeat_timeout = session.properties.get(constants.LIVY_HEARTBEAT_TIMEOUT_PARAM, 0)
+        return max(self._refresh_seconds, heartbeat_timeout / 3.0)
+
+    def _start_thread(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            sleep(self.run_due_heartbeats())
@@ -0,0 +1,62 @@
+# Distributed under the terms of the Modified BSD License.
+import threading
+from time import time
+
+import sparkmagic.utils.configuration as conf
+from sparkmagic.utils.sparklogger import SparkLog
+from .livyreliablehttpclient import LivyReliableHttpClient
+
+
+class LivyClientRegistry(object):
+    """Keeps one LivyReliableHttpClient per Endpoint so that the headers, retry policy, auth object and pooled
+    connections built for an endpoint are reused by every magic. Clients that have been neither requested nor used
+    to send a request for http_client_idle_ttl_seconds are closed the next time the registry is used. Sessions and
+    the heartbeat keep the client they were given, so a client is only idle once they stopped sending requests."""
+
+    def __init__(self, idle_ttl_seconds=None, clock=time):
+        if idle_ttl_seconds is None:
+            idle_ttl_seconds = conf.http_client_idle_ttl_seconds()
+
+        self.logger = SparkLog(u"LivyClientRegistry")
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._clock = clock
+        self._clients = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, endpoint):
+        self.close_idle_clients()
+
+        with self._lock:
+            client = self._clients.get(endpoint)
+            if client is None:
+                client = self._create_client(endpoint)
+                self._clients[endpoint] = client
+            self._last_used[endpoint] = self._clock()
+            return client
+
+    def close_idle_clients(self):
+        now = self._clock()
+        with self._lock:
+            idle_endpoints = [endpoint for (endpoint, last_used) in self._last_used.items()
+                              if now - max(last_used, self._clients[endpoint].last_used_at) > self._idle_ttl_seconds]
+            idle_clients = [self._pop(endpoint) for endpoint in idle_endpoints]
+
+        for client in idle_clients:
+            self.logger.debug(u"Closing idle http client for {}".format(client.endpoint))
+            client.close()
+
+    def close_all(self):
+        with self._lock:
+            clients = [self._pop(endpoint) for endpoint in list(self._clients.keys())]
+
+        for client in clients:
+            client.close()
+
+    def _pop(self, endpoint):
+        del self._last_used[endpoint]
+        return self._clients.pop(endpoint)
+
+    @staticmethod
+    def _create_client(endpoint):
+        return LivyReliableHttpClient.from_endpoint(endpoint)
@@ -3,8 +3,11 @@
 
 from .linearretrypolicy import LinearRetryPolicy
 from .configurableretrypolicy import ConfigurableRetryPolicy
+from .exponentialretrypolicy import ExponentialRetryPolicy
 from .reliablehttpclient import ReliableHttpClient
-from sparkmagic.utils.constants import LINEAR_RETRY, CONFIGURABLE_RETRY
+from sparkmagic.utils.constants import LINEAR_RETRY, CONFIGURABLE_RETRY, EXPONENTIAL_RETRY, \
+    HTTP_OPERATION_SESSION_CREATE, HTTP_OPERATION_STATEMENT_POST, HTTP_OPERATION_POLL, HTTP_OPERATION_LIST, \
+    HTTP_OPERATION_LOGS
 import sparkmagic.utils.configuration as conf
 from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
 
@@ -24,25 +27,33 @@ class LivyReliableHttpClient(object):
         return LivyReliableHttpClient(ReliableHttpClient(endpoint, headers, retry_policy), endpoint)
 
     def post_statement(self, session_id, data):
-        return self._http_client.post(self._statements_url(session_id), [201], data).json()
+        return self._http_client.post(self._statements_url(session_id), [201], data,
+                                      HTTP_OPERATION_STATEMENT_POST).json()
 
     def get_statement(self, session_id, statement_id):
-        return self._http_client.get(self._statement_url(session_id, statement_id), [200]).json()
+        return self._http_client.get(self._statement_url(session_id, statement_id), [200], HTTP_OPERATION_POLL).json()
 
     def get_sessions(self):
-        return self._http_client.get("/sessions", [200]).json()
+        return self._http_client.get("/sessions", [200], HTTP_OPERATION_LIST).json()
 
     def post_session(self, properties):
-        return self._http_client.post("/sessions", [201], properties).json()
+        return self._http_client.post("/sessions", [201], properties, HTTP_OPERATION_SESSION_CREATE).json()
 
     def get_session(self, session_id):
-        return self._http_client.get(self._session_url(session_id), [200]).json()
+        return self._http_client.get(self._session_url(session_id), [200], HTTP_OPERATION_POLL).json()
+
+    def get_session_state(self, session_id):
+        return self._http_client.get(self._session_url(session_id) + "/state", [200], HTTP_OPERATION_POLL).json()
 
     def delete_session(self, session_id):
         self._http_client.delete(self._session_url(session_id), [200, 404])
 
     def get_all_session_logs(self, session_id):
-        return self._http_client.get(self._session_url(session_id) + "/log?from=0", [200]).json()
+        return self._http_client.get(self._session_url(session_id) + "/log?from=0", [200], HTTP_OPERATION_LOGS).json()
+
+    def get_session_logs(self, session_id, from_line, size):
+        return self._http_client.get(self._session_url(session_id) + "/log?from={}&size={}".format(from_line, size),
+                                     [200], HTTP_OPERATION_LOGS).json()
 
     def post_completion(self, session_id, kind, code, cursor):
         data = {
@@ -55,6 +66,13 @@ class LivyReliableHttpClient(object):
     def get_headers(self):
         return self._http_client.get_headers()
 
+    @property
+    def last_used_at(self):
+        return self._http_client.last_used_at
+
+    def close(self):
+        self._http_client.close()
+
     @staticmethod
     def _session_url(session_id):
         return "/sessions/{}".format(session_id)
@@ -78,5 +96,9 @@ class LivyReliableHttpClient(object):
             return LinearRetryPolicy(seconds_to_sleep=5, max_retries=5)
         elif policy == CONFIGURABLE_RETRY:
             return ConfigurableRetryPolicy(retry_seconds_to_sleep_list=conf.retry_seconds_to_sleep_list(), max_retries=conf.configurable_retry_policy_max_retries())
+        elif policy == EXPONENTIAL_RETRY:
+            return ExponentialRetryPolicy(initial_seconds=conf.exponential_retry_initial_seconds(),
+                                          max_seconds=conf.exponential_retry_max_seconds(),
+                                          max_retries=conf.exponential_retry_policy_max_retries())
         else:
             raise BadUserConfigurationException(u"Retry policy '{}' not supported".format(policy))
@@ -4,19 +4,26 @@ import threading
 import os
 import json
 import getpass
+from collections import deque
 from time import sleep, time
 
 from hdijupyterutils.guid import ObjectWithGuid
+from tornado import gen
 
 import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
 from sparkmagic.utils.sparklogger import SparkLog
 from sparkmagic.utils.sparkevents import SparkEvents
+from sparkmagic.utils.metrics import get_metrics, SESSION_START_DURATION
 from sparkmagic.utils.utils import get_sessions_info_html
 from .configurableretrypolicy import ConfigurableRetryPolicy
+from .statementwaitpolicy import FixedStatementWaitPolicy, AdaptiveStatementWaitPolicy
 from .command import Command
+from .sessioninitscript import SessionInitScript
+from .heartbeatscheduler import ScheduledHeartbeat
+from .asynclivyreliablehttpclient import AsyncLivyReliableHttpClient
 from .exceptions import LivyClientTimeoutException, \
-    LivyUnexpectedStatusException, BadUserDataException, SqlContextNotFoundException
+    LivyUnexpectedStatusException, BadUserDataException, SqlContextNotFoundException, BadUserConfigurationException
 
 
 class _HeartbeatThread(threading.Thread):
@@ -60,7 +67,7 @@ class _HeartbeatThread(threading.Thread):
 class LivySession(ObjectWithGuid):
     def __init__(self, http_client, properties, ipython_display,
                  session_id=-1, spark_events=None,
-                 heartbeat_timeout=0, heartbeat_thread=None):
+                 heartbeat_timeout=0, heartbeat_thread=None, statement_wait_policy=None):
         super(LivySession, self).__init__()
         assert constants.LIVY_KIND_PARAM in list(properties.keys())
         kind = properties[constants.LIVY_KIND_PARAM]
@@ -89,6 +96,9 @@ class LivySession(ObjectWithGuid):
         self._spark_events = spark_events
 
         self._policy = ConfigurableRetryPolicy(retry_seconds_to_sleep_list=[0.2, 0.5, 0.5, 1, 1, 2], max_retries=5000)
+        if statement_wait_policy is None:
+            statement_wait_policy = self._get_statement_wait_policy()
+        self._statement_wait_policy = statement_wait_policy
         wait_for_idle_timeout_seconds = conf.wait_for_idle_timeout_seconds()
 
         assert wait_for_idle_timeout_seconds > 0
@@ -100,22 +110,33 @@ class LivySession(ObjectWithGuid):
             raise BadUserDataException(u"Session of kind '{}' not supported. Session must be of kinds {}."
                                        .format(kind, ", ".join(constants.SESSION_KINDS_SUPPORTED)))
 
-        self._app_id = None
-        self._logs = u""
+        # appId and appInfo of the session, kept from the responses that describe it.
+        self._metadata = None
+        # Lines of the session log read so far, the oldest dropped past session_log_buffer_lines, and the offset of
+        # the next line to read.
+        self._log_lines = deque(maxlen=conf.session_log_buffer_lines())
+        self._log_cursor = 0
+        self._log_lock = threading.Lock()
         self._http_client = http_client
+        self._async_http_client = None
         self._wait_for_idle_timeout_seconds = wait_for_idle_timeout_seconds
         self._printed_resource_warning = False
 
         self.kind = kind
         self.id = session_id
-        self.session_info = u""
+        self._recent_log = []
+        # Database the session was switched to when it started, if any.
+        self.current_database = None
+        # StatementTiming of the last statement run on the session.
+        self.last_statement_timing = None
 
         self._heartbeat_thread = None
+        self._status_refreshed_at = None
+        # Sessions created for an existing session id only heartbeat once they are adopted with already_start.
         if session_id == -1:
             self.status = constants.NOT_STARTED_SESSION_STATUS
         else:
             self.status = constants.BUSY_SESSION_STATUS
-            self._start_heartbeat_thread()
 
     def __str__(self):
         return u"Session id: {}\tYARN id: {}\tKind: {}\tState: {}\n\tSpark UI: {}\n\tDriver Log: {}"\
@@ -139,9 +160,10 @@ class LivySession(ObjectWithGuid):
         self._printed_resource_warning = False
 
         try:
+            start_time = time()
             r = self._http_client.post_session(self.properties)
             self.id = r[u"id"]
-            self.status = str(r[u"state"])
+            self._record_status(str(r[u"state"]))
             self._save_extra_session_properties(self.id)
 
             self.ipython_display.writeln(u"Starting Spark application")
@@ -155,6 +177,7 @@ class LivySession(ObjectWithGuid):
             except LivyClientTimeoutException:
                 raise LivyClientTimeoutException(u"Session {} did not start up in {} seconds."
                                                  .format(self.id, conf.livy_session_startup_timeout_seconds()))
+            get_metrics().observe(SESSION_START_DURATION, time() - start_time, kind=self.kind)
             # 去掉创建session成功后显示livysession信息
             #html = get_sessions_info_html([self], self.id)
             #self.ipython_display.html(html)
@@ -168,6 +191,9 @@ class LivySession(ObjectWithGuid):
                 else:
                     raise SqlContextNotFoundException(u"SparkSession is not available.")
 
+            if self._run_init_script():
+                return
+
             command = Command("spark")
             (success, out) = command.execute(self)
 
@@ -186,6 +212,8 @@ class LivySession(ObjectWithGuid):
                     self.sql_context_variable_name = "sqlContext"
                 else:
                     raise SqlContextNotFoundException(u"Neither SparkSession nor HiveContext/SqlContext is available.")
+
+            self._run_init_code()
         except Exception as e:
             self._spark_events.emit_session_creation_end_event(self.guid, self.kind, self.id, self.status,
                                                                False, e.__class__.__name__, str(e))
@@ -194,24 +222,93 @@ class LivySession(ObjectWithGuid):
             self._spark_events.emit_session_creation_end_event(self.guid, self.kind, self.id, self.status, True, "", "")
 
     def get_app_id(self):
-        if self._app_id is None:
-            self._app_id = self._http_client.get_session(self.id).get("appId")
-        return self._app_id
+        return self._get_metadata().get(u"appId")
 
     def get_app_info(self):
-        appInfo = self._http_client.get_session(self.id).get("appInfo")
+        appInfo = self._get_metadata().get(u"appInfo")
         return appInfo if appInfo is not None else {}
 
+    def invalidate_metadata(self):
+        """Forgets the cached appId and appInfo, so that the next call that needs them asks Livy again."""
+        self._metadata = None
+
+    def _get_metadata(self):
+        metadata = self._metadata
+        if metadata is None:
+            metadata = self._cache_metadata(self._http_client.get_session(self.id))
+        return metadata
+
+    def _cache_metadata(self, response):
+        metadata = {u"appId": response.get(u"appId"), u"appInfo": response.get(u"appInfo")}
+        # Until YARN has started the application Livy has neither, and asking again later is worth it.
+        self._metadata = metadata if metadata[u"appId"] is not None else None
+        return metadata
+
     def get_app_info_member(self, member_name):
         return self.get_app_info().get(member_name)
 
     def get_driver_log_url(self):
         return self.get_app_info_member("driverLogUrl")
 
-    def get_logs(self):
-        log_array = self._http_client.get_all_session_logs(self.id)[u'log']
-        self._logs = "\n".join(log_array)
-        return self._logs
+    @property
+    def session_info(self):
+        """The recent log lines Livy sends with the state of the session."""
+        return u"\n".join(self._recent_log)
+
+    def get_logs(self, tail=None):
+        """Returns the session log read so far, or its last tail lines, after reading the lines logged since the
+        last call."""
+        self.get_new_logs()
+        with self._log_lock:
+            log_lines = list(self._log_lines)
+        if tail is not None:
+            log_lines = log_lines[-tail:] if tail > 0 else []
+        return u"\n".join(log_lines)
+
+    def get_new_logs(self):
+        """Reads the lines logged since the last call, session_log_page_size lines per request, and returns them.
+
+        Livy only keeps the last lines of the log (livy.cache-log.size). Once it has that many, older lines drop
+        off its start as new ones are logged and the cursor no longer points past what was read, so reading starts
+        one line early to check the last line read is still where it was."""
+        with self._log_lock:
+            page_size = conf.session_log_page_size()
+            if self._log_cursor > 0 and self._log_lines:
+                (lines, _) = self._read_logs(self._log_cursor - 1, page_size)
+                if lines[:1] == [self._log_lines[-1]]:
+                    new_lines = lines[1:]
+                else:
+                    # The log rolled over, or the session was recovered; read it again, skipping what was read.
+                    (lines, _) = self._read_logs(0, page_size)
+                    new_lines = lines[self._count_lines_read(lines):]
+            else:
+                cursor = self._log_cursor
+                (new_lines, total) = self._read_logs(cursor, page_size)
+                if total < cursor:
+                    (new_lines, _) = self._read_logs(0, page_size)
+            self._log_lines.extend(new_lines)
+            return new_lines
+
+    def _read_logs(self, from_line, page_size):
+        # Reads the log from from_line to its end and moves the cursor there. Returns the lines and the log's length.
+        lines = []
+        self._log_cursor = from_line
+        while True:
+            response = self._http_client.get_session_logs(self.id, self._log_cursor, page_size)
+            total = response.get(u'total', 0)
+            log_array = response.get(u'log') or []
+            self._log_cursor = response.get(u'from', self._log_cursor) + len(log_array)
+            lines.extend(log_array)
+            if len(log_array) < page_size or self._log_cursor >= total:
+                return (lines, total)
+
+    def _count_lines_read(self, lines):
+        # Returns how many of the first lines are the last lines read.
+        lines_read = list(self._log_lines)
+        for count in range(min(len(lines), len(lines_read)), 0, -1):
+            if lines[:count] == lines_read[-count:]:
+                return count
+        return 0
 
     def get_spark_ui_url(self):
         return self.get_app_info_member("sparkUiUrl")
@@ -224,6 +321,13 @@ class LivySession(ObjectWithGuid):
     def endpoint(self):
         return self._http_client.endpoint
 
+    @property
+    def async_http_client(self):
+        """AsyncLivyReliableHttpClient for the session's endpoint, created on first use."""
+        if self._async_http_client is None:
+            self._async_http_client = AsyncLivyReliableHttpClient.from_endpoint(self.endpoint)
+        return self._async_http_client
+
     @staticmethod
     def is_final_status(status):
         return status in constants.FINAL_STATUS
@@ -238,8 +342,12 @@ class LivySession(ObjectWithGuid):
             if self.status != constants.NOT_STARTED_SESSION_STATUS:
                 self._http_client.delete_session(session_id)
                 self._stop_heartbeat_thread()
+                # Livy reuses session ids after it restarts, so a claim left behind would keep the pool from ever
+                # handing out a new session with the same id.
+                self.release_claim_session(session_id)
                 self.status = constants.DEAD_SESSION_STATUS
                 self.id = -1
+                self.invalidate_metadata()
             else:
                 self.ipython_display.send_error(u"Cannot delete session {} that is in state '{}'."
                                                 .format(session_id, self.status))
@@ -263,64 +371,168 @@ class LivySession(ObjectWithGuid):
         retries = 1
         while True:
             self.refresh_status_and_info()
-            if self.status == constants.IDLE_SESSION_STATUS:
+            if self._check_idle(seconds_to_wait):
                 return
 
-            if self.status in constants.FINAL_STATUS:
-                error = u"Session {} unexpectedly reached final status '{}'."\
-                    .format(self.id, self.status)
-                self.logger.error(error)
-                raise LivyUnexpectedStatusException(u'{} See logs:\n{}'.format(error, self.get_logs()))
+            start_time = time()
+            # Never sleep past the time left, so that the timeout is raised on time.
+            sleep_time = min(self._idle_seconds_to_sleep(retries), seconds_to_wait)
+            retries += 1
+            sleep(sleep_time)
+            seconds_to_wait -= time() - start_time
 
-            if seconds_to_wait <= 0.0:
-                error = u"Session {} did not reach idle status in time. Current status is {}."\
-                    .format(self.id, self.status)
-                self.logger.error(error)
-                raise LivyClientTimeoutException(error)
+    async def wait_for_idle_async(self, seconds_to_wait=None):
+        """Same as wait_for_idle, but awaits Livy on the event loop instead of blocking it."""
+        if seconds_to_wait is None:
+            seconds_to_wait = self._wait_for_idle_timeout_seconds
 
-            if constants.YARN_RESOURCE_LIMIT_MSG in self.session_info and \
-                not self._printed_resource_warning:
-                self.ipython_display.send_error(constants.RESOURCE_LIMIT_WARNING\
-                                                .format(conf.resource_limit_mitigation_suggestion()))
-                self._printed_resource_warning = True
+        retries = 1
+        while True:
+            self.update_status_and_info(await self.async_http_client.get_session(self.id))
+            if self._check_idle(seconds_to_wait):
+                return
 
             start_time = time()
-            sleep_time = self._policy.seconds_to_sleep(retries)
+            # Never sleep past the time left, so that the timeout is raised on time.
+            sleep_time = min(self._idle_seconds_to_sleep(retries), seconds_to_wait)
             retries += 1
-
-            self.logger.debug(u"Session {} in state {}. Sleeping {} seconds."
-                              .format(self.id, self.status, sleep_time))
-            sleep(sleep_time)
+            await gen.sleep(sleep_time)
             seconds_to_wait -= time() - start_time
 
+    def _check_idle(self, seconds_to_wait):
+        """Returns whether the last refreshed status is idle, raising if the session cannot get there."""
+        if self.status == constants.IDLE_SESSION_STATUS:
+            return True
+
+        if self.status in constants.FINAL_STATUS:
+            error = u"Session {} unexpectedly reached final status '{}'."\
+                .format(self.id, self.status)
+            self.logger.error(error)
+            raise LivyUnexpectedStatusException(u'{} See logs:\n{}'.format(error, self.get_logs()))
+
+        if seconds_to_wait <= 0.0:
+            error = u"Session {} did not reach idle status in time. Current status is {}."\
+                .format(self.id, self.status)
+            self.logger.error(error)
+            raise LivyClientTimeoutException(error)
+
+        if constants.YARN_RESOURCE_LIMIT_MSG in self.session_info and \
+            not self._printed_resource_warning:
+            self.ipython_display.send_error(constants.RESOURCE_LIMIT_WARNING\
+                                            .format(conf.resource_limit_mitigation_suggestion()))
+            self._printed_resource_warning = True
+        return False
+
+    def _idle_seconds_to_sleep(self, retries):
+        sleep_time = self._policy.seconds_to_sleep(retries)
+        self.logger.debug(u"Session {} in state {}. Sleeping {} seconds."
+                          .format(self.id, self.status, sleep_time))
+        return sleep_time
+
+    def is_recently_idle(self):
+        """Whether a heartbeat, refresh or completed statement saw the session idle within the last
+        session_state_cache_seconds, so that a statement can be posted without checking the state again."""
+        if self.status != constants.IDLE_SESSION_STATUS or self._status_refreshed_at is None:
+            return False
+        return time() - self._status_refreshed_at <= conf.session_state_cache_seconds()
+
+    def record_statement_completed(self):
+        """A statement reaching a final state leaves the session idle; remember it to save the next refresh."""
+        if self.status not in constants.FINAL_STATUS:
+            self._record_status(constants.IDLE_SESSION_STATUS)
+
+    def _record_status(self, status):
+        self.status = status
+        self._status_refreshed_at = time()
+
     def sleep(self, retries):
         sleep(self._policy.seconds_to_sleep(retries))
 
+    def sleep_for_statement(self, retries, progress=None, elapsed_seconds=None):
+        """Sleeps between two polls of a running statement, as long as the session's statement wait policy says."""
+        sleep(self.statement_seconds_to_sleep(retries, progress, elapsed_seconds))
+
+    def statement_seconds_to_sleep(self, retries, progress=None, elapsed_seconds=None):
+        return self._statement_wait_policy.seconds_to_sleep(retries, progress, elapsed_seconds)
+
+    @staticmethod
+    def _get_statement_wait_policy():
+        policy = conf.statement_wait_policy()
+        if policy == constants.FIXED_STATEMENT_WAIT:
+            return FixedStatementWaitPolicy(conf.statement_wait_seconds_to_sleep_list())
+        elif policy == constants.ADAPTIVE_STATEMENT_WAIT:
+            return AdaptiveStatementWaitPolicy(conf.statement_wait_min_seconds(), conf.statement_wait_max_seconds())
+        else:
+            raise BadUserConfigurationException(u"Statement wait policy '{}' not supported".format(policy))
+
     # This function will refresh the status and get the logs in a single call.
     # Only the status will be returned as the return value.
     def refresh_status_and_info(self):
-        response = self._http_client.get_session(self.id)
+        return self.update_status_and_info(self._http_client.get_session(self.id))
+
+    def update_status_and_info(self, response):
+        """Updates the status and info of the session from its JSON description, as returned by GET /sessions/{id}
+        or as an item of the GET /sessions list."""
         # 取session的时候判断session是否属于当前用户
         system_name = getpass.getuser()
         if response[u'proxyUser'] != system_name:
             return None
 
         status = response[u'state']
-        log_array = response[u'log']
+        log_array = response.get(u'log', [])
+        self._cache_metadata(response)
 
         if status in constants.POSSIBLE_SESSION_STATUS:
-            self.status = status
-            self.session_info = u"\n".join(log_array)
+            self._record_status(status)
+            self._recent_log = log_array
         else:
            raise LivyUnexpectedStatusException(u"Status '{}' not supported by session.".format(status))
 
+    def _run_init_script(self):
+        """Runs the SessionInitScript for the session's kind. Returns False if the kind is not supported or the
+        script did not find the Spark entry point, in which case the caller has to probe for it."""
+        database = conf.user_database() if conf.switch_to_user_database() else None
+        script = SessionInitScript(self.kind, database, self._init_code())
+        if not script.is_supported():
+            return False
+
+        (success, out) = script.to_command().execute(self)
+        reply = SessionInitScript.parse_reply(out) if success else None
+        if reply is None or not reply.get(u"context"):
+            self.logger.debug(u"Session init script failed, probing for the Spark context: {}".format(out))
+            return False
+
+        self.sql_context_variable_name = reply[u"context"]
+        if self.sql_context_variable_name == u"spark":
+            self.ipython_display.writeln(u"SparkSession available as 'spark'.")
+        else:
+            self.ipython_display.writeln(u"SparkContext available as 'sc'.")
+            if reply.get(u"hive"):
+                self.ipython_display.writeln(u"HiveContext available as 'sqlContext'.")
+            else:
+                self.ipython_display.writeln(u"SqlContext available as 'sqlContext'.")
+        self.current_database = reply.get(u"database")
+        if not script.runs_init_code():
+            self._run_init_code()
+        elif reply.get(u"init_error"):
+            self.ipython_display.send_error(u"Session init code failed: {}".format(reply[u"init_error"]))
+        return True
+
+    def _run_init_code(self):
+        init_code = self._init_code()
+        if init_code:
+            (success, out) = Command(init_code).execute(self)
+            if not success:
+                self.ipython_display.send_error(u"Session init code failed: {}".format(out))
+
+    def _init_code(self):
+        return conf.session_init_code().get(self.kind)
+
     def _start_heartbeat_thread(self):
         if self._should_heartbeat and self._heartbeat_thread is None:
-            refresh_seconds = conf.heartbeat_refresh_seconds()
-            retry_seconds = conf.heartbeat_retry_seconds()
-
             if self._user_passed_heartbeat_thread is None:
-                self._heartbeat_thread = _HeartbeatThread(self, refresh_seconds, retry_seconds)
+                # One scheduler thread heartbeats every session of the process.
+                self._heartbeat_thread = ScheduledHeartbeat(self)
             else:
                 self._heartbeat_thread = self._user_passed_heartbeat_thread
 
@@ -386,10 +598,11 @@ class LivySession(ObjectWithGuid):
         return self._extra_session_properties
 
     def _get_extra_session_properties(self, session_id):
-        username = getpass.getuser()
-        user_livy_dir = os.path.join(constants.LIVY_INFO_PATH, username)
-        file_name = f"session_{session_id}.json"
-        file_path = os.path.join(user_livy_dir, file_name)
+        return self.load_extra_session_properties(session_id)
+
+    @staticmethod
+    def load_extra_session_properties(session_id):
+        file_path = LivySession._extra_session_properties_path(session_id)
         if os.path.exists(file_path):
             with open(file_path, "r") as f:
                 session_json = f.read()
@@ -403,12 +616,9 @@ class LivySession(ObjectWithGuid):
             save extra session info
         """
         # FIXME storage redis or zookeeper
-        username = getpass.getuser()
-        user_livy_dir = os.path.join(constants.LIVY_INFO_PATH, username)
-        os.makedirs(user_livy_dir, exist_ok=True)
+        file_path = self._extra_session_properties_path(session_id)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        file_name = f"session_{session_id}.json"
-        file_path = os.path.join(user_livy_dir, file_name)
         data = {
             "session_language": self.session_language,
             "session_name": self.session_name,
@@ -417,4 +627,50 @@ class LivySession(ObjectWithGuid):
         with open(file_path, "w") as f:
             f.write(json.dumps(data))
 
-        return True
\ No newline at end of file
+        return True
+
+    def extra_session_properties_saved_at(self):
+        return self.get_extra_session_properties_saved_at(self.id)
+
+    @staticmethod
+    def get_extra_session_properties_saved_at(session_id):
+        """Returns when the extra properties of the session were last saved, i.e. when the session was started or
+        renamed, or None if they were never saved."""
+        file_path = LivySession._extra_session_properties_path(session_id)
+        if os.path.exists(file_path):
+            return os.path.getmtime(file_path)
+        return None
+
+    def rename(self, session_name):
+        """Saves a new name for the session, e.g. when a kernel takes it from the session pool."""
+        self._session_name = session_name
+        self._extra_session_properties = {}
+        self._save_extra_session_properties(self.id)
+
+    def claim(self):
+        return self.claim_session(self.id)
+
+    @staticmethod
+    def claim_session(session_id):
+        """Marks the session as taken by creating a claim file next to its extra properties. Returns False if any
+        process claimed it before."""
+        file_path = LivySession._extra_session_properties_path(session_id, u"claimed")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        try:
+            os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    @staticmethod
+    def release_claim_session(session_id):
+        """Removes the claim file of the session, if any."""
+        file_path = LivySession._extra_session_properties_path(session_id, u"claimed")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    @staticmethod
+    def _extra_session_properties_path(session_id, extension=u"json"):
+        username = getpass.getuser()
+        user_livy_dir = os.path.join(constants.LIVY_INFO_PATH, username)
+        return os.path.join(user_livy_dir, f"session_{session_id}.{extension}")
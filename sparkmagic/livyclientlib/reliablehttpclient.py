@@ -1,20 +1,118 @@
 ﻿# Copyright (c) 2015  aggftw@gmail.com
 # Distributed under the terms of the Modified BSD License.
 import json
-from time import sleep
+import threading
+from time import sleep, time
 import requests
+from requests.adapters import HTTPAdapter
 from requests_kerberos import HTTPKerberosAuth, REQUIRED
 
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils.sparklogger import SparkLog
+from sparkmagic.utils.metrics import get_metrics, HTTP_RETRIES, HTTP_REQUESTS_REJECTED, CIRCUIT_BREAKER_OPENED
 from sparkmagic.utils.constants import MAGICS_LOGGER_NAME
 import sparkmagic.utils.constants as constants
-from sparkmagic.livyclientlib.exceptions import HttpClientException
+from sparkmagic.livyclientlib.exceptions import HttpClientException, HttpClientStatusException, \
+    CircuitOpenException
 from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
+from .circuitbreaker import CircuitBreaker
+from .retrybudget import RetryBudget
+
+
+_pooled_sessions = {}
+_pooled_sessions_lock = threading.Lock()
+_circuit_breakers = {}
+_retry_budgets = {}
+_endpoint_state_lock = threading.Lock()
+
+
+def get_pooled_session(endpoint):
+    """Returns the requests.Session shared by every client of the given endpoint, creating it on first use.
+    The session keeps connections alive between requests, so statement polls and heartbeats don't pay for a
+    new TCP connection (or a new SPNEGO handshake when the auth cookie is reused) every time."""
+    with _pooled_sessions_lock:
+        session = _pooled_sessions.get(endpoint)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=conf.http_pool_maxsize())
+            session.mount(u"http://", adapter)
+            session.mount(u"https://", adapter)
+            _pooled_sessions[endpoint] = session
+        return session
+
+
+def close_pooled_session(endpoint):
+    """Closes the pooled connections of the given endpoint. A new session is created on the next request."""
+    with _pooled_sessions_lock:
+        session = _pooled_sessions.pop(endpoint, None)
+    if session is not None:
+        session.close()
+
+
+def get_circuit_breaker(endpoint):
+    """Returns the CircuitBreaker shared by every client of the given endpoint in this process."""
+    with _endpoint_state_lock:
+        circuit_breaker = _circuit_breakers.get(endpoint)
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(conf.circuit_breaker_failure_threshold(),
+                                             conf.circuit_breaker_reset_seconds())
+            _circuit_breakers[endpoint] = circuit_breaker
+        return circuit_breaker
+
+
+def get_retry_budget(endpoint):
+    """Returns the RetryBudget shared by every client of the given endpoint in this process."""
+    with _endpoint_state_lock:
+        retry_budget = _retry_budgets.get(endpoint)
+        if retry_budget is None:
+            retry_budget = RetryBudget(conf.retry_budget_max_retries(), conf.retry_budget_window_seconds())
+            _retry_budgets[endpoint] = retry_budget
+        return retry_budget
+
+
+def check_circuit(endpoint, url):
+    """Raises a CircuitOpenException if the circuit breaker of the endpoint does not let the request to url through."""
+    try:
+        get_circuit_breaker(endpoint).before_request(url)
+    except CircuitOpenException:
+        get_metrics().increment(HTTP_REQUESTS_REJECTED, reason=u"circuit_open")
+        raise
+
+
+def record_attempt(endpoint, status, error):
+    """Reports the outcome of a request to the circuit breaker of the endpoint. Connection errors and status codes
+    500 or above are failures of the server; anything else shows it is up."""
+    circuit_breaker = get_circuit_breaker(endpoint)
+    if error or status >= 500:
+        if circuit_breaker.record_failure():
+            get_metrics().increment(CIRCUIT_BREAKER_OPENED)
+    else:
+        circuit_breaker.record_success()
+
+
+def spend_retry(endpoint):
+    """Returns True if the retry budget of the endpoint allows one more retry."""
+    if get_retry_budget(endpoint).try_spend():
+        return True
+    get_metrics().increment(HTTP_REQUESTS_REJECTED, reason=u"retry_budget")
+    return False
+
+
+def can_retry(endpoint, deadline, seconds_to_sleep):
+    """Returns True if a request can be retried after sleeping seconds_to_sleep: the retry must start before the
+    deadline of the request and be allowed by the retry budget of the endpoint."""
+    if time() + seconds_to_sleep >= deadline:
+        get_metrics().increment(HTTP_REQUESTS_REJECTED, reason=u"deadline")
+        return False
+    return spend_retry(endpoint)
 
 
 class ReliableHttpClient(object):
-    """Http client that is reliable in its requests. Uses requests library."""
+    """Http client that is reliable in its requests. Uses requests library.
+
+    Failed requests are retried according to the retry policy, within the retry budget of the endpoint and the
+    deadline of the request's operation (see configuration.http_timeouts). Requests are not sent while the circuit
+    breaker of the endpoint is open."""
 
     def __init__(self, endpoint, headers, retry_policy):
         self._endpoint = endpoint
@@ -28,48 +126,71 @@ class ReliableHttpClient(object):
             raise BadUserConfigurationException(u"Unsupported auth %s" %self._endpoint.auth)
 
         self.logger = SparkLog(u"ReliableHttpClient")
+        # Time of the last request, which tells the LivyClientRegistry whether the client is still in use.
+        self.last_used_at = time()
 
         self.verify_ssl = not conf.ignore_ssl_errors()
         if not self.verify_ssl:
             self.logger.debug(u"ATTENTION: Will ignore SSL errors. This might render you vulnerable to attacks.")
             requests.packages.urllib3.disable_warnings()
 
+    @property
+    def _session(self):
+        return get_pooled_session(self._endpoint)
+
     def get_headers(self):
         return self._headers
 
+    def close(self):
+        """Closes the pooled connections of this client's endpoint."""
+        close_pooled_session(self._endpoint)
+
     def compose_url(self, relative_url):
         r_u = "/{}".format(relative_url.rstrip(u"/").lstrip(u"/"))
         return self._endpoint.url + r_u
 
-    def get(self, relative_url, accepted_status_codes):
+    def get(self, relative_url, accepted_status_codes, operation=constants.HTTP_OPERATION_DEFAULT):
         """Sends a get request. Returns a response."""
-        return self._send_request(relative_url, accepted_status_codes, requests.get)
+        return self._send_request(relative_url, accepted_status_codes, self._session.get, operation=operation)
 
-    def post(self, relative_url, accepted_status_codes, data):
+    def post(self, relative_url, accepted_status_codes, data, operation=constants.HTTP_OPERATION_DEFAULT):
         """Sends a post request. Returns a response."""
-        return self._send_request(relative_url, accepted_status_codes, requests.post, data)
+        return self._send_request(relative_url, accepted_status_codes, self._session.post, data, operation)
 
-    def delete(self, relative_url, accepted_status_codes):
+    def delete(self, relative_url, accepted_status_codes, operation=constants.HTTP_OPERATION_DEFAULT):
         """Sends a delete request. Returns a response."""
-        return self._send_request(relative_url, accepted_status_codes, requests.delete)
-
-    def _send_request(self, relative_url, accepted_status_codes, function, data=None):
-        return self._send_request_helper(self.compose_url(relative_url), accepted_status_codes, function, data, 0)
-
-    def _send_request_helper(self, url, accepted_status_codes, function, data, retry_count):
+        return self._send_request(relative_url, accepted_status_codes, self._session.delete, operation=operation)
+
+    def _send_request(self, relative_url, accepted_status_codes, function, data=None,
+                      operation=constants.HTTP_OPERATION_DEFAULT):
+        self.last_used_at = time()
+        return self._send_request_helper(self.compose_url(relative_url), accepted_status_codes, function, data, 0,
+                                         operation)
+
+    def _send_request_helper(self, url, accepted_status_codes, function, data, retry_count,
+                             operation=constants.HTTP_OPERATION_DEFAULT):
+        # Each attempt is bounded by the connect and read timeouts of the operation, and no attempt starts after
+        # its deadline, so that a hung server cannot block the caller forever.
+        (connect_seconds, read_seconds, deadline_seconds) = conf.get_http_timeouts(operation)
+        deadline = time() + deadline_seconds
         while True:
+            check_circuit(self._endpoint, url)
+            seconds_left = max(deadline - time(), 0.001)
+            timeout = (min(connect_seconds, seconds_left), min(read_seconds, seconds_left))
             try:
                 if self._endpoint.auth == constants.NO_AUTH:
                     if data is None:
-                        r = function(url, headers=self._headers, verify=self.verify_ssl)
+                        r = function(url, headers=self._headers, verify=self.verify_ssl, timeout=timeout)
                     else:
-                        r = function(url, headers=self._headers, data=json.dumps(data), verify=self.verify_ssl)
+                        r = function(url, headers=self._headers, data=json.dumps(data), verify=self.verify_ssl,
+                                     timeout=timeout)
                 else:
                     if data is None:
-                        r = function(url, headers=self._headers, auth=self._auth, verify=self.verify_ssl)
+                        r = function(url, headers=self._headers, auth=self._auth, verify=self.verify_ssl,
+                                     timeout=timeout)
                     else:
                         r = function(url, headers=self._headers, auth=self._auth,
-                                     data=json.dumps(data), verify=self.verify_ssl)
+                                     data=json.dumps(data), verify=self.verify_ssl, timeout=timeout)
             except requests.exceptions.RequestException as e:
                 error = True
                 r = None
@@ -81,16 +202,20 @@ class ReliableHttpClient(object):
                 error = False
                 status = r.status_code
                 text = r.text
+            record_attempt(self._endpoint, status, error)
 
             if error or status not in accepted_status_codes:
                 if self._retry_policy.should_retry(status, error, retry_count):
-                    sleep(self._retry_policy.seconds_to_sleep(retry_count))
-                    retry_count += 1
-                    continue
+                    seconds_to_sleep = self._retry_policy.seconds_to_sleep(retry_count)
+                    if can_retry(self._endpoint, deadline, seconds_to_sleep):
+                        get_metrics().increment(HTTP_RETRIES, status=u"error" if error else u"{}".format(status))
+                        sleep(seconds_to_sleep)
+                        retry_count += 1
+                        continue
 
                 if error:
                     raise HttpClientException(u"Error sending http request and maximum retry encountered.")
                 else:
-                    raise HttpClientException(u"Invalid status code '{}' from {} with error payload: {}"
-                                              .format(status, url, text))
+                    raise HttpClientStatusException(u"Invalid status code '{}' from {} with error payload: {}"
+                                                    .format(status, url, text), status)
             return r
@@ -0,0 +1,29 @@
+# Distributed under the terms of the Modified BSD License.
+import threading
+from collections import deque
+from time import time
+
+
+class RetryBudget(object):
+    """Caps the retries to an endpoint at max_retries in any window of window_seconds, however many requests are
+    retrying, so that retries stop adding load to a server that is failing for everybody."""
+
+    def __init__(self, max_retries, window_seconds, clock=time):
+        self.max_retries = max_retries
+        self.window_seconds = window_seconds
+        self.exhausted_count = 0
+        self._clock = clock
+        self._retried_at = deque()
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        """Returns True, counting the retry, if the budget allows one more retry; False otherwise."""
+        with self._lock:
+            now = self._clock()
+            while self._retried_at and now - self._retried_at[0] >= self.window_seconds:
+                self._retried_at.popleft()
+            if len(self._retried_at) >= self.max_retries:
+                self.exhausted_count += 1
+                return False
+            self._retried_at.append(now)
+            return True
@@ -0,0 +1,88 @@
+# Distributed under the terms of the Modified BSD License.
+import sparkmagic.utils.constants as constants
+from .livysession import LivySession
+
+
+class SessionInfo(object):
+    """Read-only view of a Livy session as described by GET /sessions or GET /sessions/{id}, used to list sessions.
+
+    Unlike LivySession it has no heartbeat, thread or events, and everything it shows comes from the description it
+    was built from, so listing sessions costs a single request. Use SparkController.session_from_info to get a
+    LivySession for a listed session that is to be used or deleted."""
+
+    __slots__ = ("id", "kind", "status", "proxy_user", "_recent_log", "_app_id", "_app_info", "_http_client",
+                 "_extra_session_properties")
+
+    def __init__(self, http_client, session_json):
+        self._http_client = http_client
+        self._extra_session_properties = None
+        self.update(session_json)
+
+    def update(self, session_json):
+        self.id = session_json[u"id"]
+        self.kind = session_json.get(constants.LIVY_KIND_PARAM)
+        self.status = session_json.get(u"state")
+        self.proxy_user = session_json.get(u"proxyUser")
+        self._recent_log = session_json.get(u"log") or []
+        self._app_id = session_json.get(u"appId")
+        self._app_info = session_json.get(u"appInfo") or {}
+
+    @property
+    def session_info(self):
+        return u"\n".join(self._recent_log)
+
+    @property
+    def http_client(self):
+        return self._http_client
+
+    @property
+    def endpoint(self):
+        return self._http_client.endpoint
+
+    @property
+    def session_name(self):
+        return self._get_extra_session_properties().get(u"session_name")
+
+    @property
+    def session_language(self):
+        return self._get_extra_session_properties().get(u"session_language")
+
+    @property
+    def spark_yarn_queue(self):
+        return self._get_extra_session_properties().get(constants.SPARK_YARN_QUEUE_PARAM)
+
+    def extra_session_properties_saved_at(self):
+        return LivySession.get_extra_session_properties_saved_at(self.id)
+
+    def claim(self):
+        return LivySession.claim_session(self.id)
+
+    def get_app_id(self):
+        return self._app_id
+
+    def get_app_info_member(self, member_name):
+        return self._app_info.get(member_name)
+
+    def get_driver_log_url(self):
+        return self.get_app_info_member(u"driverLogUrl")
+
+    def get_spark_ui_url(self):
+        return self.get_app_info_member(u"sparkUiUrl")
+
+    def get_row_html(self, current_session_id):
+        return u"""<tr><td>{0}</td><td>{1}</td><td>{2}</td><td>{3}</td><td>{4}</td><td>{5}</td><td>{6}</td></tr>""".format(
+            self.id, self.get_app_id(), self.kind, self.status,
+            LivySession.get_html_link(u'Link', self.get_spark_ui_url()),
+            LivySession.get_html_link(u'Link', self.get_driver_log_url()),
+            u"" if current_session_id is None or current_session_id != self.id else u"\u2714"
+        )
+
+    def __str__(self):
+        return u"Session id: {}\tYARN id: {}\tKind: {}\tState: {}\n\tSpark UI: {}\n\tDriver Log: {}"\
+            .format(self.id, self.get_app_id(), self.kind, self.status, self.get_spark_ui_url(),
+                    self.get_driver_log_url())
+
+    def _get_extra_session_properties(self):
+        if self._extra_session_properties is None:
+            self._extra_session_properties = LivySession.load_extra_session_properties(self.id)
+        return self._extra_session_properties
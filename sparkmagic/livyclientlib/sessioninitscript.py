@@ -0,0 +1,80 @@
+# Distributed under the terms of the Modified BSD License.
+import json
+
+import sparkmagic.utils.constants as constants
+from .command import Command
+
+
+INIT_REPLY_MARKER = u"sparkmagic-session-init:"
+
+
+class SessionInitScript(object):
+    """Statement run once a session is idle that, in a single round trip, finds the Spark entry point, switches to
+    the user's database and runs the user's init code. It prints a line with INIT_REPLY_MARKER followed by a JSON
+    reply: {"context": variable name or null, "hive": bool, "database": database or null, "init_error": str}.
+
+    PySpark can probe for 'spark' and 'sqlContext' within the statement. Scala cannot refer to a name that may not
+    exist, so the Scala script assumes 'spark' and the statement failing means the caller should probe as before.
+    The Scala script does not run the init code either: catching its errors would make what it defines local to the
+    try block, and not catching them would make the caller probe and run it again. Other kinds are not supported."""
+
+    def __init__(self, kind, database=None, init_code=None):
+        self.kind = kind
+        self.database = database
+        self.init_code = init_code
+
+    def is_supported(self):
+        return self.kind in (constants.SESSION_KIND_PYSPARK, constants.SESSION_KIND_PYSPARK3,
+                             constants.SESSION_KIND_SPARK)
+
+    def runs_init_code(self):
+        return self.kind != constants.SESSION_KIND_SPARK
+
+    def to_command(self):
+        if self.kind == constants.SESSION_KIND_SPARK:
+            return Command(self._scala_code())
+        return Command(self._pyspark_code())
+
+    @staticmethod
+    def parse_reply(out):
+        """Returns the reply printed by the script, or None if out does not have one."""
+        for line in reversed(out.splitlines()):
+            if line.startswith(INIT_REPLY_MARKER):
+                try:
+                    return json.loads(line[len(INIT_REPLY_MARKER):])
+                except ValueError:
+                    return None
+        return None
+
+    def _pyspark_code(self):
+        reply = u'{}_init'.format(constants.LONG_RANDOM_VARIABLE_NAME)
+        lines = [u'import json',
+                 u'{} = {{"context": None, "hive": False, "database": None, "init_error": None}}'.format(reply),
+                 u'try:',
+                 u'    spark',
+                 u'    {}["context"] = "spark"'.format(reply),
+                 u'except NameError:',
+                 u'    try:',
+                 u'        {}["hive"] = "hive" in repr(sqlContext).lower()'.format(reply),
+                 u'        {}["context"] = "sqlContext"'.format(reply),
+                 u'    except NameError:',
+                 u'        pass']
+        if self.database:
+            lines += [u'if {}["context"] is not None:'.format(reply),
+                      u'    eval({0}["context"]).sql({1})'.format(reply, json.dumps(u'use {}'.format(self.database))),
+                      u'    {}["database"] = {}'.format(reply, json.dumps(self.database))]
+        if self.init_code:
+            lines += [u'try:',
+                      u'    exec({})'.format(json.dumps(self.init_code)),
+                      u'except Exception as e:',
+                      u'    {}["init_error"] = "{{}}: {{}}".format(type(e).__name__, e)'.format(reply)]
+        lines.append(u'print({} + json.dumps({}))'.format(json.dumps(INIT_REPLY_MARKER), reply))
+        return u'\n'.join(lines)
+
+    def _scala_code(self):
+        lines = [u'spark']
+        if self.database:
+            lines.append(u'spark.sql({})'.format(json.dumps(u'use {}'.format(self.database))))
+        reply = json.dumps({u"context": u"spark", u"hive": False, u"database": self.database, u"init_error": None})
+        lines.append(u'println("""{}{}""")'.format(INIT_REPLY_MARKER, reply))
+        return u'\n'.join(lines)
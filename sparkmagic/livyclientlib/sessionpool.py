@@ -0,0 +1,158 @@
+# Distributed under the terms of the Modified BSD License.
+import copy
+import threading
+from time import time
+
+from hdijupyterutils.utils import generate_uuid
+
+import sparkmagic.utils.configuration as conf
+import sparkmagic.utils.constants as constants
+from sparkmagic.utils.sparklogger import SparkLog
+
+
+POOLED_SESSION_NAME_PREFIX = u"pooled-"
+
+
+class _SilentDisplay(object):
+    """Display for the sessions the pool starts in the background, where there is no cell to write to."""
+
+    def write(self, msg):
+        pass
+
+    def writeln(self, msg):
+        pass
+
+    def html(self, to_display):
+        pass
+
+    def send_error(self, error):
+        pass
+
+
+class LivySessionPool(object):
+    """Keeps up to session_pool_size started, idle Livy sessions per (session language, YARN queue), so that a
+    kernel can take one instead of waiting for YARN to start its application.
+
+    Pooled sessions are ordinary Livy sessions of the user whose name starts with POOLED_SESSION_NAME_PREFIX. Since
+    names are kept with the other extra session properties, any kernel of the user can take a pooled session; a
+    claim file makes sure only one does. Pooled sessions idle for longer than session_pool_max_idle_seconds are
+    deleted, and the pool never makes the user have more than session_pool_max_sessions_per_user sessions."""
+
+    def __init__(self, spark_controller, pool_size=None, max_idle_seconds=None, max_sessions_per_user=None,
+                 clock=time):
+        if pool_size is None:
+            pool_size = conf.session_pool_size()
+        if max_idle_seconds is None:
+            max_idle_seconds = conf.session_pool_max_idle_seconds()
+        if max_sessions_per_user is None:
+            max_sessions_per_user = conf.session_pool_max_sessions_per_user()
+
+        self.logger = SparkLog(u"LivySessionPool")
+        self._spark_controller = spark_controller
+        self._pool_size = pool_size
+        self._max_idle_seconds = max_idle_seconds
+        self._max_sessions_per_user = max_sessions_per_user
+        self._clock = clock
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._pool_size > 0
+
+    def acquire(self, endpoint, properties, session_name):
+        """Takes an idle pooled session started with the language and YARN queue of properties, renames it to
+        session_name and returns it. Returns None if there is none. Either way, the pool is topped up in the
+        background."""
+        key = self._key_of_properties(properties)
+        acquired = None
+        for session_info in self._pooled_sessions(self._live_sessions(endpoint), key):
+            if session_info.status == constants.IDLE_SESSION_STATUS and session_info.claim():
+                acquired = self._spark_controller.session_from_info(session_info)
+                acquired.rename(session_name)
+                break
+
+        self._refill_in_background(endpoint, properties)
+        return acquired
+
+    def refill(self, endpoint, properties):
+        """Starts pooled sessions until there are pool_size of them for the language and YARN queue of properties,
+        or the user reaches max_sessions_per_user sessions."""
+        key = self._key_of_properties(properties)
+        for _ in range(self._pool_size):
+            sessions = self._live_sessions(endpoint)
+            if len(self._pooled_sessions(sessions, key)) >= self._pool_size or \
+                    len(sessions) >= self._max_sessions_per_user:
+                return
+            if not self._start_pooled_session(endpoint, properties):
+                return
+
+    def _refill_in_background(self, endpoint, properties):
+        key = (endpoint, self._key_of_properties(properties))
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+
+        # The caller goes on to use properties to create its own session.
+        properties = copy.deepcopy(properties)
+
+        def refill():
+            try:
+                self.refill(endpoint, properties)
+            except Exception as e:
+                self.logger.error(u"Could not refill the session pool: {}".format(e))
+            finally:
+                with self._lock:
+                    self._refilling.discard(key)
+
+        thread = threading.Thread(target=refill)
+        thread.daemon = True
+        thread.start()
+
+    def _start_pooled_session(self, endpoint, properties):
+        properties = copy.deepcopy(properties)
+        properties[u"session_name"] = u"{}{}".format(POOLED_SESSION_NAME_PREFIX, generate_uuid())
+        http_client = self._spark_controller._http_client(endpoint)
+        # Nothing in this process holds on to a pooled session, and whichever kernel claims it heartbeats it from
+        # then on, so the pool starts it without a Livy heartbeat timeout and reaps it itself.
+        session = self._spark_controller._livy_session(http_client, properties, _SilentDisplay(),
+                                                       heartbeat_timeout=0)
+        try:
+            session.start()
+        except Exception as e:
+            self.logger.error(u"Could not start pooled session: {}".format(e))
+            if session.id != -1:
+                session.delete()
+            return False
+        return True
+
+    def _live_sessions(self, endpoint):
+        return [session_info for session_info in self._spark_controller.get_all_sessions_endpoint(endpoint)
+                if session_info.status not in constants.FINAL_STATUS]
+
+    def _pooled_sessions(self, sessions, key):
+        pooled_sessions = []
+        for session_info in sessions:
+            if not (session_info.session_name or u"").startswith(POOLED_SESSION_NAME_PREFIX) or \
+                    self._key_of_session(session_info) != key:
+                continue
+
+            saved_at = session_info.extra_session_properties_saved_at()
+            if saved_at is not None and self._clock() - saved_at > self._max_idle_seconds:
+                if session_info.claim():
+                    self.logger.debug(u"Deleting pooled session {} idle for too long.".format(session_info.id))
+                    self._spark_controller.session_from_info(session_info).delete()
+                continue
+
+            pooled_sessions.append(session_info)
+        return pooled_sessions
+
+    @staticmethod
+    def _key_of_properties(properties):
+        spark_conf = properties.get(constants.SESSION_CONF_PARAM, {})
+        return properties.get(u"session_language"), spark_conf.get(constants.SPARK_YARN_QUEUE_PARAM) or u""
+
+    @staticmethod
+    def _key_of_session(session_info):
+        return session_info.session_language, session_info.spark_yarn_queue or u""
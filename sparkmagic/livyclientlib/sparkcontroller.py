@@ -1,20 +1,35 @@
 # Copyright (c) 2015  aggftw@gmail.com
 # Distributed under the terms of the Modified BSD License.
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
 from sparkmagic.utils.sparklogger import SparkLog
 from .sessionmanager import SessionManager
-from .livyreliablehttpclient import LivyReliableHttpClient
+from .livyclientregistry import LivyClientRegistry
 from .livysession import LivySession
+from .command import Command
+from .sessioninfo import SessionInfo
+from .heartbeatscheduler import get_heartbeat_scheduler
+from .sessionpool import LivySessionPool
+from .exceptions import SessionManagementException
 from sparkmagic.utils.constants import MAGICS_LOGGER_NAME, SESSION_CONF_PARAM, SPARK_YARN_QUEUE_PARAM
 from sparkmagic.livyclientlib.endpoint import build_endpoint
 
 
 class SparkController(object):
+    # Shared by every controller in the process, so clients survive across magics.
+    _client_registry = None
+    # StatementTiming of the last statement any controller in the process ran, whichever session it ran on.
+    last_statement_timing = None
+
     def __init__(self, ipython_display):
         self.logger = SparkLog(u"SparkController")
         self.ipython_display = ipython_display
         self.session_manager = SessionManager()
+        self._session_pool = None
+        self._fan_out_executor = None
 
     def get_app_id(self, client_name=None):
         session_to_use = self.get_session_by_name_or_default(client_name)
@@ -24,9 +39,15 @@ class SparkController(object):
         session_to_use = self.get_session_by_name_or_default(client_name)
         return session_to_use.get_driver_log_url()
 
-    def get_logs(self, client_name=None):
+    def get_logs(self, client_name=None, tail=None):
+        session_to_use = self.get_session_by_name_or_default(client_name)
+        if tail is None:
+            return session_to_use.get_logs()
+        return session_to_use.get_logs(tail)
+
+    def get_new_logs(self, client_name=None):
         session_to_use = self.get_session_by_name_or_default(client_name)
-        return session_to_use.get_logs()
+        return session_to_use.get_new_logs()
 
     def get_spark_ui_url(self, client_name=None):
         session_to_use = self.get_session_by_name_or_default(client_name)
@@ -34,11 +55,75 @@ class SparkController(object):
 
     def run_command(self, command, client_name=None):
         session_to_use = self.get_session_by_name_or_default(client_name)
-        return command.execute(session_to_use)
+        try:
+            return command.execute(session_to_use)
+        finally:
+            self._record_last_statement_timing(session_to_use)
+
+    async def run_command_async(self, command, client_name=None):
+        session_to_use = self.get_session_by_name_or_default(client_name)
+        try:
+            return await command.execute_async(session_to_use)
+        finally:
+            self._record_last_statement_timing(session_to_use)
+
+    def run_commands_pipelined(self, commands, client_name=None):
+        session_to_use = self.get_session_by_name_or_default(client_name)
+        try:
+            return Command.execute_pipelined(commands, session_to_use)
+        finally:
+            self._record_last_statement_timing(session_to_use)
 
     def run_sqlquery(self, sqlquery, client_name=None):
         session_to_use = self.get_session_by_name_or_default(client_name)
-        return sqlquery.execute(session_to_use)
+        try:
+            return sqlquery.execute(session_to_use)
+        finally:
+            self._record_last_statement_timing(session_to_use)
+
+    @staticmethod
+    def _record_last_statement_timing(session):
+        SparkController.last_statement_timing = session.last_statement_timing
+
+    def run_on_sessions(self, statements, client_names=None, endpoints=None):
+        """Runs Commands and SQLQuerys on several managed sessions at once: all of them, or those named in
+        client_names, or those connected to one of endpoints. Each session runs the statements in order, and the
+        sessions run concurrently, so the whole takes as long as the slowest session.
+
+        Returns an OrderedDict of client name -> list of futures, one per statement, holding what the statement's
+        execute returned or raised."""
+        sessions = self._sessions_to_run_on(client_names, endpoints)
+        executor = self._get_fan_out_executor()
+        futures = OrderedDict()
+        for (name, session) in sessions:
+            futures[name] = [Future() for _ in statements]
+            executor.submit(self._run_statements, session, statements, futures[name])
+        return futures
+
+    def _sessions_to_run_on(self, client_names, endpoints):
+        if client_names is None:
+            client_names = self.session_manager.get_sessions_list()
+        sessions = [(name, self.session_manager.get_session(name.lower())) for name in client_names]
+        if endpoints is not None:
+            sessions = [(name, session) for (name, session) in sessions if session.endpoint in endpoints]
+        if not sessions:
+            raise SessionManagementException(u"You need to have at least 1 client created to execute commands.")
+        return sessions
+
+    @staticmethod
+    def _run_statements(session, statements, futures):
+        for (statement, future) in zip(statements, futures):
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(statement.execute(session))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _get_fan_out_executor(self):
+        if self._fan_out_executor is None:
+            self._fan_out_executor = ThreadPoolExecutor(max_workers=conf.fan_out_max_workers())
+        return self._fan_out_executor
 
     def get_all_sessions_endpoint(self, endpoint):
         http_client = self._http_client(endpoint)
@@ -49,14 +134,42 @@ class SparkController(object):
         current_user = getpass.getuser()
         _sessions = [s for s in sessions if s['proxyUser'] == current_user]
         _sessions.reverse()
-        session_list = [self._livy_session(http_client, {constants.LIVY_KIND_PARAM: s[constants.LIVY_KIND_PARAM]},
-                                           self.ipython_display, s[u"id"])
-                        for s in _sessions]
+        session_list = []
+        sessions_to_refresh = []
+        for s in _sessions:
+            session_info = SessionInfo(http_client, s)
+            # The list response already has every session's state, so only the odd session whose state is
+            # missing or unknown needs a GET /sessions/{id} of its own.
+            if s.get(u"state") not in constants.POSSIBLE_SESSION_STATUS:
+                sessions_to_refresh.append(session_info)
+            session_list.append(session_info)
 
-        for s in session_list:
-            s.refresh_status_and_info()
+        self._refresh_sessions(http_client, sessions_to_refresh)
         return session_list
 
+    @staticmethod
+    def _refresh_sessions(http_client, session_infos):
+        if not session_infos:
+            return
+        max_workers = max(1, min(len(session_infos), conf.session_refresh_max_workers()))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Consuming the results re-raises the first exception, as refreshing them one by one would.
+            list(executor.map(lambda session_info: session_info.update(http_client.get_session(session_info.id)),
+                              session_infos))
+
+    def session_from_info(self, session_info):
+        """Returns a LivySession for a session listed by get_all_sessions_endpoint, to use or delete it. The session
+        only heartbeats once it is adopted with already_start."""
+        session = self._livy_session(session_info.http_client, {constants.LIVY_KIND_PARAM: session_info.kind},
+                                     self.ipython_display, session_info.id)
+        session.status = session_info.status
+        return session
+
+    @staticmethod
+    def get_heartbeat_count():
+        """Number of sessions this process keeps alive with heartbeats."""
+        return get_heartbeat_scheduler().heartbeat_count()
+
     def get_all_sessions_endpoint_info(self, endpoint):
         sessions = self.get_all_sessions_endpoint(endpoint)
         return [str(s) for s in sessions]
@@ -65,8 +178,8 @@ class SparkController(object):
         self.session_manager.clean_up_all()
 
     def cleanup_endpoint(self, endpoint):
-        for session in self.get_all_sessions_endpoint(endpoint):
-            session.delete()
+        for session_info in self.get_all_sessions_endpoint(endpoint):
+            self.session_from_info(session_info).delete()
 
     def delete_session_by_name(self, name):
         self.session_manager.delete_client(name)
@@ -79,7 +192,6 @@ class SparkController(object):
         else:
             http_client = self._http_client(endpoint)
             response = http_client.get_session(session_id)
-            http_client = self._http_client(endpoint)
             session = self._livy_session(http_client, {constants.LIVY_KIND_PARAM: response[constants.LIVY_KIND_PARAM]},
                                         self.ipython_display, session_id)
             session.delete()
@@ -92,8 +204,9 @@ class SparkController(object):
         session = self._livy_session(http_client, properties, self.ipython_display)
         self.session_manager.add_session(name, session)
         session.start()
-        # switch user databases
-        self.switch_user_database(name)
+        # switch user databases, unless the session's init statement already did
+        if session.current_database != conf.user_database():
+            self.switch_user_database(name)
 
     def switch_user_database(self, session_name):
         from sparkmagic.livyclientlib.sqlquery import SQLQuery
@@ -125,13 +238,17 @@ class SparkController(object):
 
     @staticmethod
     def _livy_session(http_client, properties, ipython_display,
-                      session_id=-1):
+                      session_id=-1, heartbeat_timeout=None):
+        if heartbeat_timeout is None:
+            heartbeat_timeout = conf.livy_server_heartbeat_timeout_seconds()
         return LivySession(http_client, properties, ipython_display,
-                           session_id, heartbeat_timeout=conf.livy_server_heartbeat_timeout_seconds())
+                           session_id, heartbeat_timeout=heartbeat_timeout)
 
-    @staticmethod
-    def _http_client(endpoint):
-        return LivyReliableHttpClient.from_endpoint(endpoint)
+    @classmethod
+    def _http_client(cls, endpoint):
+        if cls._client_registry is None:
+            cls._client_registry = LivyClientRegistry()
+        return cls._client_registry.get_client(endpoint)
 
     def create_livy_session(self, kernel_instance_id, session_language, proxy_user, yarn_queue=None):
         endpoint = build_endpoint(session_language)
@@ -144,8 +261,26 @@ class SparkController(object):
         if yarn_queue:
             properties[SESSION_CONF_PARAM][SPARK_YARN_QUEUE_PARAM] = yarn_queue
 
-        self.add_session(session_name, endpoint, False, properties)
+        session_pool = self._get_session_pool()
+        pooled_session = None
+        if session_pool.enabled:
+            pooled_session = session_pool.acquire(endpoint, properties, session_name)
+
+        if pooled_session is not None:
+            self.logger.debug(u"Took session {} from the session pool.".format(pooled_session.id))
+            self.session_manager.add_session(session_name, pooled_session)
+            pooled_session.already_start()
+            # Like add_session, unless the pooled session's init statement already switched databases
+            if pooled_session.current_database != conf.user_database():
+                self.switch_user_database(session_name)
+        else:
+            self.add_session(session_name, endpoint, False, properties)
         return session_name
 
+    def _get_session_pool(self):
+        if self._session_pool is None:
+            self._session_pool = LivySessionPool(self)
+        return self._session_pool
+
     def generate_livy_session_name(self, kernel_instance_id):
         return u"session_name-{}".format(kernel_instance_id)
@@ -1,14 +1,20 @@
-from sparkmagic.utils.utils import records_to_dataframe
+from time import time
+
+from sparkmagic.utils.utils import records_to_dataframe, columnar_records_to_dataframe
 import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
 from sparkmagic.utils.sparkevents import SparkEvents
+from sparkmagic.utils.metrics import get_metrics
 from sparkmagic.livyclientlib.command import Command
+from sparkmagic.livyclientlib.sqlquery import pyspark_columnar_code
+from sparkmagic.livyclientlib.statementtiming import StatementTiming
 from sparkmagic.livyclientlib.exceptions import DataFrameParseException, BadUserDataException
 
 import ast
 
 class SparkStoreCommand(Command):
-    def __init__(self, output_var, samplemethod=None, maxrows=None, samplefraction=None, spark_events=None, coerce=None):
+    def __init__(self, output_var, samplemethod=None, maxrows=None, samplefraction=None, spark_events=None, coerce=None,
+                 result_format=None):
         super(SparkStoreCommand, self).__init__("", spark_events)
 
         if samplemethod is None:
@@ -17,6 +23,8 @@ class SparkStoreCommand(Command):
             maxrows = conf.default_maxrows()
         if samplefraction is None:
             samplefraction = conf.default_samplefraction()
+        if result_format is None:
+            result_format = conf.result_transfer_format()
 
         if samplemethod not in {u'take', u'sample'}:
             raise BadUserDataException(u'samplemethod (-m) must be one of (take, sample)')
@@ -24,6 +32,9 @@ class SparkStoreCommand(Command):
             raise BadUserDataException(u'maxrows (-n) must be an integer')
         if not 0.0 <= samplefraction <= 1.0:
             raise BadUserDataException(u'samplefraction (-r) must be a float between 0.0 and 1.0')
+        if result_format not in constants.RESULT_FORMATS_SUPPORTED:
+            raise BadUserDataException(u'result format must be one of ({})'
+                                       .format(u", ".join(constants.RESULT_FORMATS_SUPPORTED)))
 
         self.samplemethod = samplemethod
         self.maxrows = maxrows
@@ -33,15 +44,25 @@ class SparkStoreCommand(Command):
             spark_events = SparkEvents()
         self._spark_events = spark_events
         self._coerce = coerce
+        self.result_format = result_format
 
 
     def execute(self, session):
         try:
+            start_time = time()
+            timing = StatementTiming()
             command = self.to_command(session.kind, self.output_var)
-            (success, records_text) = command.execute(session)
+            (success, records_text) = command.execute(session, timing)
             if not success:
                 raise BadUserDataException(records_text)
-            result = records_to_dataframe(records_text, session.kind, self._coerce)
+            if self._is_columnar(session.kind):
+                result = columnar_records_to_dataframe(records_text, self._coerce, timing=timing)
+            else:
+                result = records_to_dataframe(records_text, session.kind, self._coerce, timing=timing)
+            timing.total_seconds = time() - start_time
+            self._spark_events.emit_statement_timing_event(session.guid, session.kind, session.id, command.guid,
+                                                           timing.to_dict())
+            get_metrics().record_statement_timing(session.kind, timing, len(result))
         except Exception as e:
             raise
         else:
@@ -49,7 +70,9 @@ class SparkStoreCommand(Command):
 
 
     def to_command(self, kind, spark_context_variable_name):
-        if kind == constants.SESSION_KIND_PYSPARK:
+        if self._is_columnar(kind):
+            return self._pyspark_columnar_command(spark_context_variable_name)
+        elif kind == constants.SESSION_KIND_PYSPARK:
             return self._pyspark_command(spark_context_variable_name)
         elif kind == constants.SESSION_KIND_PYSPARK3:
             return self._pyspark_command(spark_context_variable_name)
@@ -82,6 +105,17 @@ class SparkStoreCommand(Command):
         return Command(command)
 
 
+    def _pyspark_columnar_command(self, spark_context_variable_name):
+        dataframe = spark_context_variable_name
+        if self.samplemethod == u'sample':
+            dataframe = u'{}.sample(False, {})'.format(dataframe, self.samplefraction)
+        return Command(pyspark_columnar_code(dataframe, self.maxrows))
+
+
+    def _is_columnar(self, kind):
+        return self.result_format == constants.RESULT_FORMAT_COLUMNAR and kind in constants.COLUMNAR_RESULT_KINDS
+
+
     def _scala_command(self, spark_context_variable_name):
         command = u'{}.toJSON'.format(spark_context_variable_name)
         if self.samplemethod == u'sample':
@@ -121,7 +155,8 @@ class SparkStoreCommand(Command):
             self.maxrows == other.maxrows and \
             self.samplefraction == other.samplefraction and \
             self.output_var == other.output_var and \
-            self._coerce == other._coerce
+            self._coerce == other._coerce and \
+            self.result_format == other.result_format
 
     def __ne__(self, other):
         return not (self == other)
\ No newline at end of file
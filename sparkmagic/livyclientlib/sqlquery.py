@@ -1,15 +1,21 @@
+from time import time
+
 from hdijupyterutils.guid import ObjectWithGuid
 
-from sparkmagic.utils.utils import coerce_pandas_df_to_numeric_datetime, records_to_dataframe
+from sparkmagic.utils.utils import coerce_pandas_df_to_numeric_datetime, records_to_dataframe, \
+    columnar_records_to_dataframe
 import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
 from sparkmagic.utils.sparkevents import SparkEvents
+from sparkmagic.utils.metrics import get_metrics
 from .command import Command
+from .statementtiming import StatementTiming
 from .exceptions import DataFrameParseException, BadUserDataException
 
 
 class SQLQuery(ObjectWithGuid):
-    def __init__(self, query, samplemethod=None, maxrows=None, samplefraction=None, spark_events=None, coerce=None):
+    def __init__(self, query, samplemethod=None, maxrows=None, samplefraction=None, spark_events=None, coerce=None,
+                 result_format=None):
         super(SQLQuery, self).__init__()
 
         if samplemethod is None:
@@ -18,6 +24,8 @@ class SQLQuery(ObjectWithGuid):
             maxrows = conf.default_maxrows()
         if samplefraction is None:
             samplefraction = conf.default_samplefraction()
+        if result_format is None:
+            result_format = conf.result_transfer_format()
 
         if samplemethod not in {u'take', u'sample'}:
             raise BadUserDataException(u'samplemethod (-m) must be one of (take, sample)')
@@ -25,6 +33,9 @@ class SQLQuery(ObjectWithGuid):
             raise BadUserDataException(u'maxrows (-n) must be an integer')
         if not 0.0 <= samplefraction <= 1.0:
             raise BadUserDataException(u'samplefraction (-r) must be a float between 0.0 and 1.0')
+        if result_format not in constants.RESULT_FORMATS_SUPPORTED:
+            raise BadUserDataException(u'result format must be one of ({})'
+                                       .format(u", ".join(constants.RESULT_FORMATS_SUPPORTED)))
 
         self.query = query
         self.samplemethod = samplemethod
@@ -34,9 +45,12 @@ class SQLQuery(ObjectWithGuid):
             spark_events = SparkEvents()
         self._spark_events = spark_events
         self._coerce = coerce
+        self.result_format = result_format
 
     def to_command(self, kind, sql_context_variable_name):
-        if kind == constants.SESSION_KIND_PYSPARK:
+        if self._is_columnar(kind):
+            return self._pyspark_columnar_command(sql_context_variable_name)
+        elif kind == constants.SESSION_KIND_PYSPARK:
             return self._pyspark_command(sql_context_variable_name)
         elif kind == constants.SESSION_KIND_PYSPARK3:
             return self._pyspark_command(sql_context_variable_name)
@@ -54,12 +68,16 @@ class SQLQuery(ObjectWithGuid):
                                                           self.samplemethod, self.maxrows, self.samplefraction)
         command_guid = ''
         try:
+            start_time = time()
+            timing = StatementTiming()
             command = self.to_command(session.kind, session.sql_context_variable_name)
             command_guid = command.guid
-            (success, records_text) = command.execute(session)
-            if not success:
-                raise BadUserDataException(records_text)
-            result = records_to_dataframe(records_text, session.kind, self._coerce)
+            (success, records_text) = command.execute(session, timing)
+            result = self._to_dataframe(session, success, records_text, timing)
+            timing.total_seconds = time() - start_time
+            self._spark_events.emit_statement_timing_event(session.guid, session.kind, session.id, command_guid,
+                                                           timing.to_dict())
+            get_metrics().record_statement_timing(session.kind, timing, len(result))
         except Exception as e:
             self._spark_events.emit_sql_execution_end_event(session.guid, session.kind, session.id, self.guid,
                                                             command_guid, False, e.__class__.__name__, str(e))
@@ -70,6 +88,39 @@ class SQLQuery(ObjectWithGuid):
                                                             command_guid, True, "", "")
             return result
 
+    async def execute_async(self, session):
+        """Same as execute, but awaits Livy on the event loop instead of blocking it."""
+        self._spark_events.emit_sql_execution_start_event(session.guid, session.kind, session.id, self.guid,
+                                                          self.samplemethod, self.maxrows, self.samplefraction)
+        command_guid = ''
+        try:
+            start_time = time()
+            timing = StatementTiming()
+            command = self.to_command(session.kind, session.sql_context_variable_name)
+            command_guid = command.guid
+            (success, records_text) = await command.execute_async(session, timing)
+            result = self._to_dataframe(session, success, records_text, timing)
+            timing.total_seconds = time() - start_time
+            self._spark_events.emit_statement_timing_event(session.guid, session.kind, session.id, command_guid,
+                                                           timing.to_dict())
+            get_metrics().record_statement_timing(session.kind, timing, len(result))
+        except Exception as e:
+            self._spark_events.emit_sql_execution_end_event(session.guid, session.kind, session.id, self.guid,
+                                                            command_guid, False, e.__class__.__name__, str(e))
+            raise
+
+        else:
+            self._spark_events.emit_sql_execution_end_event(session.guid, session.kind, session.id, self.guid,
+                                                            command_guid, True, "", "")
+            return result
+
+    def _to_dataframe(self, session, success, records_text, timing=None):
+        if not success:
+            raise BadUserDataException(records_text)
+        if self._is_columnar(session.kind):
+            return columnar_records_to_dataframe(records_text, self._coerce, self.query, timing)
+        return records_to_dataframe(records_text, session.kind, self._coerce, self.query, timing)
+
     def _pyspark_command(self, sql_context_variable_name):
         # use_unicode=False means the result will be UTF-8-encoded bytes, so we
         # set it to False for Python 2.
@@ -88,6 +139,15 @@ class SQLQuery(ObjectWithGuid):
             print_command)
         return Command(command)
 
+    def _pyspark_columnar_command(self, sql_context_variable_name):
+        dataframe = u'{}.sql(u"""{} """)'.format(sql_context_variable_name, self.query)
+        if self.samplemethod == u'sample':
+            dataframe = u'{}.sample(False, {})'.format(dataframe, self.samplefraction)
+        return Command(pyspark_columnar_code(dataframe, self.maxrows))
+
+    def _is_columnar(self, kind):
+        return self.result_format == constants.RESULT_FORMAT_COLUMNAR and kind in constants.COLUMNAR_RESULT_KINDS
+
     def _scala_command(self, sql_context_variable_name):
         command = u'{}.sql("""{}""").toJSON'.format(sql_context_variable_name, self.query)
         if self.samplemethod == u'sample':
@@ -123,7 +183,26 @@ class SQLQuery(ObjectWithGuid):
             self.samplemethod == other.samplemethod and \
             self.maxrows == other.maxrows and \
             self.samplefraction == other.samplefraction and \
-            self._coerce == other._coerce
+            self._coerce == other._coerce and \
+            self.result_format == other.result_format
 
     def __ne__(self, other):
         return not (self == other)
+
+
+def pyspark_columnar_code(dataframe, maxrows):
+    """PySpark code that collects at most maxrows rows of the given dataframe expression and prints them as a
+    single line of column-oriented JSON: {"columns": [...], "fields": [...], "data": [[values of column 0], ...]},
+    where "fields" is the dataframe's Spark schema, used to type the columns."""
+    dataframe_name = u'{}_df'.format(constants.LONG_RANDOM_VARIABLE_NAME)
+    rows_name = u'{}_rows'.format(constants.LONG_RANDOM_VARIABLE_NAME)
+    if maxrows >= 0:
+        rows = u'{}.take({})'.format(dataframe_name, maxrows)
+    else:
+        rows = u'{}.collect()'.format(dataframe_name)
+    return u'import json\n' \
+           u'{df} = {dataframe}\n' \
+           u'{rows} = {collect}\n' \
+           u'print(json.dumps({{"columns": {df}.columns, "fields": {df}.schema.jsonValue()["fields"], ' \
+           u'"data": [[r[i] for r in {rows}] for i in range(len({df}.columns))]}}, default=str))'\
+        .format(df=dataframe_name, dataframe=dataframe, rows=rows_name, collect=rows)
@@ -0,0 +1,57 @@
+# Distributed under the terms of the Modified BSD License.
+import json
+from collections import OrderedDict
+
+from six import string_types
+
+
+class StatementTiming(object):
+    """Where the time of one statement went: waiting for the session to be idle, posting the statement, polling
+    Livy, running on Spark, and, for results turned into dataframes, parsing, building and coercing them.
+    Durations are in seconds; those that do not apply to the statement stay None."""
+
+    FIELDS = (u"wait_for_idle_seconds", u"post_seconds", u"poll_count", u"server_seconds", u"payload_bytes",
+              u"json_parse_seconds", u"dataframe_seconds", u"coerce_seconds", u"total_seconds")
+
+    def __init__(self):
+        self.wait_for_idle_seconds = 0.0
+        self.post_seconds = None
+        self.poll_count = 0
+        self.server_seconds = None
+        self.payload_bytes = None
+        self.json_parse_seconds = None
+        self.dataframe_seconds = None
+        self.coerce_seconds = None
+        self.total_seconds = None
+
+    def record_statement(self, statement):
+        """Records the time Spark spent on the statement, from the 'started' and 'completed' epoch milliseconds of
+        Livy's description of it, when Livy has them."""
+        started = statement.get(u"started") or 0
+        completed = statement.get(u"completed") or 0
+        if started > 0 and completed >= started:
+            self.server_seconds = (completed - started) / 1000.0
+
+    def record_output(self, output):
+        """Records the size of the statement's output: text as is, and application/json results as Livy sent
+        them."""
+        if isinstance(output, string_types):
+            self.payload_bytes = len(output.encode(u"utf-8"))
+        elif isinstance(output, (dict, list)):
+            self.payload_bytes = len(json.dumps(output).encode(u"utf-8"))
+
+    def to_dict(self):
+        return OrderedDict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def to_html(self):
+        rows = u"".join(u"<tr><td>{}</td><td>{}</td></tr>".format(field, self._format(value))
+                        for (field, value) in self.to_dict().items())
+        return u"<table><tr><th>Step</th><th>Value</th></tr>{}</table>".format(rows)
+
+    @staticmethod
+    def _format(value):
+        if value is None:
+            return u""
+        if isinstance(value, float):
+            return u"{:.3f}".format(value)
+        return u"{}".format(value)
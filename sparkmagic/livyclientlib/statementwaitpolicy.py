@@ -0,0 +1,45 @@
+# Distributed under the terms of the Modified BSD License.
+from .configurableretrypolicy import ConfigurableRetryPolicy
+from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
+
+
+class FixedStatementWaitPolicy(ConfigurableRetryPolicy):
+    """Statement wait policy that ignores the statement's progress and sleeps according to a fixed list of
+    seconds, repeating the last item of the list once the list is exhausted."""
+
+    def __init__(self, retry_seconds_to_sleep_list):
+        super(FixedStatementWaitPolicy, self).__init__(retry_seconds_to_sleep_list, max_retries=None)
+
+    def seconds_to_sleep(self, retry_count, progress=None, elapsed_seconds=None):
+        return super(FixedStatementWaitPolicy, self).seconds_to_sleep(retry_count)
+
+
+class AdaptiveStatementWaitPolicy(object):
+    """Statement wait policy that uses the 'progress' Livy reports for a running statement to predict when it
+    will complete. The time left is extrapolated from the time elapsed so far and the policy sleeps for a fraction
+    of it, so polls get denser as the statement approaches completion. Once the progress reaches 1, the policy
+    sleeps min_seconds. While no progress is reported, the sleep doubles from min_seconds up to max_seconds."""
+
+    def __init__(self, min_seconds, max_seconds, remaining_fraction=0.5):
+        if not 0 < min_seconds <= max_seconds:
+            raise BadUserConfigurationException(u"Statement wait seconds must satisfy 0 < min <= max, got min={} "
+                                                u"and max={}".format(min_seconds, max_seconds))
+        if not 0 < remaining_fraction <= 1:
+            raise BadUserConfigurationException(u"Statement wait remaining fraction must be in (0, 1], got {}"
+                                                .format(remaining_fraction))
+
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.remaining_fraction = remaining_fraction
+
+    def seconds_to_sleep(self, retry_count, progress=None, elapsed_seconds=None):
+        if progress is not None and progress >= 1:
+            # Livy reports the statement done; its output is only a poll away.
+            return self.min_seconds
+        if progress is None or elapsed_seconds is None or progress <= 0:
+            seconds = self.min_seconds * 2 ** min(max(retry_count - 1, 0), 32)
+        else:
+            remaining_seconds = elapsed_seconds * (1 - progress) / progress
+            seconds = remaining_seconds * self.remaining_fraction
+
+        return min(max(seconds, self.min_seconds), self.max_seconds)
@@ -7,6 +7,8 @@ Provides the %spark magic."""
 # Distributed under the terms of the Modified BSD License.
 
 from __future__ import print_function
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from six import string_types
 from IPython.core.magic import Magics, magics_class
 from hdijupyterutils.ipythondisplay import IpythonDisplay
@@ -23,6 +25,51 @@ from sparkmagic.livyclientlib.command import Command
 from sparkmagic.livyclientlib.sparkstorecommand import SparkStoreCommand
 from sparkmagic.livyclientlib.endpoint import build_endpoint
 
+
+# The kernel's Livy session being created in the background at kernel start, if any. It is kept here rather than on
+# a magics instance because the kernel loads both KernelMagics and RemoteSparkMagics, and either may need the session
+# first.
+_session_bootstrap = None
+# Where the bootstrap writes until a cell waits for it.
+_session_bootstrap_display = None
+_session_bootstrap_lock = threading.Lock()
+
+
+class _BufferedDisplay(object):
+    """Display for the session bootstrap, which has no cell to write to. Messages are kept until replay writes them
+    to the cell that waits for the bootstrap; after that, the sessions the bootstrap created write straight through."""
+
+    def __init__(self, ipython_display):
+        self._ipython_display = ipython_display
+        self._messages = []
+        self._lock = threading.Lock()
+
+    def write(self, msg):
+        self._send(u"write", msg)
+
+    def writeln(self, msg):
+        self._send(u"writeln", msg)
+
+    def html(self, to_display):
+        self._send(u"html", to_display)
+
+    def send_error(self, error):
+        self._send(u"send_error", error)
+
+    def replay(self):
+        with self._lock:
+            messages, self._messages = self._messages, None
+        for method, arg in messages or []:
+            getattr(self._ipython_display, method)(arg)
+
+    def _send(self, method, arg):
+        with self._lock:
+            if self._messages is not None:
+                self._messages.append((method, arg))
+                return
+        getattr(self._ipython_display, method)(arg)
+
+
 @magics_class
 class SparkMagicBase(Magics):
     def __init__(self, shell, data=None, spark_events=None):
@@ -45,8 +92,9 @@ class SparkMagicBase(Magics):
         if not session_name :
             session_name = session.session_name
             if session_name:
-                self.spark_controller.session_manager.add_session(session_name, session)
-                session.already_start()
+                livy_session = self.spark_controller.session_from_info(session)
+                self.spark_controller.session_manager.add_session(session_name, livy_session)
+                livy_session.already_start()
                 return session_name
         else:
             return session_name
@@ -58,9 +106,58 @@ class SparkMagicBase(Magics):
             执行sql时自动初始化sql
         :return:
         '''
-        return self.__get_or_create_session(language)
+        self.await_livy_session_bootstrap()
+        return self._get_or_create_session(language)
+
+    def start_livy_session_bootstrap(self, language="python"):
+        """Creates the kernel's Livy session on a background thread. init_livy_session, of either magics class,
+        waits for it before looking for the session."""
+        global _session_bootstrap, _session_bootstrap_display
+        display = _BufferedDisplay(self.ipython_display)
+        self.spark_controller.ipython_display = display
+        executor = ThreadPoolExecutor(max_workers=1)
+        with _session_bootstrap_lock:
+            _session_bootstrap = executor.submit(self._get_or_create_session, language)
+            _session_bootstrap_display = display
+        executor.shutdown(wait=False)
+
+    def await_livy_session_bootstrap(self):
+        """Waits for the session being created in the background, if any. Returns its name, or None when there is no
+        bootstrap, and raises what creating it raised. The bootstrap is only forgotten once it is done, so a wait
+        that is interrupted can be resumed; what it wrote meanwhile is then written to the waiting cell."""
+        bootstrap = _session_bootstrap
+        if bootstrap is None:
+            return None
+        try:
+            return bootstrap.result()
+        finally:
+            if bootstrap.done():
+                self._forget_session_bootstrap(bootstrap)
+
+    def cancel_livy_session_bootstrap(self):
+        """Cancels the session bootstrap if it has not started yet. Otherwise waits for it and returns the name of
+        the session it created, or None."""
+        bootstrap = _session_bootstrap
+        if bootstrap is None:
+            return None
+        if bootstrap.cancel():
+            self._forget_session_bootstrap(bootstrap)
+            return None
+        return self.await_livy_session_bootstrap()
 
-    def __get_or_create_session(self, language):
+    @staticmethod
+    def _forget_session_bootstrap(bootstrap):
+        global _session_bootstrap, _session_bootstrap_display
+        display = None
+        with _session_bootstrap_lock:
+            if _session_bootstrap is bootstrap:
+                display = _session_bootstrap_display
+                _session_bootstrap = None
+                _session_bootstrap_display = None
+        if display is not None:
+            display.replay()
+
+    def _get_or_create_session(self, language):
         proxy_user = getpass.getuser()
 
         self.session_language = language
@@ -83,36 +180,47 @@ class SparkMagicBase(Magics):
             if session.session_language != properties['session_language']:
                 continue
 
+            # Only this kernel's session is adopted, and heartbeated; sessions of other kernels and of the session
+            # pool are left alone.
+            if session.session_name != session_name_seleted:
+                continue
+
             session_name = self._get_session_name_by_session(session)
             if session_name == session_name_seleted:
                 if session.status in constants.HEALTHY_SESSION_STATUS:
                     return session_name_seleted
                 elif session.status in constants.FINAL_STATEMENT_STATUS:
                     # FINAL, recreate new session
-                    self.spark_controller.add_session(session_name_seleted, endpoint, False, properties)
-                    return session_name_seleted
+                    return self.spark_controller.create_livy_session(kernel_instance_id, self.session_language,
+                                                                     proxy_user)
         else:
             # 如果livy中没有session，则创建session
-            self.spark_controller.add_session(session_name_seleted, endpoint, False, properties)
-            return session_name_seleted
+            return self.spark_controller.create_livy_session(kernel_instance_id, self.session_language, proxy_user)
 
     def execute_spark(self, cell, output_var, samplemethod, maxrows, samplefraction, session_name, coerce):
         (success, out) = self.spark_controller.run_command(Command(cell), session_name)
+        self._display_spark_output(success, out)
+        if success and output_var is not None:
+            spark_store_command = self._spark_store_command(output_var, samplemethod, maxrows, samplefraction, coerce)
+            df = self.spark_controller.run_command(spark_store_command, session_name)
+            self.shell.user_ns[output_var] = df
+
+    async def execute_spark_async(self, cell, session_name):
+        """Runs a plain cell like execute_spark, without blocking the kernel's event loop while Livy works."""
+        (success, out) = await self.spark_controller.run_command_async(Command(cell), session_name)
+        self._display_spark_output(success, out)
+
+    def _display_spark_output(self, success, out):
         if not success:
             self.ipython_display.send_error(out)
+        elif isinstance(out, string_types):
+            self.ipython_display.write(out)
+        elif isinstance(out, dict):
+            df = convert_data_struct_to_dataframe(out)
+            html = df.fillna('NULL').astype(str).to_html(notebook=True)
+            self.ipython_display.html(html)
         else:
-            if isinstance(out, string_types):
-                self.ipython_display.write(out)
-            elif isinstance(out, dict):
-                df = convert_data_struct_to_dataframe(out)
-                html = df.fillna('NULL').astype(str).to_html(notebook=True)
-                self.ipython_display.html(html)
-            else:
-                self.ipython_display.write(out)
-            if output_var is not None:
-                spark_store_command = self._spark_store_command(output_var, samplemethod, maxrows, samplefraction, coerce)
-                df = self.spark_controller.run_command(spark_store_command, session_name)
-                self.shell.user_ns[output_var] = df
+            self.ipython_display.write(out)
 
     @staticmethod
     def _spark_store_command(output_var, samplemethod, maxrows, samplefraction, coerce):
@@ -11,6 +11,7 @@ import sparkmagic.utils.configuration as conf
 from sparkmagic.utils import constants
 from sparkmagic.utils.sparkevents import SparkEvents
 from sparkmagic.utils.sparklogger import SparkLog
+from sparkmagic.utils.metrics import read_snapshots, aggregate_snapshots, to_prometheus_text
 
 
 class ReconnectHandler(IPythonHandler):
@@ -150,6 +151,18 @@ class ReconnectHandler(IPythonHandler):
         return spark_events
 
 
+class MetricsHandler(IPythonHandler):
+    """Serves the sparkmagic metrics of all the kernels of the notebook server in the Prometheus text format. Each
+    kernel writes its metrics to the metrics spool directory when metrics_enabled is set; counters and histograms
+    are served per kernel, with a kernel label holding its pid."""
+
+    @web.authenticated
+    def get(self):
+        snapshots = read_snapshots(conf.metrics_spool_dir(), conf.metrics_max_age_seconds())
+        self.set_header(u"Content-Type", u"text/plain; version=0.0.4; charset=utf-8")
+        self.finish(to_prometheus_text(aggregate_snapshots(snapshots)))
+
+
 def load_jupyter_server_extension(nb_app):
     nb_app.log.info("sparkmagic extension enabled!")
     web_app = nb_app.web_app
@@ -158,6 +171,7 @@ def load_jupyter_server_extension(nb_app):
     host_pattern = '.*$'
 
     route_pattern_reconnect = url_path_join(base_url, '/reconnectsparkmagic')
-    handlers = [(route_pattern_reconnect, ReconnectHandler)]
+    route_pattern_metrics = url_path_join(base_url, '/metricssparkmagic')
+    handlers = [(route_pattern_reconnect, ReconnectHandler), (route_pattern_metrics, MetricsHandler)]
 
     web_app.add_handlers(host_pattern, handlers)
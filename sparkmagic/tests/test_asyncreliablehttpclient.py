@@ -0,0 +1,117 @@
+from mock import patch, MagicMock
+from nose.tools import raises, assert_equals, with_setup
+from tornado.ioloop import IOLoop
+
+from sparkmagic.livyclientlib.endpoint import Endpoint
+from sparkmagic.livyclientlib.exceptions import HttpClientException
+from sparkmagic.livyclientlib.linearretrypolicy import LinearRetryPolicy
+from sparkmagic.livyclientlib.asyncreliablehttpclient import AsyncReliableHttpClient
+from sparkmagic.livyclientlib.asynclivyreliablehttpclient import AsyncLivyReliableHttpClient
+import sparkmagic.livyclientlib.reliablehttpclient as reliablehttpclient
+import sparkmagic.utils.constants as constants
+
+retry_policy = None
+endpoint = Endpoint("http://url.com", constants.AUTH_BASIC, "username", "password")
+
+
+def _setup():
+    global retry_policy
+    retry_policy = LinearRetryPolicy(0.01, 5)
+    reliablehttpclient._circuit_breakers.clear()
+    reliablehttpclient._retry_budgets.clear()
+
+
+def _teardown():
+    pass
+
+
+def _fetch_returning(*responses):
+    responses = list(responses)
+    requests = []
+
+    async def fetch(request, raise_error=True):
+        requests.append(request)
+        return responses.pop(0)
+
+    return MagicMock(return_value=MagicMock(fetch=fetch)), requests
+
+
+def _response(code, body=b"{}"):
+    return MagicMock(code=code, body=body, error=None)
+
+
+@with_setup(_setup, _teardown)
+def test_get():
+    async_http_client, requests = _fetch_returning(_response(200, b'{"id": 1}'))
+    client = AsyncReliableHttpClient(endpoint, {"h": "v"}, retry_policy)
+
+    with patch("sparkmagic.livyclientlib.asyncreliablehttpclient.AsyncHTTPClient", async_http_client):
+        response = IOLoop.current().run_sync(lambda: client.get("r", [200]))
+
+    assert_equals(200, response.status_code)
+    assert_equals({"id": 1}, response.json())
+    assert_equals("http://url.com/r", requests[0].url)
+    assert_equals("GET", requests[0].method)
+    assert_equals("username", requests[0].auth_username)
+    assert_equals(10, requests[0].connect_timeout)
+    assert_equals(60, requests[0].request_timeout)
+
+
+@with_setup(_setup, _teardown)
+def test_post_sends_json():
+    async_http_client, requests = _fetch_returning(_response(201))
+    client = AsyncReliableHttpClient(endpoint, {}, retry_policy)
+
+    with patch("sparkmagic.livyclientlib.asyncreliablehttpclient.AsyncHTTPClient", async_http_client):
+        IOLoop.current().run_sync(lambda: client.post("r", [201], {"code": "1"}))
+
+    assert_equals(b'{"code": "1"}', requests[0].body)
+
+
+@with_setup(_setup, _teardown)
+def test_retries_server_errors():
+    async_http_client, requests = _fetch_returning(_response(503), _response(200))
+    client = AsyncReliableHttpClient(endpoint, {}, retry_policy)
+
+    with patch("sparkmagic.livyclientlib.asyncreliablehttpclient.AsyncHTTPClient", async_http_client):
+        response = IOLoop.current().run_sync(lambda: client.get("r", [200]))
+
+    assert_equals(200, response.status_code)
+    assert_equals(2, len(requests))
+
+
+@raises(HttpClientException)
+@with_setup(_setup, _teardown)
+def test_unexpected_status_code_raises():
+    async_http_client, requests = _fetch_returning(_response(404))
+    client = AsyncReliableHttpClient(endpoint, {}, retry_policy)
+
+    with patch("sparkmagic.livyclientlib.asyncreliablehttpclient.AsyncHTTPClient", async_http_client):
+        IOLoop.current().run_sync(lambda: client.get("r", [200]))
+
+
+@with_setup(_setup, _teardown)
+def test_kerberos_uses_sync_client_on_executor():
+    kerberos_endpoint = Endpoint("http://url.com", constants.AUTH_KERBEROS)
+    client = AsyncReliableHttpClient(kerberos_endpoint, {}, retry_policy)
+    client._sync_client = MagicMock()
+
+    response = IOLoop.current().run_sync(lambda: client.post("r", [201], {"code": "1"}))
+
+    client._sync_client.post.assert_called_once_with("r", [201], {"code": "1"},
+                                                      operation=constants.HTTP_OPERATION_DEFAULT)
+    assert response is client._sync_client.post.return_value
+
+
+def test_livy_client_get_statement():
+    http_client = MagicMock()
+
+    async def get(relative_url, accepted_status_codes, operation):
+        return MagicMock(json=MagicMock(return_value={"id": 3}))
+    http_client.get = MagicMock(side_effect=get)
+    livy_client = AsyncLivyReliableHttpClient(http_client, None)
+
+    out = IOLoop.current().run_sync(lambda: livy_client.get_statement(4, 3))
+
+    assert_equals({"id": 3}, out)
+    http_client.get.assert_called_once_with("/sessions/4/statements/3", [200], constants.HTTP_OPERATION_POLL)
@@ -0,0 +1,93 @@
+from nose.tools import assert_equals, raises
+
+from sparkmagic.livyclientlib.circuitbreaker import CircuitBreaker
+from sparkmagic.livyclientlib.exceptions import CircuitOpenException
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    circuit_breaker = CircuitBreaker(3, 30, Clock())
+
+    assert_equals(False, circuit_breaker.record_failure())
+    circuit_breaker.record_success()
+    assert_equals(False, circuit_breaker.record_failure())
+    assert_equals(False, circuit_breaker.record_failure())
+    assert_equals(True, circuit_breaker.record_failure())
+
+    assert_equals(CircuitBreaker.OPEN, circuit_breaker.state)
+    assert_equals(1, circuit_breaker.open_count)
+
+
+@raises(CircuitOpenException)
+def test_open_circuit_rejects_requests():
+    circuit_breaker = CircuitBreaker(1, 30, Clock())
+    circuit_breaker.record_failure()
+
+    circuit_breaker.before_request("http://url.com/r")
+
+
+def test_half_open_lets_one_probe_through():
+    clock = Clock()
+    circuit_breaker = CircuitBreaker(1, 30, clock)
+    circuit_breaker.record_failure()
+    clock.now = 30
+
+    circuit_breaker.before_request("http://url.com/r")
+
+    assert_equals(CircuitBreaker.HALF_OPEN, circuit_breaker.state)
+    try:
+        circuit_breaker.before_request("http://url.com/r")
+        assert False
+    except CircuitOpenException:
+        pass
+    assert_equals(1, circuit_breaker.rejected_count)
+
+
+def test_successful_probe_closes_circuit():
+    clock = Clock()
+    circuit_breaker = CircuitBreaker(1, 30, clock)
+    circuit_breaker.record_failure()
+    clock.now = 30
+    circuit_breaker.before_request("http://url.com/r")
+
+    circuit_breaker.record_success()
+
+    assert_equals(CircuitBreaker.CLOSED, circuit_breaker.state)
+    circuit_breaker.before_request("http://url.com/r")
+
+
+def test_failed_probe_opens_circuit_again():
+    clock = Clock()
+    circuit_breaker = CircuitBreaker(3, 30, clock)
+    for _ in range(3):
+        circuit_breaker.record_failure()
+    clock.now = 30
+    circuit_breaker.before_request("http://url.com/r")
+
+    assert_equals(True, circuit_breaker.record_failure())
+
+    assert_equals(CircuitBreaker.OPEN, circuit_breaker.state)
+    assert_equals(2, circuit_breaker.open_count)
+    clock.now = 59
+    try:
+        circuit_breaker.before_request("http://url.com/r")
+        assert False
+    except CircuitOpenException:
+        pass
+
+
+def test_disabled_breaker_never_opens():
+    circuit_breaker = CircuitBreaker(0, 30, Clock())
+
+    for _ in range(10):
+        circuit_breaker.record_failure()
+
+    assert_equals(CircuitBreaker.CLOSED, circuit_breaker.state)
+    circuit_breaker.before_request("http://url.com/r")
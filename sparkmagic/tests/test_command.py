@@ -1,10 +1,14 @@
+import getpass
+import json
 from mock import MagicMock
-from nose.tools import assert_equals, with_setup
+from nose.tools import assert_equals, with_setup, raises
+from tornado.ioloop import IOLoop
 
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils.constants import SESSION_KIND_SPARK
 from sparkmagic.livyclientlib.command import Command
 from sparkmagic.livyclientlib.livysession import LivySession
+from sparkmagic.livyclientlib.exceptions import HttpClientException, HttpClientStatusException
 from . import test_livysession as tls
 
 
@@ -112,6 +116,7 @@ def test_execute_failure_wait_for_session_emits_event():
     http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
     session = _create_session(kind=kind, http_client=http_client)
     session.start()
+    session._status_refreshed_at = None
     session.wait_for_idle = MagicMock(side_effect=ValueError("yo"))
     command = Command("command", spark_events=spark_events)
 
@@ -178,3 +183,285 @@ def test_execute_failure_get_statement_output_emits_event():
                                                                                    -1, False, "AttributeError",
                                                                                    "OHHHH")
         assert_equals(e, command._get_statement_output.side_effect)
+
+
+@with_setup(_setup)
+def test_execute_skips_wait_for_idle_when_recently_idle():
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    command = Command("command", spark_events=MagicMock())
+
+    result = command.execute(session)
+
+    assert_equals((True, tls.TestLivySession.pi_result), result)
+    assert_equals(0, session.wait_for_idle.call_count)
+    http_client.post_statement.assert_called_once_with(-1, {"code": command.code})
+
+
+@with_setup(_setup)
+def test_execute_waits_for_idle_when_cached_state_is_old():
+    conf.override_all({"session_state_cache_seconds": 0})
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session._status_refreshed_at -= 1
+    session.wait_for_idle = MagicMock()
+    command = Command("command", spark_events=MagicMock())
+
+    command.execute(session)
+
+    session.wait_for_idle.assert_called_once_with()
+
+
+@with_setup(_setup)
+def test_execute_refreshes_state_when_post_fails_on_cached_state():
+    http_client = MagicMock()
+    http_client.post_statement.side_effect = [HttpClientStatusException("409", 409),
+                                              tls.TestLivySession.post_statement_json]
+    http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    command = Command("command", spark_events=MagicMock())
+
+    result = command.execute(session)
+
+    assert_equals((True, tls.TestLivySession.pi_result), result)
+    session.wait_for_idle.assert_called_once_with()
+    assert_equals(2, http_client.post_statement.call_count)
+
+
+@raises(HttpClientException)
+@with_setup(_setup)
+def test_execute_does_not_repost_after_request_error():
+    http_client = MagicMock()
+    http_client.post_statement.side_effect = [HttpClientException("timed out"),
+                                              tls.TestLivySession.post_statement_json]
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    command = Command("command", spark_events=MagicMock())
+
+    try:
+        command.execute(session)
+    finally:
+        assert_equals(1, http_client.post_statement.call_count)
+
+
+@with_setup(_setup)
+def test_execute_completed_statement_marks_session_idle():
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session.wait_for_idle = MagicMock()
+    command = Command("command", spark_events=MagicMock())
+
+    command.execute(session)
+
+    assert session.is_recently_idle()
+
+
+def _async_returning(*values):
+    values = list(values)
+
+    async def coroutine(*args):
+        return values.pop(0) if len(values) > 1 else values[0]
+    return MagicMock(side_effect=coroutine)
+
+
+@with_setup(_setup)
+def test_execute_async():
+    spark_events = MagicMock()
+    conf.override_all({"statement_wait_policy": "fixed", "statement_wait_seconds_to_sleep_list": [0.01]})
+    session = _create_session(session_id=0, spark_events=MagicMock())
+    conf.override_all({})
+    session.wait_for_idle = MagicMock()
+    async_http_client = MagicMock()
+    async_http_client.get_session = _async_returning(dict(tls.TestLivySession.ready_sessions_json,
+                                                          proxyUser=getpass.getuser()))
+    async_http_client.post_statement = _async_returning(tls.TestLivySession.post_statement_json)
+    async_http_client.get_statement = _async_returning(tls.TestLivySession.running_statement_json,
+                                                       tls.TestLivySession.ready_statement_json)
+    session._async_http_client = async_http_client
+    command = Command("command", spark_events=spark_events)
+
+    result = IOLoop.current().run_sync(lambda: command.execute_async(session))
+
+    assert_equals((True, tls.TestLivySession.pi_result), result)
+    assert_equals(0, session.wait_for_idle.call_count)
+    async_http_client.get_session.assert_called_once_with(0)
+    async_http_client.post_statement.assert_called_once_with(0, {"code": command.code})
+    assert_equals(2, async_http_client.get_statement.call_count)
+    spark_events.emit_statement_execution_end_event.assert_called_once_with(session.guid, session.kind,
+                                                                            session.id, command.guid,
+                                                                            0, True, "", "")
+    assert_equals(1, spark_events.emit_statement_timing_event.call_count)
+    assert_equals(2, session.last_statement_timing.poll_count)
+    assert session.is_recently_idle()
+
+
+@with_setup(_setup)
+def test_execute_pipelined_posts_all_before_collecting():
+    spark_events = MagicMock()
+    http_client = MagicMock()
+    calls = []
+    http_client.post_statement.side_effect = lambda session_id, data: calls.append(("post", data["code"])) or \
+        {"id": len(calls) - 1}
+    http_client.get_statement.side_effect = lambda session_id, statement_id: calls.append(("get", statement_id)) or \
+        tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    commands = [Command("a", spark_events=spark_events), Command("b", spark_events=spark_events)]
+
+    results = Command.execute_pipelined(commands, session)
+
+    assert_equals([(True, tls.TestLivySession.pi_result)] * 2, results)
+    assert_equals([("post", "a"), ("post", "b"), ("get", 0), ("get", 1)], calls)
+    assert_equals(0, session.wait_for_idle.call_count)
+    assert_equals(2, spark_events.emit_statement_execution_end_event.call_count)
+
+
+@with_setup(_setup)
+def test_execute_pipelined_marks_session_idle_after_last_statement():
+    http_client = MagicMock()
+    statuses = []
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.side_effect = lambda session_id, statement_id: statuses.append(session.status) or \
+        tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.status = "busy"
+    commands = [Command("a", spark_events=MagicMock()), Command("b", spark_events=MagicMock())]
+    session.wait_for_idle = MagicMock()
+
+    Command.execute_pipelined(commands, session)
+
+    assert_equals(["busy", "busy"], statuses)
+    assert_equals("idle", session.status)
+
+
+@with_setup(_setup)
+def test_execute_pipelined_records_timing_of_each_command():
+    spark_events = MagicMock()
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = dict(tls.TestLivySession.ready_statement_json,
+                                                  started=1000, completed=3500)
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    commands = [Command("a", spark_events=spark_events), Command("b", spark_events=spark_events)]
+
+    Command.execute_pipelined(commands, session)
+
+    assert_equals(2, spark_events.emit_statement_timing_event.call_count)
+    for (command, timing_call) in zip(commands, spark_events.emit_statement_timing_event.call_args_list):
+        assert_equals(command.guid, timing_call[0][3])
+        assert_equals(2.5, timing_call[0][4]["server_seconds"])
+        assert_equals(1, timing_call[0][4]["poll_count"])
+    assert session.last_statement_timing.total_seconds is not None
+
+
+@with_setup(_setup)
+def test_execute_pipelined_refreshes_state_when_first_post_fails_on_cached_state():
+    http_client = MagicMock()
+    http_client.post_statement.side_effect = [HttpClientStatusException("409", 409),
+                                              tls.TestLivySession.post_statement_json,
+                                              tls.TestLivySession.post_statement_json]
+    http_client.get_statement.return_value = tls.TestLivySession.ready_statement_json
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    commands = [Command("a", spark_events=MagicMock()), Command("b", spark_events=MagicMock())]
+
+    results = Command.execute_pipelined(commands, session)
+
+    assert_equals([(True, tls.TestLivySession.pi_result)] * 2, results)
+    session.wait_for_idle.assert_called_once_with()
+    assert_equals(3, http_client.post_statement.call_count)
+
+
+@raises(HttpClientStatusException)
+@with_setup(_setup)
+def test_execute_pipelined_does_not_repost_later_commands():
+    http_client = MagicMock()
+    http_client.post_statement.side_effect = [tls.TestLivySession.post_statement_json,
+                                              HttpClientStatusException("409", 409),
+                                              tls.TestLivySession.post_statement_json]
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    session.wait_for_idle = MagicMock()
+    commands = [Command("a", spark_events=MagicMock()), Command("b", spark_events=MagicMock())]
+
+    try:
+        Command.execute_pipelined(commands, session)
+    finally:
+        assert_equals(0, session.wait_for_idle.call_count)
+        assert_equals(2, http_client.post_statement.call_count)
+
+
+@with_setup(_setup)
+def test_execute_pipelined_emits_failure_for_uncollected_commands():
+    spark_events = MagicMock()
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.side_effect = ValueError("boom")
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    commands = [Command("a", spark_events=spark_events), Command("b", spark_events=spark_events)]
+
+    try:
+        Command.execute_pipelined(commands, session)
+        assert False
+    except ValueError:
+        pass
+
+    assert_equals(2, spark_events.emit_statement_execution_end_event.call_count)
+    assert_equals(False, spark_events.emit_statement_execution_end_event.call_args[0][5])
+
+
+@with_setup(_setup)
+def test_execute_records_size_of_json_output():
+    output = {"schema": {"fields": []}, "data": [["a", 1]]}
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = {"id": 0, "state": "available",
+                                              "output": {"status": "ok", "execution_count": 0,
+                                                         "data": {"application/json": output}}}
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    command = Command("command", spark_events=MagicMock())
+
+    assert_equals((True, output), command.execute(session))
+
+    assert_equals(len(json.dumps(output)), session.last_statement_timing.payload_bytes)
+
+
+@with_setup(_setup)
+def test_execute_records_timing():
+    spark_events = MagicMock()
+    http_client = MagicMock()
+    http_client.post_statement.return_value = tls.TestLivySession.post_statement_json
+    http_client.get_statement.return_value = dict(tls.TestLivySession.ready_statement_json,
+                                                  started=1000, completed=3500)
+    session = _create_session(http_client=http_client)
+    session._record_status("idle")
+    command = Command("command", spark_events=spark_events)
+
+    command.execute(session)
+
+    timing = session.last_statement_timing
+    assert_equals(1, timing.poll_count)
+    assert_equals(2.5, timing.server_seconds)
+    assert_equals(len(tls.TestLivySession.pi_result), timing.payload_bytes)
+    assert timing.post_seconds is not None
+    assert timing.total_seconds is not None
+    spark_events.emit_statement_timing_event.assert_called_once_with(session.guid, session.kind, session.id,
+                                                                     command.guid, timing.to_dict())
@@ -1,4 +1,4 @@
-from mock import MagicMock
+from mock import MagicMock, patch
 from nose.tools import assert_equals, assert_not_equals, raises, with_setup
 import json
 
@@ -78,3 +78,67 @@ def test_share_config_between_pyspark_and_pyspark3():
     kpc = { 'username': 'U', 'password': 'P', 'base64_password': 'cGFzc3dvcmQ=', 'url': 'L', 'auth': AUTH_BASIC }
     overrides = { conf.kernel_python_credentials.__name__: kpc }
     assert_equals(conf.base64_kernel_python3_credentials(), conf.base64_kernel_python_credentials())
+
+
+def _user_config_response(yarn_queue):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"code": 0, "data": {"yarn_queue": yarn_queue}}
+    return response
+
+
+@with_setup(_setup)
+def test_get_user_config_is_cached():
+    conf.invalidate_user_config_cache()
+    with patch('sparkmagic.utils.configuration.requests.get', return_value=_user_config_response("q1")) as get:
+        assert_equals({"yarn_queue": "q1"}, conf.get_user_config())
+        assert_equals({conf.SPARK_YARN_QUEUE_PARAM: "q1"}, conf.get_user_yarn_queue_conf())
+
+        assert_equals(1, get.call_count)
+        assert_equals(conf.user_config_timeout_seconds(), get.call_args[1]["timeout"])
+
+        conf.invalidate_user_config_cache()
+        get.return_value = _user_config_response("q2")
+        assert_equals({"yarn_queue": "q2"}, conf.get_user_config())
+        assert_equals(2, get.call_count)
+    conf.invalidate_user_config_cache()
+
+
+@with_setup(_setup)
+def test_get_user_config_expired_without_revalidation():
+    conf.invalidate_user_config_cache()
+    conf.override(conf.user_config_cache_ttl_seconds.__name__, -1)
+    conf.override(conf.user_config_stale_while_revalidate.__name__, False)
+    with patch('sparkmagic.utils.configuration.requests.get', return_value=_user_config_response("q1")) as get:
+        conf.get_user_config()
+        get.side_effect = ValueError
+
+        # The API failing does not lose the config fetched before.
+        assert_equals({"yarn_queue": "q1"}, conf.get_user_config())
+        assert_equals(2, get.call_count)
+    conf.invalidate_user_config_cache()
+
+
+@with_setup(_setup)
+def test_get_user_config_stale_while_revalidate():
+    conf.invalidate_user_config_cache()
+    conf.override(conf.user_config_cache_ttl_seconds.__name__, -1)
+    with patch('sparkmagic.utils.configuration.requests.get', return_value=_user_config_response("q1")) as get, \
+            patch('sparkmagic.utils.configuration._revalidate_user_config') as revalidate:
+        conf.get_user_config()
+        get.return_value = _user_config_response("q2")
+
+        assert_equals({"yarn_queue": "q1"}, conf.get_user_config())
+        assert_equals(1, get.call_count)
+        assert_equals(1, revalidate.call_count)
+    conf.invalidate_user_config_cache()
+
+
+@with_setup(_setup)
+def test_get_http_timeouts_falls_back_to_default_operation():
+    conf.override(conf.http_timeouts.__name__, {"poll": [1, 2, 3], "default": [4, 5, 6]})
+
+    assert_equals((1, 2, 3), conf.get_http_timeouts("poll"))
+    assert_equals((4, 5, 6), conf.get_http_timeouts("logs"))
+
+    conf.override(conf.http_timeouts.__name__, {})
+    assert_equals((10, 60, 120), conf.get_http_timeouts("logs"))
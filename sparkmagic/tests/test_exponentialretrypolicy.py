@@ -0,0 +1,33 @@
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.exponentialretrypolicy import ExponentialRetryPolicy
+
+
+def _upper_bound(low, high):
+    return high
+
+
+def test_cap_doubles_up_to_max():
+    policy = ExponentialRetryPolicy(0.5, 30, 8, _upper_bound)
+
+    assert_equals(0.5, policy.seconds_to_sleep(0))
+    assert_equals(1, policy.seconds_to_sleep(1))
+    assert_equals(16, policy.seconds_to_sleep(5))
+    assert_equals(30, policy.seconds_to_sleep(6))
+    assert_equals(30, policy.seconds_to_sleep(1000))
+
+
+def test_sleep_is_jittered_below_cap():
+    policy = ExponentialRetryPolicy(0.5, 30, 8)
+
+    for retry_count in range(10):
+        seconds = policy.seconds_to_sleep(retry_count)
+        assert 0 <= seconds <= min(30, 0.5 * 2 ** retry_count)
+
+
+def test_should_retry():
+    policy = ExponentialRetryPolicy(0.5, 30, 8)
+
+    assert_equals(True, policy.should_retry(500, False, 8))
+    assert_equals(False, policy.should_retry(500, False, 9))
+    assert_equals(False, policy.should_retry(404, False, 0))
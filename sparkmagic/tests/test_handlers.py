@@ -6,7 +6,7 @@ from tornado.testing import gen_test
 from tornado.testing import AsyncTestCase
 import json
 
-from sparkmagic.serverextension.handlers import ReconnectHandler
+from sparkmagic.serverextension.handlers import ReconnectHandler, MetricsHandler
 from sparkmagic.kernels.kernelmagics import KernelMagics
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils import constants
@@ -222,3 +222,23 @@ class TestSparkMagicHandler(AsyncTestCase):
         self.kernel_manager.get_kernel.assert_not_called()
         _get_kernel_manager_new_session.assert_called_once_with(self.path, different_kernel)
         self.session_manager.delete_session.assert_called_once_with(self.session_id)
+
+
+@patch('sparkmagic.serverextension.handlers.read_snapshots')
+def test_metrics_handler_aggregates_kernels(read_snapshots):
+    read_snapshots.return_value = {u"1": [["sparkmagic_active_heartbeats", {}, 1],
+                                          ["sparkmagic_http_retries_total", {"status": "503"}, 2]],
+                                   u"2": [["sparkmagic_active_heartbeats", {}, 2]]}
+    MetricsHandler.__bases__ = (SimpleObject,)
+    metrics_handler = MetricsHandler()
+    metrics_handler.current_user = 'alex'
+    metrics_handler.set_header = MagicMock()
+    metrics_handler.finish = MagicMock()
+
+    metrics_handler.get()
+
+    read_snapshots.assert_called_once_with(conf.metrics_spool_dir(), conf.metrics_max_age_seconds())
+    metrics_handler.set_header.assert_called_once_with(u"Content-Type", u"text/plain; version=0.0.4; charset=utf-8")
+    text = metrics_handler.finish.call_args[0][0]
+    assert u"sparkmagic_active_heartbeats 3\n" in text
+    assert u'sparkmagic_http_retries_total{kernel="1",status="503"} 2\n' in text
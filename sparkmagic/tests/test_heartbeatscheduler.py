@@ -0,0 +1,112 @@
+from mock import MagicMock
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.heartbeatscheduler import HeartbeatScheduler, ScheduledHeartbeat
+from sparkmagic.livyclientlib.endpoint import Endpoint
+import sparkmagic.utils.constants as constants
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def _session(session_id, http_client, endpoint, heartbeat_timeout=60):
+    return MagicMock(id=session_id, http_client=http_client, endpoint=endpoint,
+                     properties={constants.LIVY_HEARTBEAT_TIMEOUT_PARAM: heartbeat_timeout})
+
+
+def _scheduler(clock):
+    scheduler = HeartbeatScheduler(10, 2, clock=clock)
+    scheduler._start_thread = MagicMock()
+    return scheduler
+
+
+def test_heartbeats_are_batched_per_endpoint():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    http_client = MagicMock()
+    listed = [{"id": 0, "state": "idle"}, {"id": 1, "state": "busy"}, {"id": 2, "state": "idle"}]
+    http_client.get_sessions.return_value = {"sessions": listed}
+    endpoint = Endpoint("http://url.com", constants.NO_AUTH)
+    sessions = [_session(0, http_client, endpoint), _session(1, http_client, endpoint)]
+    for session in sessions:
+        scheduler.register(session)
+
+    assert_equals(10, scheduler.run_due_heartbeats())
+    assert_equals(0, http_client.get_sessions.call_count)
+
+    clock.now = 10
+    assert_equals(10, scheduler.run_due_heartbeats())
+
+    http_client.get_sessions.assert_called_once_with()
+    sessions[0].update_status_and_info.assert_called_once_with(listed[0])
+    sessions[1].update_status_and_info.assert_called_once_with(listed[1])
+    assert_equals(0, sessions[0].refresh_status_and_info.call_count)
+    assert_equals(2, scheduler.heartbeat_count())
+
+
+def test_sessions_are_touched_every_third_of_their_timeout():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    http_client = MagicMock()
+    http_client.get_sessions.return_value = {"sessions": []}
+    session = _session(0, http_client, Endpoint("http://url.com", constants.NO_AUTH), heartbeat_timeout=60)
+    scheduler.register(session)
+
+    for now in (10, 20, 30, 40):
+        clock.now = now
+        scheduler.run_due_heartbeats()
+
+    assert_equals(4, http_client.get_sessions.call_count)
+    assert_equals(2, http_client.get_session_state.call_count)
+    http_client.get_session_state.assert_called_with(0)
+
+
+def test_failed_heartbeat_is_retried_sooner():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    http_client = MagicMock()
+    http_client.get_sessions.side_effect = ValueError
+    scheduler.register(_session(0, http_client, Endpoint("http://url.com", constants.NO_AUTH)))
+
+    clock.now = 10
+    assert_equals(2, scheduler.run_due_heartbeats())
+
+
+def test_failed_session_does_not_stop_heartbeat_of_others():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    http_client = MagicMock()
+    listed = [{"id": 0, "state": "idle"}, {"id": 1, "state": "idle"}]
+    http_client.get_sessions.return_value = {"sessions": listed}
+    endpoint = Endpoint("http://url.com", constants.NO_AUTH)
+    sessions = [_session(0, http_client, endpoint), _session(1, http_client, endpoint)]
+    sessions[0].update_status_and_info.side_effect = ValueError
+    for session in sessions:
+        scheduler.register(session)
+
+    clock.now = 10
+    assert_equals(10, scheduler.run_due_heartbeats())
+
+    sessions[1].update_status_and_info.assert_called_once_with(listed[1])
+
+
+def test_unregister():
+    scheduler = _scheduler(FakeClock())
+    endpoint = Endpoint("http://url.com", constants.NO_AUTH)
+    session = _session(0, MagicMock(), endpoint)
+    heartbeat = ScheduledHeartbeat(session, scheduler)
+
+    heartbeat.start()
+    heartbeat.start()
+    assert_equals(1, scheduler.heartbeat_count())
+    scheduler._start_thread.assert_called_with()
+
+    heartbeat.stop()
+    heartbeat.stop()
+    assert_equals(0, scheduler.heartbeat_count())
+    assert_equals(10, scheduler.run_due_heartbeats())
@@ -1,15 +1,18 @@
-from mock import MagicMock
+from mock import MagicMock, call
+import threading
 from nose.tools import with_setup, raises, assert_equals, assert_is
 from IPython.core.magic import magics_class
 
 import sparkmagic.utils.constants as constants
 import sparkmagic.utils.configuration as conf
 from sparkmagic.kernels.kernelmagics import KernelMagics
+import sparkmagic.magics.sparkmagicsbase as sparkmagicsbase
 from sparkmagic.livyclientlib.exceptions import LivyClientTimeoutException, BadUserDataException,\
     LivyUnexpectedStatusException, SessionManagementException,\
-    HttpClientException, DataFrameParseException, SqlContextNotFoundException
+    HttpClientException, DataFrameParseException, SqlContextNotFoundException, HttpClientStatusException
 from sparkmagic.livyclientlib.endpoint import Endpoint
 from sparkmagic.livyclientlib.command import Command
+from sparkmagic.livyclientlib.statementtiming import StatementTiming
 from sparkmagic.utils.constants import NO_AUTH, AUTH_BASIC
 
 magic = None
@@ -45,7 +48,8 @@ def _setup():
 
 
 def _teardown():
-    pass
+    sparkmagicsbase._session_bootstrap = None
+    sparkmagicsbase._session_bootstrap_display = None
 
 
 @with_setup(_setup, _teardown)
@@ -312,6 +316,57 @@ def test_logs():
     spark_controller.get_logs.assert_called_once_with()
 
 
+@with_setup(_setup, _teardown)
+def test_logs_tail():
+    magic.session_started = True
+    spark_controller.get_logs = MagicMock(return_value="c")
+
+    magic.logs("-t 1")
+
+    spark_controller.get_logs.assert_called_once_with(tail=1)
+    ipython_display.write.assert_called_once_with("c")
+
+
+@with_setup(_setup, _teardown)
+def test_logs_follow_until_session_ends():
+    magic.session_started = True
+    session = MagicMock(status=constants.IDLE_SESSION_STATUS)
+    spark_controller.get_session_by_name_or_default = MagicMock(return_value=session)
+    spark_controller.get_logs = MagicMock(return_value="a")
+
+    def refresh_status_and_info():
+        session.status = constants.DEAD_SESSION_STATUS
+    session.get_new_logs = MagicMock(return_value=["b", "c"])
+    session.refresh_status_and_info = MagicMock(side_effect=refresh_status_and_info)
+    conf.override_all({"logs_follow_interval_seconds": 0})
+
+    magic.logs("-f")
+
+    conf.override_all({})
+    assert_equals([call("a"), call("\nb\nc")], ipython_display.write.call_args_list)
+    session.refresh_status_and_info.assert_called_once_with()
+    # The lines followed are those of the session whose log was printed.
+    spark_controller.get_logs.assert_called_once_with()
+    spark_controller.get_session_by_name_or_default.assert_called_once_with(None)
+
+
+@with_setup(_setup, _teardown)
+def test_logs_follow_stops_when_session_is_deleted():
+    magic.session_started = True
+    session = MagicMock(status=constants.IDLE_SESSION_STATUS)
+    session.get_new_logs = MagicMock(return_value=[])
+    session.refresh_status_and_info = MagicMock(side_effect=HttpClientStatusException("not found", 404))
+    spark_controller.get_session_by_name_or_default = MagicMock(return_value=session)
+    spark_controller.get_logs = MagicMock(return_value="a")
+    conf.override_all({"logs_follow_interval_seconds": 0})
+
+    magic.logs("-f")
+
+    conf.override_all({})
+    session.refresh_status_and_info.assert_called_once_with()
+    assert_equals(0, ipython_display.send_error.call_count)
+
+
 @with_setup(_setup, _teardown)
 def test_logs_with_cell_content():
     logs = "logs"
@@ -865,6 +920,116 @@ def test_start_session_displays_fatal_error_when_session_throws():
     assert magic.fatal_error_message == conf.fatal_error_suggestion().format(str(e))
 
 
+@with_setup(_setup, _teardown)
+def test_init_livy_session_in_background_is_awaited_by_start_session():
+    release = threading.Event()
+    magic._get_or_create_session = MagicMock(side_effect=lambda language: release.wait(5))
+
+    magic._do_not_call_init_livy_session("-i python")
+    magic.session_started = True
+
+    assert not sparkmagicsbase._session_bootstrap.done()
+    release.set()
+    assert magic._do_not_call_start_session("")
+    magic._get_or_create_session.assert_called_once_with("python")
+    assert sparkmagicsbase._session_bootstrap is None
+
+
+@with_setup(_setup, _teardown)
+def test_init_livy_session_waits_for_session_in_background():
+    release = threading.Event()
+    calls = []
+
+    def get_or_create_session(language):
+        if not calls:
+            release.wait(5)
+        calls.append(language)
+        return "session_name"
+
+    magic._get_or_create_session = MagicMock(side_effect=get_or_create_session)
+    magic._do_not_call_init_livy_session("-i python")
+    threading.Timer(0.1, release.set).start()
+
+    assert_equals("session_name", magic.init_livy_session("python"))
+    assert_equals(["python", "python"], calls)
+    assert sparkmagicsbase._session_bootstrap is None
+
+
+@with_setup(_setup, _teardown)
+def test_init_livy_session_in_background_writes_to_waiting_cell():
+    release = threading.Event()
+
+    def get_or_create_session(language):
+        magic.spark_controller.ipython_display.writeln(u"Starting Spark application")
+        release.set()
+        return "session_name"
+
+    magic._get_or_create_session = MagicMock(side_effect=get_or_create_session)
+    magic._do_not_call_init_livy_session("-i python")
+    release.wait(5)
+
+    assert_equals(0, ipython_display.writeln.call_count)
+    assert_equals("session_name", magic.await_livy_session_bootstrap())
+    ipython_display.writeln.assert_called_once_with(u"Starting Spark application")
+
+    magic.spark_controller.ipython_display.writeln(u"later")
+    assert_equals(2, ipython_display.writeln.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_interrupted_wait_keeps_session_in_background():
+    bootstrap = MagicMock()
+    bootstrap.result.side_effect = KeyboardInterrupt
+    bootstrap.done.return_value = False
+    sparkmagicsbase._session_bootstrap = bootstrap
+
+    try:
+        magic._do_not_call_start_session("")
+        assert False
+    except KeyboardInterrupt:
+        pass
+
+    assert sparkmagicsbase._session_bootstrap is bootstrap
+
+
+@with_setup(_setup, _teardown)
+def test_init_livy_session_in_background_failure_is_fatal():
+    e = ValueError("YARN is full")
+    magic._get_or_create_session = MagicMock(side_effect=e)
+
+    magic._do_not_call_init_livy_session("-i python")
+
+    assert not magic._do_not_call_start_session("")
+    assert_equals(0, spark_controller.add_session.call_count)
+    assert magic.fatal_error
+    assert_equals(conf.fatal_error_suggestion().format(e), magic.fatal_error_message)
+    ipython_display.send_error.assert_called_once_with(magic.fatal_error_message)
+
+
+@with_setup(_setup, _teardown)
+def test_delete_session_deletes_session_created_in_background():
+    release = threading.Event()
+    magic._get_or_create_session = MagicMock(side_effect=lambda language: release.wait(5) and "session_name")
+
+    magic._do_not_call_init_livy_session("-i python")
+    threading.Timer(0.1, release.set).start()
+    magic._do_not_call_delete_session("")
+
+    spark_controller.delete_session_by_name.assert_called_once_with("session_name")
+    assert sparkmagicsbase._session_bootstrap is None
+
+
+@with_setup(_setup, _teardown)
+def test_init_livy_session_in_foreground():
+    conf.override(conf.init_livy_session_in_background.__name__, False)
+    magic.init_livy_session = MagicMock()
+
+    magic._do_not_call_init_livy_session("-i python")
+
+    magic.init_livy_session.assert_called_once_with("python")
+    assert sparkmagicsbase._session_bootstrap is None
+
+
 @with_setup(_setup, _teardown)
 def test_kernel_magics_names():
     """The magics machinery in IPython depends on the docstrings and
@@ -896,3 +1061,20 @@ def _assert_magic_failure_event_emitted_once(name, error):
     spark_events.emit_magic_execution_end_event.assert_called_once_with(name, constants.SESSION_KIND_PYSPARK,
                                                                         magic._generate_uuid.return_value, False,
                                                                         error.__class__.__name__, str(error))
+
+
+@with_setup(_setup, _teardown)
+def test_timing():
+    spark_controller.last_statement_timing = None
+    magic.timing("")
+    ipython_display.write.assert_called_once_with("No statement has run yet.")
+
+    # Shown whichever session ran the statement, even when the kernel's own session was not started.
+    timing = StatementTiming()
+    timing.poll_count = 3
+    spark_controller.last_statement_timing = timing
+
+    magic.timing("")
+
+    ipython_display.html.assert_called_once_with(timing.to_html())
+    assert "<td>poll_count</td><td>3</td>" in timing.to_html()
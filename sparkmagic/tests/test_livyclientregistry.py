@@ -0,0 +1,84 @@
+from mock import MagicMock, patch
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.livyclientregistry import LivyClientRegistry
+from sparkmagic.livyclientlib.endpoint import Endpoint
+import sparkmagic.utils.constants as constants
+
+
+endpoint = Endpoint("http://url.com", constants.NO_AUTH)
+other_endpoint = Endpoint("http://other.com", constants.NO_AUTH)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def _registry(clock):
+    registry = LivyClientRegistry(idle_ttl_seconds=10, clock=clock)
+    registry._create_client = MagicMock(side_effect=lambda e: MagicMock(endpoint=e, last_used_at=0))
+    return registry
+
+
+def test_get_client_reuses_client_per_endpoint():
+    registry = _registry(FakeClock())
+
+    client = registry.get_client(endpoint)
+
+    assert registry.get_client(Endpoint("http://url.com", constants.NO_AUTH)) is client
+    assert registry.get_client(other_endpoint) is not client
+    assert_equals(2, registry._create_client.call_count)
+
+
+def test_idle_clients_are_closed_after_ttl():
+    clock = FakeClock()
+    registry = _registry(clock)
+    client = registry.get_client(endpoint)
+
+    clock.now = 5
+    other_client = registry.get_client(other_endpoint)
+    clock.now = 11
+    new_client = registry.get_client(other_endpoint)
+
+    client.close.assert_called_once_with()
+    assert_equals(0, other_client.close.call_count)
+    assert new_client is other_client
+    assert registry.get_client(endpoint) is not client
+
+
+def test_clients_still_sending_requests_are_not_closed():
+    clock = FakeClock()
+    registry = _registry(clock)
+    client = registry.get_client(endpoint)
+
+    client.last_used_at = 8
+    clock.now = 11
+    registry.close_idle_clients()
+
+    assert_equals(0, client.close.call_count)
+    clock.now = 19
+    registry.close_idle_clients()
+    client.close.assert_called_once_with()
+
+
+def test_close_all():
+    registry = _registry(FakeClock())
+    client = registry.get_client(endpoint)
+
+    registry.close_all()
+
+    client.close.assert_called_once_with()
+    assert registry.get_client(endpoint) is not client
+
+
+def test_create_client_from_endpoint():
+    with patch('sparkmagic.livyclientlib.livyclientregistry.LivyReliableHttpClient') as livy_client:
+        registry = LivyClientRegistry(idle_ttl_seconds=10)
+        client = registry.get_client(endpoint)
+
+    assert_equals(livy_client.from_endpoint.return_value, client)
+    livy_client.from_endpoint.assert_called_once_with(endpoint)
@@ -8,6 +8,7 @@ import sparkmagic.utils.constants as constants
 from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
 from sparkmagic.livyclientlib.configurableretrypolicy import ConfigurableRetryPolicy
 from sparkmagic.livyclientlib.linearretrypolicy import LinearRetryPolicy
+from sparkmagic.livyclientlib.exponentialretrypolicy import ExponentialRetryPolicy
 
 
 def test_post_statement():
@@ -16,7 +17,7 @@ def test_post_statement():
     data = {"adlfj":"sadflkjsdf"}
     out = livy_client.post_statement(100, data)
     assert_equals(out, http_client.post.return_value.json.return_value)
-    http_client.post.assert_called_once_with("/sessions/100/statements", [201], data)
+    http_client.post.assert_called_once_with("/sessions/100/statements", [201], data, constants.HTTP_OPERATION_STATEMENT_POST)
 
 
 def test_get_statement():
@@ -24,7 +25,7 @@ def test_get_statement():
     livy_client = LivyReliableHttpClient(http_client, None)
     out = livy_client.get_statement(100, 4)
     assert_equals(out, http_client.get.return_value.json.return_value)
-    http_client.get.assert_called_once_with("/sessions/100/statements/4", [200])
+    http_client.get.assert_called_once_with("/sessions/100/statements/4", [200], constants.HTTP_OPERATION_POLL)
 
 
 def test_get_sessions():
@@ -32,7 +33,7 @@ def test_get_sessions():
     livy_client = LivyReliableHttpClient(http_client, None)
     out = livy_client.get_sessions()
     assert_equals(out, http_client.get.return_value.json.return_value)
-    http_client.get.assert_called_once_with("/sessions", [200])
+    http_client.get.assert_called_once_with("/sessions", [200], constants.HTTP_OPERATION_LIST)
 
 
 def test_post_session():
@@ -41,7 +42,7 @@ def test_post_session():
     properties = {"adlfj":"sadflkjsdf", 1: [2,3,4,5]}
     out = livy_client.post_session(properties)
     assert_equals(out, http_client.post.return_value.json.return_value)
-    http_client.post.assert_called_once_with("/sessions", [201], properties)
+    http_client.post.assert_called_once_with("/sessions", [201], properties, constants.HTTP_OPERATION_SESSION_CREATE)
 
 
 def test_get_session():
@@ -49,7 +50,15 @@ def test_get_session():
     livy_client = LivyReliableHttpClient(http_client, None)
     out = livy_client.get_session(4)
     assert_equals(out, http_client.get.return_value.json.return_value)
-    http_client.get.assert_called_once_with("/sessions/4", [200])
+    http_client.get.assert_called_once_with("/sessions/4", [200], constants.HTTP_OPERATION_POLL)
+
+
+def test_get_session_state():
+    http_client = MagicMock()
+    livy_client = LivyReliableHttpClient(http_client, None)
+    out = livy_client.get_session_state(4)
+    assert_equals(out, http_client.get.return_value.json.return_value)
+    http_client.get.assert_called_once_with("/sessions/4/state", [200], constants.HTTP_OPERATION_POLL)
 
 
 def test_delete_session():
@@ -64,7 +73,15 @@ def test_get_all_session_logs():
     livy_client = LivyReliableHttpClient(http_client, None)
     out = livy_client.get_all_session_logs(42)
     assert_equals(out, http_client.get.return_value.json.return_value)
-    http_client.get.assert_called_once_with("/sessions/42/log?from=0", [200])
+    http_client.get.assert_called_once_with("/sessions/42/log?from=0", [200], constants.HTTP_OPERATION_LOGS)
+
+
+def test_get_session_logs():
+    http_client = MagicMock()
+    livy_client = LivyReliableHttpClient(http_client, None)
+    out = livy_client.get_session_logs(42, 100, 50)
+    assert_equals(out, http_client.get.return_value.json.return_value)
+    http_client.get.assert_called_once_with("/sessions/42/log?from=100&size=50", [200], constants.HTTP_OPERATION_LOGS)
 
 
 def test_custom_headers():
@@ -95,6 +112,14 @@ def test_retry_policy():
     assert_equals(5, policy.seconds_to_sleep(1))
     assert_equals(5, policy.max_retries)
 
+    # Configure to exponential retry
+    _override_policy(constants.EXPONENTIAL_RETRY)
+    policy = LivyReliableHttpClient._get_retry_policy()
+    assert type(policy) is ExponentialRetryPolicy
+    assert_equals(conf.exponential_retry_initial_seconds(), policy.initial_seconds)
+    assert_equals(conf.exponential_retry_max_seconds(), policy.max_seconds)
+    assert_equals(conf.exponential_retry_policy_max_retries(), policy.max_retries)
+
     # Configure to something invalid
     _override_policy("garbage")
     try:
@@ -107,3 +132,10 @@ def test_retry_policy():
 def _override_policy(policy):
     overrides = { conf.retry_policy.__name__: policy }
     conf.override_all(overrides)
+
+
+def test_last_used_at():
+    http_client = MagicMock(last_used_at=12)
+    livy_client = LivyReliableHttpClient(http_client, None)
+
+    assert_equals(12, livy_client.last_used_at)
@@ -1,5 +1,7 @@
 ﻿import json
-from mock import MagicMock, call
+import getpass
+import tempfile
+from mock import MagicMock, call, patch
 from nose.tools import raises, assert_equals
 
 import sparkmagic.utils.constants as constants
@@ -110,19 +112,30 @@ class TestLivySession(object):
         assert session._heartbeat_thread is None
         assert constants.LIVY_HEARTBEAT_TIMEOUT_PARAM not in list(session.properties.keys())
         
-    def test_constructor_starts_heartbeat_with_existing_session(self):
+    def test_constructor_does_not_start_heartbeat_with_existing_session(self):
         conf.override_all({
             "heartbeat_refresh_seconds": 0.1
         })
         session_id = 1
         session = self._create_session(session_id=session_id)
         conf.override_all({})
-        
+
         assert session.id == session_id
-        assert self.heartbeat_thread.daemon
+        assert_equals(0, self.heartbeat_thread.start.call_count)
+        assert session._heartbeat_thread is None
+        assert session.properties[constants.LIVY_HEARTBEAT_TIMEOUT_PARAM ] > 0
+
+    def test_already_start_starts_heartbeat_with_existing_session(self):
+        conf.override_all({
+            "heartbeat_refresh_seconds": 0.1
+        })
+        session = self._create_session(session_id=1)
+        conf.override_all({})
+
+        session.already_start()
+
         self.heartbeat_thread.start.assert_called_once_with()
         assert not session._heartbeat_thread is None
-        assert session.properties[constants.LIVY_HEARTBEAT_TIMEOUT_PARAM ] > 0
         
     def test_start_with_heartbeat(self):
         self.http_client.post_session.return_value = self.session_create_json
@@ -252,7 +265,7 @@ class TestLivySession(object):
     def test_logs_gets_latest_logs(self):
         self.http_client.post_session.return_value = self.session_create_json
         self.http_client.get_session.return_value = self.ready_sessions_json
-        self.http_client.get_all_session_logs.return_value = self.log_json
+        self.http_client.get_session_logs.return_value = self.log_json
         self.http_client.get_statement.return_value = self.ready_statement_json
         session = self._create_session()
         session.start()
@@ -260,7 +273,58 @@ class TestLivySession(object):
         logs = session.get_logs()
 
         assert_equals("hi\nhi", logs)
-        self.http_client.get_all_session_logs.assert_called_with(0)
+        self.http_client.get_session_logs.assert_called_with(0, 0, 1000)
+
+    def test_get_logs_only_reads_new_lines(self):
+        self.http_client.get_session_logs.side_effect = [
+            {"id": 0, "from": 0, "total": 2, "log": ["a", "b"]},
+            {"id": 0, "from": 1, "total": 3, "log": ["b", "c"]}]
+        session = self._create_session(session_id=0)
+
+        assert_equals("a\nb", session.get_logs())
+        assert_equals("a\nb\nc", session.get_logs())
+
+        assert_equals([call(0, 0, 1000), call(0, 1, 1000)], self.http_client.get_session_logs.call_args_list)
+
+    def test_get_new_logs_after_livy_log_rolled_over(self):
+        self.http_client.get_session_logs.side_effect = [
+            {"id": 0, "from": 0, "total": 3, "log": ["a", "b", "c"]},
+            {"id": 0, "from": 2, "total": 3, "log": ["e"]},
+            {"id": 0, "from": 0, "total": 3, "log": ["c", "d", "e"]}]
+        session = self._create_session(session_id=0)
+
+        assert_equals(["a", "b", "c"], session.get_new_logs())
+        assert_equals(["d", "e"], session.get_new_logs())
+
+        assert_equals([call(0, 0, 1000), call(0, 2, 1000), call(0, 0, 1000)],
+                      self.http_client.get_session_logs.call_args_list)
+
+    def test_get_logs_reads_pages(self):
+        conf.override_all({"session_log_page_size": 2})
+        self.http_client.get_session_logs.side_effect = [
+            {"id": 0, "from": 0, "total": 3, "log": ["a", "b"]},
+            {"id": 0, "from": 2, "total": 3, "log": ["c"]}]
+        session = self._create_session(session_id=0)
+
+        new_lines = session.get_new_logs()
+        conf.override_all({})
+
+        assert_equals(["a", "b", "c"], new_lines)
+        assert_equals([call(0, 0, 2), call(0, 2, 2)], self.http_client.get_session_logs.call_args_list)
+
+    def test_get_logs_keeps_last_lines(self):
+        conf.override_all({"session_log_buffer_lines": 2})
+        self.http_client.get_session_logs.return_value = {"id": 0, "from": 0, "total": 3, "log": ["a", "b", "c"]}
+        session = self._create_session(session_id=0)
+        conf.override_all({})
+
+        assert_equals("b\nc", session.get_logs())
+
+    def test_get_logs_tail(self):
+        self.http_client.get_session_logs.return_value = {"id": 0, "from": 0, "total": 3, "log": ["a", "b", "c"]}
+        session = self._create_session(session_id=0)
+
+        assert_equals("c", session.get_logs(tail=1))
 
     def test_wait_for_idle_returns_when_in_state(self):
         self.http_client.post_session.return_value = self.session_create_json
@@ -290,7 +354,7 @@ class TestLivySession(object):
                                       self.ready_sessions_json]
         self.http_client.get_session.side_effect = self._next_session_response_get
         self.http_client.get_statement.return_value = self.ready_statement_json
-        self.http_client.get_all_session_logs.return_value = self.log_json
+        self.http_client.get_session_logs.return_value = self.log_json
 
         session = self._create_session()
         session.get_row_html = MagicMock()
@@ -309,7 +373,7 @@ class TestLivySession(object):
                                       self.busy_sessions_json,
                                       self.error_sessions_json]
         self.http_client.get_session.side_effect = self._next_session_response_get
-        self.http_client.get_all_session_logs.return_value = self.log_json
+        self.http_client.get_session_logs.return_value = self.log_json
 
         session = self._create_session()
         session.get_row_html = MagicMock()
@@ -349,6 +413,18 @@ class TestLivySession(object):
 
         assert_equals("dead", session.status)
 
+    def test_delete_session_releases_claim(self):
+        self.http_client.post_session.return_value = self.session_create_json
+        self.http_client.get_session.return_value = self.ready_sessions_json
+        self.http_client.get_statement.return_value = self.ready_statement_json
+        session = self._create_session()
+        session.start()
+
+        with patch("sparkmagic.utils.constants.LIVY_INFO_PATH", tempfile.mkdtemp()):
+            assert session.claim()
+            session.delete()
+            assert LivySession.claim_session(0)
+
     def test_delete_session_when_not_started(self):
         self.http_client.post_session.return_value = self.session_create_json
         session = self._create_session()
@@ -516,6 +592,38 @@ class TestLivySession(object):
         assert_equals(expected_url, driver_log_url)
         assert_equals(6, self.http_client.get_session.call_count)
 
+    def _session_json_with_app(self, app_id):
+        return {"id": 0, "state": "idle", "proxyUser": getpass.getuser(), "log": [], "appId": app_id,
+                "appInfo": {"driverLogUrl": "http://driver", "sparkUiUrl": "http://ui"}}
+
+    def test_app_metadata_cached_from_status_refresh(self):
+        session = self._create_session(session_id=0)
+        session.update_status_and_info(self._session_json_with_app("app_id_123"))
+
+        assert_equals("app_id_123", session.get_app_id())
+        assert_equals("http://ui", session.get_spark_ui_url())
+        assert_equals("http://driver", session.get_driver_log_url())
+        assert_equals(0, self.http_client.get_session.call_count)
+
+    def test_app_metadata_not_cached_before_app_starts(self):
+        self.http_client.get_session.return_value = self._session_json_with_app(None)
+        session = self._create_session(session_id=0)
+
+        assert_equals(None, session.get_app_id())
+        assert_equals(None, session.get_app_id())
+        assert_equals(2, self.http_client.get_session.call_count)
+
+    def test_invalidate_metadata(self):
+        self.http_client.get_session.return_value = self._session_json_with_app("app_id_456")
+        session = self._create_session(session_id=0)
+        session.update_status_and_info(self._session_json_with_app("app_id_123"))
+
+        session.invalidate_metadata()
+
+        assert_equals("app_id_456", session.get_app_id())
+        assert_equals("app_id_456", session.get_app_id())
+        assert_equals(1, self.http_client.get_session.call_count)
+
     def test_get_empty_spark_ui_url(self):
         self._verify_get_spark_ui_url("null", None)
 
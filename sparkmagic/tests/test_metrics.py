@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+from time import time
+
+from mock import MagicMock
+from nose.tools import assert_equals, with_setup
+
+from sparkmagic.livyclientlib.statementtiming import StatementTiming
+from sparkmagic.utils.metrics import SparkMetrics, read_snapshots, aggregate_snapshots, to_prometheus_text, \
+    STATEMENT_DURATION, HTTP_RETRIES, ACTIVE_HEARTBEATS, RESULT_ROWS, RESULT_BYTES, COERCE_DURATION
+
+spool_dir = None
+
+
+def _setup():
+    global spool_dir
+    spool_dir = tempfile.mkdtemp()
+
+
+def _teardown():
+    shutil.rmtree(spool_dir)
+
+
+def test_counters_and_gauges():
+    metrics = SparkMetrics()
+
+    metrics.increment(HTTP_RETRIES, status=u"503")
+    metrics.increment(HTTP_RETRIES, status=u"503")
+    metrics.increment(HTTP_RETRIES, status=u"error")
+    metrics.set(ACTIVE_HEARTBEATS, 3)
+    metrics.set(ACTIVE_HEARTBEATS, 2)
+
+    values = dict(((name, tuple(labels.items())), value) for (name, labels, value) in metrics.snapshot())
+    assert_equals({(HTTP_RETRIES, ((u"status", u"503"),)): 2, (HTTP_RETRIES, ((u"status", u"error"),)): 1,
+                   (ACTIVE_HEARTBEATS, ()): 2}, values)
+
+
+def test_observe_counts_buckets_sum_and_count():
+    metrics = SparkMetrics()
+
+    metrics.observe(RESULT_ROWS, 5)
+    metrics.observe(RESULT_ROWS, 10)
+    metrics.observe(RESULT_ROWS, 1e9)
+
+    [[name, labels, value]] = metrics.snapshot()
+    assert_equals(RESULT_ROWS, name)
+    assert_equals([0, 2, 0, 0, 0, 0, 0, 1e9 + 15, 3], value)
+
+
+def test_record_statement_timing():
+    metrics = SparkMetrics()
+    timing = StatementTiming()
+    timing.total_seconds = 2.0
+    timing.payload_bytes = 100
+    timing.coerce_seconds = 0.2
+
+    metrics.record_statement_timing(u"pyspark", timing, 7)
+
+    names = sorted((name, labels.get(u"kind")) for (name, labels, value) in metrics.snapshot())
+    assert_equals(sorted([(STATEMENT_DURATION, u"pyspark"), (RESULT_BYTES, None), (COERCE_DURATION, None),
+                          (RESULT_ROWS, None)]), names)
+
+
+def test_record_statement_timing_skips_missing_steps():
+    metrics = SparkMetrics()
+
+    metrics.record_statement_timing(u"spark", StatementTiming())
+
+    assert_equals([], metrics.snapshot())
+
+
+@with_setup(_setup, _teardown)
+def test_write_and_read_snapshots():
+    metrics = SparkMetrics(os.path.join(spool_dir, u"1.json"))
+    metrics._start_thread = MagicMock()
+    metrics.increment(HTTP_RETRIES, status=u"503")
+
+    metrics.write_snapshot()
+
+    assert_equals({u"1": [[HTTP_RETRIES, {u"status": u"503"}, 1]]}, read_snapshots(spool_dir, 60))
+    metrics.remove_snapshot()
+    assert_equals({}, read_snapshots(spool_dir, 60))
+
+
+@with_setup(_setup, _teardown)
+def test_read_snapshots_skips_stale_and_broken_files():
+    with open(os.path.join(spool_dir, u"1.json"), u"w") as f:
+        json.dump([[ACTIVE_HEARTBEATS, {}, 1]], f)
+    with open(os.path.join(spool_dir, u"2.json"), u"w") as f:
+        json.dump([[ACTIVE_HEARTBEATS, {}, 2]], f)
+    with open(os.path.join(spool_dir, u"3.json"), u"w") as f:
+        f.write(u"[[")
+    os.utime(os.path.join(spool_dir, u"2.json"), (time() - 120, time() - 120))
+
+    assert_equals({u"1": [[ACTIVE_HEARTBEATS, {}, 1]]}, read_snapshots(spool_dir, 60))
+
+
+def test_aggregate_snapshots_sums_gauges_and_labels_the_rest_by_kernel():
+    snapshots = {u"1": [[ACTIVE_HEARTBEATS, {}, 1], [RESULT_ROWS, {}, [1, 0, 0, 0, 0, 0, 0, 0, 1, 1]]],
+                 u"2": [[ACTIVE_HEARTBEATS, {}, 2], [RESULT_ROWS, {}, [0, 1, 0, 0, 0, 0, 0, 0, 10, 1]],
+                        [HTTP_RETRIES, {u"status": u"503"}, 3], [u"unknown", {}, 4]]}
+
+    totals = aggregate_snapshots(snapshots)
+
+    assert_equals({(ACTIVE_HEARTBEATS, ()): 3,
+                   (RESULT_ROWS, ((u"kernel", u"1"),)): [1, 0, 0, 0, 0, 0, 0, 0, 1, 1],
+                   (RESULT_ROWS, ((u"kernel", u"2"),)): [0, 1, 0, 0, 0, 0, 0, 0, 10, 1],
+                   (HTTP_RETRIES, ((u"kernel", u"2"), (u"status", u"503"))): 3}, totals)
+
+
+def test_to_prometheus_text():
+    totals = {(HTTP_RETRIES, ((u"status", u"503"),)): 2,
+              (STATEMENT_DURATION, ((u"kind", u"pyspark"),)): [0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1.05, 2]}
+
+    text = to_prometheus_text(totals)
+
+    assert u"# TYPE sparkmagic_http_retries_total counter\n" in text
+    assert u'sparkmagic_http_retries_total{status="503"} 2\n' in text
+    assert u"# TYPE sparkmagic_statement_duration_seconds histogram\n" in text
+    assert u'sparkmagic_statement_duration_seconds_bucket{kind="pyspark",le="0.01"} 0\n' in text
+    assert u'sparkmagic_statement_duration_seconds_bucket{kind="pyspark",le="0.05"} 1\n' in text
+    assert u'sparkmagic_statement_duration_seconds_bucket{kind="pyspark",le="1"} 2\n' in text
+    assert u'sparkmagic_statement_duration_seconds_bucket{kind="pyspark",le="+Inf"} 2\n' in text
+    assert u'sparkmagic_statement_duration_seconds_sum{kind="pyspark"} 1.05\n' in text
+    assert u'sparkmagic_statement_duration_seconds_count{kind="pyspark"} 2\n' in text
+    assert u"sparkmagic_active_heartbeats" not in text
+
+
+def test_to_prometheus_text_without_metrics():
+    assert_equals(u"", to_prometheus_text({}))
@@ -1,7 +1,10 @@
+from mock import patch
+from nose.tools import assert_equals
 from pandas.util.testing import assert_frame_equal
 import pandas as pd
 
-from sparkmagic.utils.utils import coerce_pandas_df_to_numeric_datetime
+import sparkmagic.utils.configuration as conf
+from sparkmagic.utils.utils import coerce_pandas_df_to_numeric_datetime, clear_coerce_schema_cache
 
 
 def test_no_coercing():
@@ -140,3 +143,47 @@ def test_all_null_columns():
     df = pd.DataFrame(records)
     coerce_pandas_df_to_numeric_datetime(df)
     assert_frame_equal(desired_df, df)
+
+
+def test_sampled_coercing_falls_back_when_column_does_not_convert():
+    conf.override(conf.coerce_sample_size.__name__, 2)
+    try:
+        records = [{u'temp_diff': u'{}'.format(i)} for i in range(10)] + [{u'temp_diff': u'0adsf'}]
+        desired_df = pd.DataFrame(records)
+
+        df = pd.DataFrame(records)
+        coerce_pandas_df_to_numeric_datetime(df)
+
+        assert_frame_equal(desired_df, df)
+    finally:
+        conf.override_all({})
+
+
+def test_coercing_schema_is_cached_per_key():
+    clear_coerce_schema_cache()
+    records = [{u'date': u'6/1/13', u'temp_diff': u'12', u'name': u'asdf'}]
+
+    coerce_pandas_df_to_numeric_datetime(pd.DataFrame(records), u"select * from t")
+
+    with patch('sparkmagic.utils.utils._sample_coerce_types') as sample_coerce_types:
+        df = pd.DataFrame(records)
+        coerce_pandas_df_to_numeric_datetime(df, u"select * from t")
+
+        assert_equals(0, sample_coerce_types.call_count)
+    desired_df = pd.DataFrame(records)
+    desired_df["date"] = pd.to_datetime(desired_df["date"])
+    desired_df["temp_diff"] = pd.to_numeric(desired_df["temp_diff"])
+    assert_frame_equal(desired_df, df)
+
+
+def test_cached_coercing_schema_is_reclassified_when_it_does_not_apply():
+    clear_coerce_schema_cache()
+    coerce_pandas_df_to_numeric_datetime(pd.DataFrame([{u'temp_diff': u'12'}]), u"select * from t")
+
+    records = [{u'temp_diff': u'6/1/13'}]
+    desired_df = pd.DataFrame(records)
+    desired_df["temp_diff"] = pd.to_datetime(desired_df["temp_diff"])
+    df = pd.DataFrame(records)
+    coerce_pandas_df_to_numeric_datetime(df, u"select * from t")
+
+    assert_frame_equal(desired_df, df)
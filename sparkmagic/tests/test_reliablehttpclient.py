@@ -7,10 +7,14 @@ import requests
 from requests_kerberos.kerberos_ import HTTPKerberosAuth
 
 from sparkmagic.livyclientlib.endpoint import Endpoint
-from sparkmagic.livyclientlib.exceptions import HttpClientException
+from sparkmagic.livyclientlib.exceptions import HttpClientException, CircuitOpenException
 from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
 from sparkmagic.livyclientlib.linearretrypolicy import LinearRetryPolicy
-from sparkmagic.livyclientlib.reliablehttpclient import ReliableHttpClient
+from sparkmagic.livyclientlib.reliablehttpclient import ReliableHttpClient, close_pooled_session
+import sparkmagic.livyclientlib.reliablehttpclient as reliablehttpclient
+from sparkmagic.livyclientlib.circuitbreaker import CircuitBreaker
+from sparkmagic.livyclientlib.retrybudget import RetryBudget
+import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
 
 retry_policy = None
@@ -22,10 +26,13 @@ endpoint = Endpoint("http://url.com", constants.AUTH_BASIC, "username", "passwor
 def _setup():
     global retry_policy
     retry_policy = LinearRetryPolicy(0.01, 5)
+    reliablehttpclient._circuit_breakers.clear()
+    reliablehttpclient._retry_budgets.clear()
+    conf.override_all({})
 
 
 def _teardown():
-    pass
+    conf.override_all({})
 
 
 def return_sequential():
@@ -56,7 +63,7 @@ def test_compose_url():
 
 @with_setup(_setup, _teardown)
 def test_get():
-    with patch('requests.get') as patched_get:
+    with patch('requests.Session.get') as patched_get:
         type(patched_get.return_value).status_code = 200
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -69,7 +76,7 @@ def test_get():
 @raises(HttpClientException)
 @with_setup(_setup, _teardown)
 def test_get_throws():
-    with patch('requests.get') as patched_get:
+    with patch('requests.Session.get') as patched_get:
         type(patched_get.return_value).status_code = 500
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -84,7 +91,7 @@ def test_get_will_retry():
     retry_policy.should_retry.return_value = True
     retry_policy.seconds_to_sleep.return_value = 0.01
 
-    with patch('requests.get') as patched_get:
+    with patch('requests.Session.get') as patched_get:
         # When we call assert_equals in this unit test, the side_effect is executed.
         # So, the last status_code should be repeated.
         sequential_values = [500, 200, 200]
@@ -102,7 +109,7 @@ def test_get_will_retry():
 
 @with_setup(_setup, _teardown)
 def test_post():
-    with patch('requests.post') as patched_post:
+    with patch('requests.Session.post') as patched_post:
         type(patched_post.return_value).status_code = 200
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -115,7 +122,7 @@ def test_post():
 @raises(HttpClientException)
 @with_setup(_setup, _teardown)
 def test_post_throws():
-    with patch('requests.post') as patched_post:
+    with patch('requests.Session.post') as patched_post:
         type(patched_post.return_value).status_code = 500
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -130,7 +137,7 @@ def test_post_will_retry():
     retry_policy.should_retry.return_value = True
     retry_policy.seconds_to_sleep.return_value = 0.01
 
-    with patch('requests.post') as patched_post:
+    with patch('requests.Session.post') as patched_post:
         # When we call assert_equals in this unit test, the side_effect is executed.
         # So, the last status_code should be repeated.
         sequential_values = [500, 200, 200]
@@ -148,7 +155,7 @@ def test_post_will_retry():
 
 @with_setup(_setup, _teardown)
 def test_delete():
-    with patch('requests.delete') as patched_delete:
+    with patch('requests.Session.delete') as patched_delete:
         type(patched_delete.return_value).status_code = 200
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -161,7 +168,7 @@ def test_delete():
 @raises(HttpClientException)
 @with_setup(_setup, _teardown)
 def test_delete_throws():
-    with patch('requests.delete') as patched_delete:
+    with patch('requests.Session.delete') as patched_delete:
         type(patched_delete.return_value).status_code = 500
 
         client = ReliableHttpClient(endpoint, {}, retry_policy)
@@ -176,7 +183,7 @@ def test_delete_will_retry():
     retry_policy.should_retry.return_value = True
     retry_policy.seconds_to_sleep.return_value = 0.01
 
-    with patch('requests.delete') as patched_delete:
+    with patch('requests.Session.delete') as patched_delete:
         # When we call assert_equals in this unit test, the side_effect is executed.
         # So, the last status_code should be repeated.
         sequential_values = [500, 200, 200]
@@ -199,7 +206,7 @@ def test_will_retry_error_no():
     retry_policy.should_retry.return_value = False
     retry_policy.seconds_to_sleep.return_value = 0.01
 
-    with patch('requests.get') as patched_get:
+    with patch('requests.Session.get') as patched_get:
         patched_get.side_effect = requests.exceptions.ConnectionError()
         client = ReliableHttpClient(endpoint, {}, retry_policy)
 
@@ -232,3 +239,105 @@ def test_kerberos_auth_check_auth():
     client = ReliableHttpClient(endpoint, {}, retry_policy)
     assert_is_not_none(client._auth)
     assert isinstance(client._auth, HTTPKerberosAuth)
+
+
+@with_setup(_setup, _teardown)
+def test_clients_share_pooled_session_per_endpoint():
+    client = ReliableHttpClient(endpoint, {}, retry_policy)
+    same_endpoint_client = ReliableHttpClient(Endpoint("http://url.com", constants.AUTH_BASIC, "username", "password"),
+                                              {}, retry_policy)
+    other_endpoint_client = ReliableHttpClient(Endpoint("http://other.com", constants.NO_AUTH), {}, retry_policy)
+
+    assert client._session is same_endpoint_client._session
+    assert client._session is not other_endpoint_client._session
+
+
+@with_setup(_setup, _teardown)
+def test_close_pooled_session():
+    client = ReliableHttpClient(endpoint, {}, retry_policy)
+    session = client._session
+    close_pooled_session(endpoint)
+
+    assert session is not client._session
+    assert client._session is ReliableHttpClient(endpoint, {}, retry_policy)._session
+
+
+@with_setup(_setup, _teardown)
+def test_open_circuit_fails_fast():
+    reliablehttpclient._circuit_breakers[endpoint] = CircuitBreaker(2, 60)
+    with patch('requests.Session.get') as patched_get:
+        type(patched_get.return_value).status_code = 500
+        client = ReliableHttpClient(endpoint, {}, MagicMock(should_retry=MagicMock(return_value=False)))
+
+        for _ in range(2):
+            try:
+                client.get("r", [200])
+                assert False
+            except HttpClientException as e:
+                assert not isinstance(e, CircuitOpenException)
+
+        try:
+            client.get("r", [200])
+            assert False
+        except CircuitOpenException:
+            pass
+
+        assert_equals(2, patched_get.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_client_errors_do_not_open_circuit():
+    reliablehttpclient._circuit_breakers[endpoint] = CircuitBreaker(1, 60)
+    with patch('requests.Session.delete') as patched_delete:
+        type(patched_delete.return_value).status_code = 404
+        client = ReliableHttpClient(endpoint, {}, retry_policy)
+
+        client.delete("r", [200, 404])
+        client.delete("r", [200, 404])
+
+        assert_equals(2, patched_delete.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_retry_budget_stops_retries():
+    reliablehttpclient._retry_budgets[endpoint] = RetryBudget(1, 60)
+    with patch('requests.Session.get') as patched_get:
+        type(patched_get.return_value).status_code = 500
+        client = ReliableHttpClient(endpoint, {}, retry_policy)
+
+        try:
+            client.get("r", [200])
+            assert False
+        except HttpClientException:
+            pass
+
+        assert_equals(2, patched_get.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_requests_have_timeouts_of_operation():
+    conf.override(conf.http_timeouts.__name__, {constants.HTTP_OPERATION_POLL: [3, 7, 60]})
+    with patch('requests.Session.get') as patched_get:
+        type(patched_get.return_value).status_code = 200
+        client = ReliableHttpClient(endpoint, {}, retry_policy)
+
+        client.get("r", [200], constants.HTTP_OPERATION_POLL)
+
+        assert_equals((3, 7), patched_get.call_args[1]["timeout"])
+
+
+@with_setup(_setup, _teardown)
+def test_deadline_stops_retries():
+    conf.override(conf.http_timeouts.__name__, {constants.HTTP_OPERATION_DEFAULT: [3, 7, 0.05]})
+    with patch('requests.Session.get') as patched_get:
+        type(patched_get.return_value).status_code = 500
+        client = ReliableHttpClient(endpoint, {}, LinearRetryPolicy(0.03, 5))
+
+        try:
+            client.get("r", [200])
+            assert False
+        except HttpClientException:
+            pass
+
+        assert_equals(2, patched_get.call_count)
+        assert patched_get.call_args[1]["timeout"][1] <= 0.05
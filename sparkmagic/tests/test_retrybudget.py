@@ -0,0 +1,36 @@
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.retrybudget import RetryBudget
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_budget_is_spent_within_window():
+    clock = Clock()
+    retry_budget = RetryBudget(2, 60, clock)
+
+    assert_equals(True, retry_budget.try_spend())
+    clock.now = 10
+    assert_equals(True, retry_budget.try_spend())
+    assert_equals(False, retry_budget.try_spend())
+    assert_equals(1, retry_budget.exhausted_count)
+
+
+def test_budget_is_refilled_as_window_slides():
+    clock = Clock()
+    retry_budget = RetryBudget(2, 60, clock)
+    retry_budget.try_spend()
+    clock.now = 10
+    retry_budget.try_spend()
+
+    clock.now = 60
+    assert_equals(True, retry_budget.try_spend())
+    assert_equals(False, retry_budget.try_spend())
+    clock.now = 70
+    assert_equals(True, retry_budget.try_spend())
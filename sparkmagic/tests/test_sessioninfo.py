@@ -0,0 +1,60 @@
+from mock import MagicMock, patch
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.sessioninfo import SessionInfo
+from sparkmagic.livyclientlib.livysession import LivySession
+
+
+session_json = {"id": 4, "state": "idle", "kind": "pyspark", "proxyUser": "me", "log": ["a", "b"],
+                "appId": "application_1", "appInfo": {"driverLogUrl": "http://driver", "sparkUiUrl": "http://ui"}}
+
+
+def test_session_info_from_listing():
+    http_client = MagicMock()
+    session_info = SessionInfo(http_client, session_json)
+
+    assert_equals(4, session_info.id)
+    assert_equals("pyspark", session_info.kind)
+    assert_equals("idle", session_info.status)
+    assert_equals("me", session_info.proxy_user)
+    assert_equals("a\nb", session_info.session_info)
+    assert_equals("application_1", session_info.get_app_id())
+    assert_equals("http://driver", session_info.get_driver_log_url())
+    assert_equals("http://ui", session_info.get_spark_ui_url())
+    assert http_client.endpoint is session_info.endpoint
+    assert_equals(0, len(http_client.method_calls))
+
+
+def test_session_info_has_no_instance_dict():
+    session_info = SessionInfo(MagicMock(), session_json)
+
+    assert not hasattr(session_info, "__dict__")
+
+
+def test_session_info_update():
+    session_info = SessionInfo(MagicMock(), {"id": 4, "state": "mystery"})
+
+    session_info.update(session_json)
+
+    assert_equals("idle", session_info.status)
+    assert_equals("application_1", session_info.get_app_id())
+
+
+def test_session_info_loads_extra_session_properties_once():
+    session_info = SessionInfo(MagicMock(), session_json)
+    extra_session_properties = {"session_name": "name", "session_language": "python", "spark.yarn.queue": "q"}
+
+    with patch.object(LivySession, "load_extra_session_properties",
+                      return_value=extra_session_properties) as load_extra_session_properties:
+        assert_equals("name", session_info.session_name)
+        assert_equals("python", session_info.session_language)
+        assert_equals("q", session_info.spark_yarn_queue)
+
+    load_extra_session_properties.assert_called_once_with(4)
+
+
+def test_session_info_row_html_marks_current_session():
+    session_info = SessionInfo(MagicMock(), session_json)
+
+    assert u"✔" in session_info.get_row_html(4)
+    assert u"✔" not in session_info.get_row_html(5)
@@ -0,0 +1,74 @@
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.sessioninitscript import SessionInitScript, INIT_REPLY_MARKER
+import sparkmagic.utils.constants as constants
+
+
+def _run_pyspark(script, namespace):
+    printed = []
+    namespace["print"] = printed.append
+    exec(script.to_command().code, namespace)
+    return u"\n".join(printed)
+
+
+class _Context(object):
+    def __init__(self):
+        self.queries = []
+
+    def sql(self, query):
+        self.queries.append(query)
+
+    def __repr__(self):
+        return u"<pyspark.sql.context.HiveContext>"
+
+
+def test_supported_kinds():
+    assert SessionInitScript(constants.SESSION_KIND_PYSPARK).is_supported()
+    assert SessionInitScript(constants.SESSION_KIND_SPARK).is_supported()
+    assert not SessionInitScript(constants.SESSION_KIND_SPARKR).is_supported()
+    assert not SessionInitScript(constants.SESSION_KIND_SQL).is_supported()
+
+
+def test_pyspark_script_finds_spark_and_switches_database():
+    spark = _Context()
+    script = SessionInitScript(constants.SESSION_KIND_PYSPARK, u"my_db", u"x = 1")
+    namespace = {u"spark": spark}
+
+    reply = SessionInitScript.parse_reply(_run_pyspark(script, namespace))
+
+    assert_equals({u"context": u"spark", u"hive": False, u"database": u"my_db", u"init_error": None}, reply)
+    assert_equals([u"use my_db"], spark.queries)
+
+
+def test_pyspark_script_falls_back_to_sql_context():
+    script = SessionInitScript(constants.SESSION_KIND_PYSPARK3)
+
+    reply = SessionInitScript.parse_reply(_run_pyspark(script, {u"sqlContext": _Context()}))
+
+    assert_equals(u"sqlContext", reply[u"context"])
+    assert reply[u"hive"]
+
+
+def test_pyspark_script_reports_init_code_error():
+    script = SessionInitScript(constants.SESSION_KIND_PYSPARK, init_code=u"raise ValueError('boom')")
+
+    reply = SessionInitScript.parse_reply(_run_pyspark(script, {}))
+
+    assert_equals(None, reply[u"context"])
+    assert_equals(u"ValueError: boom", reply[u"init_error"])
+
+
+def test_scala_script():
+    script = SessionInitScript(constants.SESSION_KIND_SPARK, u"my_db", u"val x = 1")
+
+    assert_equals(u'spark\n'
+                  u'spark.sql("use my_db")\n'
+                  u'println("""' + INIT_REPLY_MARKER +
+                  u'{"context": "spark", "hive": false, "database": "my_db", "init_error": null}""")',
+                  script.to_command().code)
+    assert not script.runs_init_code()
+
+
+def test_parse_reply_without_reply():
+    assert_equals(None, SessionInitScript.parse_reply(u"some output"))
+    assert_equals(None, SessionInitScript.parse_reply(INIT_REPLY_MARKER + u"{not json"))
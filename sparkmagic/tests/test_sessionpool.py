@@ -0,0 +1,95 @@
+from mock import MagicMock
+from nose.tools import assert_equals
+
+from sparkmagic.livyclientlib.sessionpool import LivySessionPool, POOLED_SESSION_NAME_PREFIX
+from sparkmagic.livyclientlib.endpoint import Endpoint
+import sparkmagic.utils.constants as constants
+
+
+endpoint = Endpoint("http://url.com", constants.NO_AUTH)
+properties = {"kind": "pyspark", "session_language": "python", "conf": {constants.SPARK_YARN_QUEUE_PARAM: "q"}}
+
+
+def _session(name, status=constants.IDLE_SESSION_STATUS, language="python", queue="q", saved_at=100):
+    session = MagicMock(session_name=name, status=status, session_language=language, spark_yarn_queue=queue)
+    session.extra_session_properties_saved_at.return_value = saved_at
+    session.claim.return_value = True
+    return session
+
+
+def _pool(sessions, pool_size=2, max_sessions_per_user=5):
+    controller = MagicMock()
+    controller.get_all_sessions_endpoint.return_value = sessions
+    return LivySessionPool(controller, pool_size=pool_size, max_idle_seconds=60,
+                           max_sessions_per_user=max_sessions_per_user, clock=lambda: 120)
+
+
+def test_acquire_takes_matching_idle_session():
+    other_queue = _session(POOLED_SESSION_NAME_PREFIX + "1", queue="other")
+    busy = _session(POOLED_SESSION_NAME_PREFIX + "2", status=constants.STARTING_SESSION_STATUS)
+    taken = _session(POOLED_SESSION_NAME_PREFIX + "3")
+    taken_elsewhere = _session(POOLED_SESSION_NAME_PREFIX + "4")
+    taken_elsewhere.claim.return_value = False
+    pool = _pool([_session("session_name-1"), other_queue, busy, taken_elsewhere, taken])
+    pool._refill_in_background = MagicMock()
+
+    session = pool.acquire(endpoint, properties, "session_name-2")
+
+    pool._spark_controller.session_from_info.assert_called_once_with(taken)
+    assert session is pool._spark_controller.session_from_info.return_value
+    session.rename.assert_called_once_with("session_name-2")
+    assert_equals(0, other_queue.claim.call_count)
+    assert_equals(0, busy.claim.call_count)
+    pool._refill_in_background.assert_called_once_with(endpoint, properties)
+
+
+def test_acquire_without_pooled_session():
+    pool = _pool([_session("session_name-1")])
+    pool._refill_in_background = MagicMock()
+
+    assert pool.acquire(endpoint, properties, "session_name-2") is None
+
+
+def test_idle_pooled_sessions_expire():
+    expired = _session(POOLED_SESSION_NAME_PREFIX + "1", saved_at=10)
+    pool = _pool([expired])
+    pool._refill_in_background = MagicMock()
+
+    assert pool.acquire(endpoint, properties, "session_name-2") is None
+    pool._spark_controller.session_from_info.assert_called_once_with(expired)
+    pool._spark_controller.session_from_info.return_value.delete.assert_called_once_with()
+
+
+def test_refill_starts_sessions_up_to_pool_size():
+    sessions = [_session(POOLED_SESSION_NAME_PREFIX + "1")]
+    pool = _pool(sessions, pool_size=3)
+    pool._start_pooled_session = MagicMock(side_effect=lambda e, p: sessions.append(
+        _session(POOLED_SESSION_NAME_PREFIX + "new", status=constants.STARTING_SESSION_STATUS)) or True)
+
+    pool.refill(endpoint, properties)
+
+    assert_equals(2, pool._start_pooled_session.call_count)
+
+
+def test_refill_respects_user_quota():
+    sessions = [_session("session_name-1"), _session(POOLED_SESSION_NAME_PREFIX + "1")]
+    pool = _pool(sessions, pool_size=3, max_sessions_per_user=2)
+    pool._start_pooled_session = MagicMock(return_value=True)
+
+    pool.refill(endpoint, properties)
+
+    assert_equals(0, pool._start_pooled_session.call_count)
+
+
+def test_start_pooled_session_names_session():
+    pool = _pool([])
+    session = MagicMock()
+    pool._spark_controller._livy_session.return_value = session
+
+    assert pool._start_pooled_session(endpoint, properties)
+
+    (http_client, session_properties, display) = pool._spark_controller._livy_session.call_args[0]
+    assert session_properties["session_name"].startswith(POOLED_SESSION_NAME_PREFIX)
+    assert_equals(0, pool._spark_controller._livy_session.call_args[1]["heartbeat_timeout"])
+    assert "session_name" not in properties
+    session.start.assert_called_once_with()
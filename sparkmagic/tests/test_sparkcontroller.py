@@ -1,9 +1,12 @@
 from mock import MagicMock, patch
-from nose.tools import with_setup, assert_equals, raises
+import threading
+from nose.tools import with_setup, assert_equals, assert_is, raises
 import json
+from tornado.ioloop import IOLoop
 
 from sparkmagic.livyclientlib.sparkcontroller import SparkController
 from sparkmagic.livyclientlib.endpoint import Endpoint
+from sparkmagic.livyclientlib.sessioninfo import SessionInfo
 from sparkmagic.livyclientlib.exceptions import SessionManagementException, HttpClientException
 import sparkmagic.utils.configuration as conf
 from sparkmagic.utils.constants import NO_AUTH
@@ -38,7 +41,7 @@ def _setup():
     controller.spark_events = spark_events
 
 def _teardown():
-    pass
+    SparkController.last_statement_timing = None
 
 @with_setup(_setup, _teardown)
 def test_add_session():
@@ -57,6 +60,27 @@ def test_add_session():
     session.start.assert_called_once()
 
 
+@with_setup(_setup, _teardown)
+def test_add_session_database_switched_by_init_script():
+    conf.override(conf.switch_to_user_database.__name__, True)
+    conf.override(conf.user_database.__name__, "my_db")
+    session = MagicMock(current_database="my_db")
+    controller._livy_session = MagicMock(return_value=session)
+    controller._http_client = MagicMock(return_value=MagicMock())
+    controller.run_sqlquery = MagicMock()
+
+    controller.add_session("name", Endpoint("http://location:port", NO_AUTH), False, {"kind": "spark"})
+
+    session.start.assert_called_once_with()
+    assert_equals(0, controller.run_sqlquery.call_count)
+
+    session.current_database = None
+    controller.add_session("name", Endpoint("http://location:port", NO_AUTH), False, {"kind": "spark"})
+
+    assert_equals(1, controller.run_sqlquery.call_count)
+    conf.override_all({})
+
+
 @with_setup(_setup, _teardown)
 def test_add_session_skip():
     name = "name"
@@ -107,6 +131,34 @@ def test_run_cell():
     command.execute.assert_called_with(default_client)
 
 
+@with_setup(_setup, _teardown)
+def test_run_cell_records_last_statement_timing_for_every_controller():
+    session = MagicMock()
+    client_manager.get_any_session = MagicMock(return_value=session)
+    other_controller = SparkController(ipython_display)
+
+    controller.run_command(MagicMock(), None)
+
+    assert_is(session.last_statement_timing, other_controller.last_statement_timing)
+
+
+@with_setup(_setup, _teardown)
+def test_run_cell_async():
+    session = MagicMock()
+    client_manager.get_session = MagicMock(return_value=session)
+    command = MagicMock()
+
+    async def execute_async(session_to_use):
+        return True, u"out"
+    command.execute_async = MagicMock(side_effect=execute_async)
+
+    result = IOLoop.current().run_sync(lambda: controller.run_command_async(command, "session_name"))
+
+    assert_equals((True, u"out"), result)
+    command.execute_async.assert_called_once_with(session)
+    assert_is(session.last_statement_timing, controller.last_statement_timing)
+
+
 @with_setup(_setup, _teardown)
 def test_run_sql():
     default_client = MagicMock()
@@ -143,11 +195,54 @@ def test_get_all_sessions():
     assert len(sessions) == 2
 
 
+@with_setup(_setup, _teardown)
+def test_get_all_sessions_uses_listed_state():
+    http_client = MagicMock()
+    http_client.get_sessions.return_value = {"from": 0, "total": 3, "sessions": [
+        {"id": 0, "state": "idle", "kind": "spark", "proxyUser": "me", "log": []},
+        {"id": 1, "state": "mystery", "kind": "spark", "proxyUser": "me", "log": []},
+        {"id": 2, "state": "idle", "kind": "spark", "proxyUser": "someone_else", "log": []}]}
+    http_client.get_session.return_value = {"id": 1, "state": "busy", "kind": "spark", "proxyUser": "me", "log": []}
+    controller._http_client = MagicMock(return_value=http_client)
+    controller._livy_session = MagicMock()
+
+    with patch('getpass.getuser', return_value="me"):
+        sessions = controller.get_all_sessions_endpoint("conn_str")
+
+    assert_equals([1, 0], [s.id for s in sessions])
+    assert_equals(["busy", "idle"], [s.status for s in sessions])
+    http_client.get_session.assert_called_once_with(1)
+    assert_equals(0, controller._livy_session.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_session_from_info():
+    http_client = MagicMock()
+    session_info = SessionInfo(http_client, {"id": 3, "state": "idle", "kind": "pyspark", "log": []})
+    session = MagicMock()
+    controller._livy_session = MagicMock(return_value=session)
+
+    assert session is controller.session_from_info(session_info)
+
+    controller._livy_session.assert_called_once_with(http_client, {"kind": "pyspark"}, ipython_display, 3)
+    assert_equals("idle", session.status)
+    assert_equals(0, session.already_start.call_count)
+
+
+def test_livy_session_without_heartbeat_timeout():
+    session = SparkController._livy_session(MagicMock(), {"kind": "pyspark"}, MagicMock(), heartbeat_timeout=0)
+
+    assert "heartbeatTimeoutInSecond" not in session.properties
+    session._start_heartbeat_thread()
+    assert session._heartbeat_thread is None
+
+
 @with_setup(_setup, _teardown)
 def test_cleanup_endpoint():
     s0 = MagicMock()
     s1 = MagicMock()
-    controller.get_all_sessions_endpoint = MagicMock(return_value=[s0, s1])
+    controller.get_all_sessions_endpoint = MagicMock(return_value=["info0", "info1"])
+    controller.session_from_info = MagicMock(side_effect=lambda info: {"info0": s0, "info1": s1}[info])
 
     controller.cleanup_endpoint("conn_str")
 
@@ -259,3 +354,83 @@ def test_add_session_throws_when_session_start_fails():
     except ValueError as ex:
         assert str(ex) == str(e)
         session.start.assert_called_once()
+
+
+@with_setup(_setup, _teardown)
+def test_create_livy_session_takes_pooled_session():
+    pooled_session = MagicMock(current_database=conf.user_database())
+    controller._session_pool = MagicMock(enabled=True)
+    controller._session_pool.acquire.return_value = pooled_session
+    controller.add_session = MagicMock()
+    controller.switch_user_database = MagicMock()
+
+    with patch('sparkmagic.livyclientlib.sparkcontroller.build_endpoint') as build_endpoint, \
+            patch('sparkmagic.utils.configuration.get_session_properties', return_value={"conf": {}}):
+        name = controller.create_livy_session(1, "python", "me")
+
+    assert_equals(controller.generate_livy_session_name(1), name)
+    controller._session_pool.acquire.assert_called_once_with(build_endpoint.return_value, {
+        "conf": {}, "proxyUser": "me", "session_language": "python", "session_name": name}, name)
+    client_manager.add_session.assert_called_once_with(name, pooled_session)
+    pooled_session.already_start.assert_called_once_with()
+    # The pooled session switched to the user database when it started.
+    assert_equals(0, controller.switch_user_database.call_count)
+    assert_equals(0, controller.add_session.call_count)
+
+
+@with_setup(_setup, _teardown)
+def test_create_livy_session_switches_database_of_pooled_session():
+    pooled_session = MagicMock(current_database=None)
+    controller._session_pool = MagicMock(enabled=True)
+    controller._session_pool.acquire.return_value = pooled_session
+    controller.switch_user_database = MagicMock()
+    conf.override_all({"user_database": "db"})
+
+    with patch('sparkmagic.livyclientlib.sparkcontroller.build_endpoint'), \
+            patch('sparkmagic.utils.configuration.get_session_properties', return_value={"conf": {}}):
+        name = controller.create_livy_session(1, "python", "me")
+
+    conf.override_all({})
+    controller.switch_user_database.assert_called_once_with(name)
+
+
+@with_setup(_setup, _teardown)
+def test_run_on_sessions_runs_sessions_concurrently():
+    sessions = {"a": MagicMock(), "b": MagicMock()}
+    client_manager.get_sessions_list.return_value = ["a", "b"]
+    client_manager.get_session.side_effect = lambda name: sessions[name]
+    # Only returns once both sessions are executing at the same time.
+    barrier = threading.Barrier(2, timeout=5)
+    statement = MagicMock()
+    statement.execute.side_effect = lambda session: barrier.wait() is not None and session
+    second_statement = MagicMock()
+    second_statement.execute.side_effect = ValueError("boom")
+
+    futures = controller.run_on_sessions([statement, second_statement])
+
+    assert_equals(["a", "b"], list(futures.keys()))
+    assert futures["a"][0].result(timeout=5) is sessions["a"]
+    assert futures["b"][0].result(timeout=5) is sessions["b"]
+    assert isinstance(futures["a"][1].exception(timeout=5), ValueError)
+
+
+@with_setup(_setup, _teardown)
+def test_run_on_sessions_of_endpoints():
+    endpoint = Endpoint("http://url.com", NO_AUTH)
+    sessions = {"a": MagicMock(endpoint=endpoint), "b": MagicMock(endpoint=Endpoint("http://other.com", NO_AUTH))}
+    client_manager.get_session.side_effect = lambda name: sessions[name]
+    statement = MagicMock()
+
+    futures = controller.run_on_sessions([statement], client_names=["a", "b"], endpoints=[endpoint])
+
+    assert_equals(["a"], list(futures.keys()))
+    assert futures["a"][0].result(timeout=5) is statement.execute.return_value
+    statement.execute.assert_called_once_with(sessions["a"])
+
+
+@raises(SessionManagementException)
+@with_setup(_setup, _teardown)
+def test_run_on_sessions_without_sessions():
+    client_manager.get_sessions_list.return_value = []
+
+    controller.run_on_sessions([MagicMock()])
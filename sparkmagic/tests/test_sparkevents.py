@@ -1,10 +1,10 @@
 from hdijupyterutils.constants import INSTANCE_ID, EVENT_NAME, TIMESTAMP
 from hdijupyterutils.utils import get_instance_id, generate_uuid
-from nose.tools import with_setup, raises
-from mock import MagicMock
+from nose.tools import with_setup, raises, assert_equals
+from mock import MagicMock, call
 
 import sparkmagic.utils.constants as constants
-from sparkmagic.utils.sparkevents import SparkEvents
+from sparkmagic.utils.sparkevents import SparkEvents, SparkEventsBus, get_events_bus
 
 
 def _setup():
@@ -305,3 +305,90 @@ def test_magic_verify_language_ok():
 @raises(AssertionError)
 def test_magic_verify_language_ok_error():
     SparkEvents()._verify_language_ok('NYARGLEBARGLE')
+
+
+@with_setup(_setup, _teardown)
+def test_emit_statement_timing_event():
+    language = constants.SESSION_KIND_SPARK
+    session_id = 7
+    timing = {"poll_count": 2, "server_seconds": 1.5}
+
+    kwargs_list = [(INSTANCE_ID, get_instance_id()),
+                   (EVENT_NAME, constants.STATEMENT_TIMING_EVENT),
+                   (TIMESTAMP, time_stamp),
+                   (constants.SESSION_GUID, guid1),
+                   (constants.LIVY_KIND, language),
+                   (constants.SESSION_ID, session_id),
+                   (constants.STATEMENT_GUID, guid2),
+                   (constants.TIMING, '{"poll_count": 2, "server_seconds": 1.5}')]
+
+    spark_events.emit_statement_timing_event(guid1, language, session_id, guid2, timing)
+
+    spark_events._verify_language_ok.assert_called_once_with(language)
+    spark_events.handler.handle_event.assert_called_once_with(kwargs_list)
+
+
+def test_events_bus_hands_events_to_handler():
+    handler = MagicMock()
+    bus = SparkEventsBus(handler, 10, 5)
+
+    bus.handle_event([("a", 1)])
+    bus.handle_event([("b", 2)])
+
+    assert bus.flush()
+    assert_equals([call([("a", 1)]), call([("b", 2)])], handler.handle_event.call_args_list)
+
+
+def test_events_bus_drops_events_when_full():
+    handler = MagicMock()
+    bus = SparkEventsBus(handler, 1, 5)
+    # Keep the writer from running, so that the queue stays full.
+    bus._start_thread = MagicMock()
+
+    bus.handle_event([("a", 1)])
+    bus.handle_event([("b", 2)])
+
+    assert_equals(1, bus.dropped_count)
+    assert_equals(0, handler.handle_event.call_count)
+
+
+def test_events_bus_keeps_going_after_handler_error():
+    handler = MagicMock()
+    handler.handle_event.side_effect = [ValueError("boom"), None]
+    bus = SparkEventsBus(handler, 10, 5)
+
+    bus.handle_event([("a", 1)])
+    bus.handle_event([("b", 2)])
+
+    assert bus.flush()
+    assert_equals(2, handler.handle_event.call_count)
+    handler.logger.error.assert_called_once_with(u"The events handler failed to handle 1 events, most recently "
+                                                 u"with: boom")
+
+
+def test_events_bus_logs_handler_errors_at_most_once_per_interval():
+    handler = MagicMock()
+    handler.handle_event.side_effect = ValueError("boom")
+    bus = SparkEventsBus(handler, 10, 1)
+    # The batches are handed over directly rather than through the queue.
+    bus._queue = MagicMock()
+
+    bus._handle_batch([[("a", 1)]])
+    bus._handle_batch([[("b", 2)]])
+    bus._handle_batch([[("c", 3)]])
+
+    assert_equals(1, handler.logger.error.call_count)
+    assert_equals(2, bus.failed_count)
+
+    bus._failures_logged_at -= SparkEventsBus.FAILURES_LOG_INTERVAL_SECONDS
+    bus._handle_batch([[("d", 4)]])
+
+    assert_equals(2, handler.logger.error.call_count)
+    assert_equals(call(u"The events handler failed to handle 3 events, most recently with: boom"),
+                  handler.logger.error.call_args)
+    assert_equals(0, bus.failed_count)
+
+
+def test_spark_events_share_events_bus():
+    assert SparkEvents().handler is SparkEvents().handler
+    assert SparkEvents().handler is get_events_bus()
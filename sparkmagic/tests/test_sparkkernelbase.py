@@ -1,8 +1,11 @@
 from mock import MagicMock, call
 from nose.tools import with_setup
+from tornado.ioloop import IOLoop
 
 from sparkmagic.utils.constants import LANG_PYTHON
+from sparkmagic.livyclientlib.exceptions import HttpClientException
 from sparkmagic.kernels.wrapperkernel.sparkkernelbase import SparkKernelBase
+from sparkmagic.kernels.wrapperkernel.usercodeparser import UserCodeParser
 
 
 kernel = None
@@ -32,7 +35,7 @@ def _setup():
 
 
 def _teardown():
-    pass
+    kernel.shell.magics_manager.registry.pop(u"RemoteSparkMagics", None)
 
 
 @with_setup(_setup, _teardown)
@@ -144,3 +147,50 @@ def test_delete_session():
 
     assert call("%%_do_not_call_delete_session\n ", True, False) in execute_cell_mock.mock_calls
 
+
+
+def _spark_magics():
+    async def execute_spark_async(*args):
+        pass
+
+    magics = MagicMock()
+    magics.init_livy_session.return_value = u"session"
+    magics.execute_spark_async = MagicMock(side_effect=execute_spark_async)
+    kernel.shell.magics_manager.registry[u"RemoteSparkMagics"] = magics
+    kernel.user_code_parser = UserCodeParser()
+    return magics
+
+
+@with_setup(_setup, _teardown)
+def test_execute_awaits_plain_spark_cells():
+    magics = _spark_magics()
+
+    ret = IOLoop.current().run_sync(lambda: kernel.do_execute(code, False))
+
+    magics.init_livy_session.assert_called_once_with(LANG_PYTHON)
+    magics.execute_spark_async.assert_called_once_with(code, u"session")
+    assert ret is execute_cell_mock.return_value
+    execute_cell_mock.assert_called_once_with("None", False, True, None, False)
+    assert ipython_display.send_error.call_count == 0
+
+
+@with_setup(_setup, _teardown)
+def test_execute_reports_expected_errors_of_awaited_cells():
+    magics = _spark_magics()
+    magics.init_livy_session.side_effect = HttpClientException("no livy")
+
+    ret = IOLoop.current().run_sync(lambda: kernel.do_execute(code, False))
+
+    assert ret is execute_cell_mock.return_value
+    assert magics.execute_spark_async.call_count == 0
+    assert ipython_display.send_error.call_count == 1
+
+
+@with_setup(_setup, _teardown)
+def test_execute_runs_magics_synchronously():
+    magics = _spark_magics()
+
+    ret = kernel.do_execute("%%sql\nshow tables", False)
+
+    assert ret is execute_cell_mock.return_value
+    assert magics.execute_spark_async.call_count == 0
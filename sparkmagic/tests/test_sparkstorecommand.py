@@ -1,5 +1,5 @@
 # coding=utf-8
-from mock import MagicMock, call
+from mock import MagicMock, call, ANY
 from nose.tools import with_setup, assert_equals, assert_false, assert_raises
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
@@ -208,7 +208,7 @@ def test_execute_code():
     result = sparkcommand.execute(session)
     
     sparkcommand.to_command.assert_called_once_with(session.kind, variable_name)
-    sparkcommand.to_command.return_value.execute.assert_called_once_with(session)
+    sparkcommand.to_command.return_value.execute.assert_called_once_with(session, ANY)
 
 
 @with_setup(_setup, _teardown)
@@ -223,3 +223,31 @@ def test_unicode():
     assert_equals(sparkcommand._scala_command(variable_name),
                   Command(u'{}.toJSON.take(120).foreach(println)'.format(variable_name)))
 
+
+@with_setup(_setup, _teardown)
+def test_pyspark_columnar_command():
+    variable_name = "var_name"
+    sparkcommand = SparkStoreCommand(variable_name, samplemethod='take', maxrows=100, result_format='columnar')
+    assert_equals(sparkcommand.to_command("pyspark", variable_name).code,
+                  u'import json\n'
+                  u'{0}_df = var_name\n'
+                  u'{0}_rows = {0}_df.take(100)\n'
+                  u'print(json.dumps({{"columns": {0}_df.columns, "fields": {0}_df.schema.jsonValue()["fields"], '
+                  u'"data": [[r[i] for r in {0}_rows] for i in range(len({0}_df.columns))]}}, default=str))'
+                  .format(LONG_RANDOM_VARIABLE_NAME))
+
+
+@with_setup(_setup, _teardown)
+def test_execute_code_columnar():
+    variable_name = "abc"
+    sparkcommand = SparkStoreCommand(variable_name, "take", 100, 0.2, spark_events=MagicMock(), result_format='columnar')
+    sparkcommand.to_command = MagicMock(return_value=MagicMock())
+    result = """{"columns": ["z", "y"], "data": [[100, 25], [50, 10]]}"""
+    sparkcommand.to_command.return_value.execute = MagicMock(return_value=(True, result))
+    session = MagicMock()
+    session.kind = "pyspark"
+
+    df = sparkcommand.execute(session)
+
+    assert_equals([[100, 50], [25, 10]], df.values.tolist())
+    assert_equals(["z", "y"], list(df.columns))
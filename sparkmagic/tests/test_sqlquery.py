@@ -1,5 +1,5 @@
 ﻿# coding=utf-8
-from mock import MagicMock, call
+from mock import MagicMock, call, ANY
 from nose.tools import with_setup, assert_equals, assert_false, raises
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
@@ -165,7 +165,7 @@ def test_execute_sql():
     session.kind = "pyspark"
     result = sqlquery.execute(session)
     assert_frame_equal(result, result_data)
-    sqlquery.to_command.return_value.execute.assert_called_once_with(session)
+    sqlquery.to_command.return_value.execute.assert_called_once_with(session, ANY)
     spark_events.emit_sql_execution_start_event.assert_called_once_with(session.guid, session.kind,
                                                                          session.id, sqlquery.guid,
                                                                         'take', 100, 0.2)
@@ -190,7 +190,7 @@ def test_execute_sql_no_results():
     session.kind = "spark"
     result = sqlquery.execute(session)
     assert_frame_equal(result, result_data)
-    sqlquery.to_command.return_value.execute.assert_called_once_with(session)
+    sqlquery.to_command.return_value.execute.assert_called_once_with(session, ANY)
     spark_events.emit_sql_execution_start_event.assert_called_once_with(session.guid, session.kind,
                                                                          session.id, sqlquery.guid,
                                                                          sqlquery.samplemethod, sqlquery.maxrows,
@@ -213,7 +213,7 @@ def test_execute_sql_failure_emits_event():
         result = sqlquery.execute(session)
         assert False
     except ValueError:
-        sqlquery.to_command.return_value.execute.assert_called_once_with(session)
+        sqlquery.to_command.return_value.execute.assert_called_once_with(session, ANY)
         spark_events.emit_sql_execution_end_event.assert_called_once_with(session.guid, session.kind,
                                                                            session.id, sqlquery.guid,
                                                                            sqlquery.to_command.return_value.guid,
@@ -303,3 +303,43 @@ def test_r_livy_sql_options_spark2():
         sqlquery = SQLQuery(query, samplemethod='sample', samplefraction=0.33, maxrows=3234)
         assert_equals(sqlquery._r_command("spark"),
                       Command('for ({} in (jsonlite:::toJSON(take(sample(sql("{}"), FALSE, 0.33),3234)))) {{cat({})}}'.format(LONG_RANDOM_VARIABLE_NAME, query, LONG_RANDOM_VARIABLE_NAME)))
+
+
+@with_setup(_setup, _teardown)
+def test_pyspark_columnar_command():
+    sqlquery = SQLQuery("abc", samplemethod='sample', samplefraction=0.5, maxrows=120, result_format='columnar')
+    assert_equals(sqlquery.to_command("pyspark", "spark"),
+                  Command(u'import json\n'
+                          u'{0}_df = spark.sql(u"""abc """).sample(False, 0.5)\n'
+                          u'{0}_rows = {0}_df.take(120)\n'
+                          u'print(json.dumps({{"columns": {0}_df.columns, "fields": {0}_df.schema.jsonValue()["fields"], '
+                          u'"data": [[r[i] for r in {0}_rows] for i in range(len({0}_df.columns))]}}, default=str))'
+                          .format(LONG_RANDOM_VARIABLE_NAME)))
+
+    sqlquery = SQLQuery("abc", maxrows=-1, result_format='columnar')
+    assert u'{0}_rows = {0}_df.collect()'.format(LONG_RANDOM_VARIABLE_NAME) in sqlquery.to_command("pyspark", "spark").code
+
+
+@with_setup(_setup, _teardown)
+def test_columnar_format_falls_back_for_scala():
+    sqlquery = SQLQuery("abc", maxrows=120, result_format='columnar')
+    assert_equals(sqlquery.to_command("spark", "spark"), sqlquery._scala_command("spark"))
+
+
+@with_setup(_setup, _teardown)
+@raises(BadUserDataException)
+def test_sqlquery_rejects_bad_result_format():
+    SQLQuery("abc", result_format="xml")
+
+
+@with_setup(_setup, _teardown)
+def test_execute_sql_columnar():
+    sqlquery = SQLQuery("HERE IS THE QUERY", "take", 100, 0.2, spark_events=MagicMock(), result_format='columnar')
+    sqlquery.to_command = MagicMock(return_value=MagicMock())
+    result = """{"columns": ["z", "nullv", "y"], "data": [[100, 25], [null, null], [50, 10]]}"""
+    sqlquery.to_command.return_value.execute = MagicMock(return_value=(True, result))
+    result_data = pd.DataFrame([{'z': 100, "nullv": None, 'y': 50}, {'z':25, "nullv":None, 'y':10}], columns=['z', "nullv", 'y'])
+    session = MagicMock()
+    session.kind = "pyspark"
+    result = sqlquery.execute(session)
+    assert_frame_equal(result, result_data)
@@ -0,0 +1,51 @@
+from nose.tools import assert_equals, assert_almost_equals, raises
+
+from sparkmagic.livyclientlib.statementwaitpolicy import FixedStatementWaitPolicy, AdaptiveStatementWaitPolicy
+from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
+
+
+def test_fixed_policy_ignores_progress():
+    policy = FixedStatementWaitPolicy([0.2, 0.5, 1])
+
+    assert_equals(0.2, policy.seconds_to_sleep(1, 0.5, 10))
+    assert_equals(0.5, policy.seconds_to_sleep(2, 0.99, 10))
+    assert_equals(1, policy.seconds_to_sleep(3))
+    assert_equals(1, policy.seconds_to_sleep(100, 0.1, 1))
+
+
+def test_adaptive_policy_backs_off_without_progress():
+    policy = AdaptiveStatementWaitPolicy(0.1, 1)
+
+    assert_almost_equals(0.1, policy.seconds_to_sleep(1))
+    assert_almost_equals(0.2, policy.seconds_to_sleep(2, None, 5))
+    assert_almost_equals(0.4, policy.seconds_to_sleep(3, 0, 5))
+    assert_equals(1, policy.seconds_to_sleep(5))
+    assert_equals(1, policy.seconds_to_sleep(5000))
+
+
+def test_adaptive_policy_predicts_completion_from_progress():
+    policy = AdaptiveStatementWaitPolicy(0.1, 5)
+
+    # 10% done after 10 seconds: 90 seconds left, poll sparsely.
+    assert_equals(5, policy.seconds_to_sleep(3, 0.1, 10))
+    # 80% done after 8 seconds: 2 seconds left, poll after half of that.
+    assert_almost_equals(1, policy.seconds_to_sleep(3, 0.8, 8))
+    # Almost done: poll densely.
+    assert_almost_equals(0.1, policy.seconds_to_sleep(3, 0.999, 8))
+
+
+def test_adaptive_policy_polls_soon_when_done():
+    policy = AdaptiveStatementWaitPolicy(0.1, 5)
+
+    assert_equals(0.1, policy.seconds_to_sleep(5, 1.0, 8))
+    assert_equals(0.1, policy.seconds_to_sleep(5, 1.0))
+
+
+@raises(BadUserConfigurationException)
+def test_adaptive_policy_min_greater_than_max():
+    AdaptiveStatementWaitPolicy(2, 1)
+
+
+@raises(BadUserConfigurationException)
+def test_adaptive_policy_non_positive_min():
+    AdaptiveStatementWaitPolicy(0, 1)
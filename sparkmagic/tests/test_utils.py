@@ -1,13 +1,13 @@
 from IPython.core.error import UsageError
 from mock import MagicMock
 import numpy as np
-from nose.tools import assert_equals, assert_is
+from nose.tools import assert_equals, assert_is, raises
 import pandas as pd
 from pandas.util.testing import assert_frame_equal
 
-from sparkmagic.livyclientlib.exceptions import BadUserDataException
-from sparkmagic.utils.utils import parse_argstring_or_throw, records_to_dataframe
-from sparkmagic.utils.constants import SESSION_KIND_PYSPARK
+from sparkmagic.livyclientlib.exceptions import BadUserDataException, DataFrameParseException
+from sparkmagic.utils.utils import parse_argstring_or_throw, records_to_dataframe, columnar_records_to_dataframe
+from sparkmagic.utils.constants import SESSION_KIND_PYSPARK, SESSION_KIND_SQL
 
 
 def test_parse_argstring_or_throw():
@@ -60,3 +60,95 @@ def test_records_to_dataframe_missing_value_later():
     df = records_to_dataframe(result, SESSION_KIND_PYSPARK, True)
     expected = pd.DataFrame([{'z':25, "nullv":1, 'y':10}, {'z': 100, "nullv": None, 'y': 50}], columns=['z', "nullv", 'y'])
     assert_frame_equal(expected, df)
+
+
+def test_records_to_dataframe_no_complete_record():
+    result = """{"z":25, "y":10}
+{"z":100, "nullv":1.0}"""
+
+    df = records_to_dataframe(result, SESSION_KIND_PYSPARK, False)
+    expected = pd.DataFrame([{'z': 25, 'y': 10, "nullv": None}, {'z': 100, 'y': None, "nullv": 1.0}],
+                            columns=['z', 'y', "nullv"])
+    assert_frame_equal(expected, df)
+
+
+def test_records_to_dataframe_keeps_key_order():
+    result = """{"b":1, "a":2}
+{"b":3, "a":4}"""
+
+    df = records_to_dataframe(result, SESSION_KIND_PYSPARK, False)
+    assert_equals(['b', 'a'], list(df.columns))
+
+
+def test_columnar_records_to_dataframe():
+    result = """{"columns": ["z", "nullv", "y"], "data": [[100, 25], [null, 1.0], ["2016-01-01", "2016-01-02"]]}"""
+
+    df = columnar_records_to_dataframe(result, True)
+    expected = pd.DataFrame([{'z': 100, "nullv": None, 'y': np.datetime64("2016-01-01")},
+                             {'z': 25, "nullv": 1, 'y': np.datetime64("2016-01-02")}], columns=['z', "nullv", 'y'])
+    assert_frame_equal(expected, df)
+
+
+def test_columnar_records_to_dataframe_keeps_duplicated_columns():
+    result = """{"columns": ["id", "id"], "data": [["1"], ["2"]]}"""
+
+    df = columnar_records_to_dataframe(result, False)
+    assert_equals(["id", "id"], list(df.columns))
+    assert_equals([["1", "2"]], df.values.tolist())
+
+
+def test_columnar_records_to_dataframe_empty():
+    df = columnar_records_to_dataframe("", True)
+    assert_equals(0, len(df))
+
+    df = columnar_records_to_dataframe("""{"columns": ["a"], "data": [[]]}""", True)
+    assert_equals(["a"], list(df.columns))
+    assert_equals(0, len(df))
+
+
+def test_columnar_records_to_dataframe_typed_by_schema():
+    result = """{"columns": ["id", "price", "day", "name", "flag"],
+                 "fields": [{"name": "id", "type": "long"}, {"name": "price", "type": "decimal(10,2)"},
+                            {"name": "day", "type": "date"}, {"name": "name", "type": "string"},
+                            {"name": "flag", "type": "boolean"}],
+                 "data": [[1, null], ["1.50", "2"], ["2016-01-01", "2016-01-02"], ["12", "13"], [true, false]]}"""
+
+    df = columnar_records_to_dataframe(result, True)
+
+    expected = pd.DataFrame([{'id': 1.0, 'price': 1.5, 'day': np.datetime64("2016-01-01"), 'name': '12', 'flag': True},
+                             {'id': None, 'price': 2.0, 'day': np.datetime64("2016-01-02"), 'name': '13',
+                              'flag': False}],
+                            columns=["id", "price", "day", "name", "flag"])
+    assert_frame_equal(expected, df)
+
+
+def test_columnar_records_to_dataframe_not_typed_without_coerce():
+    result = """{"columns": ["id", "day"],
+                 "fields": [{"name": "id", "type": "long"}, {"name": "day", "type": "date"}],
+                 "data": [["1", "2"], ["2016-01-01", "2016-01-02"]]}"""
+
+    df = columnar_records_to_dataframe(result, False)
+
+    assert_equals([np.dtype("object"), np.dtype("object")], list(df.dtypes))
+    assert_equals("1", df.iloc[0, 0])
+
+
+def test_sql_struct_to_dataframe_typed_by_schema():
+    result = {"schema": {"type": "struct",
+                         "fields": [{"name": "id", "type": "integer"}, {"name": "id", "type": "double"},
+                                    {"name": "at", "type": "timestamp"},
+                                    {"name": "tags", "type": {"type": "array", "elementType": "string"}}]},
+              "data": [[1, 2, "2016-01-01 10:00:00", ["a"]], [3, 4, None, []]]}
+
+    df = records_to_dataframe(result, SESSION_KIND_SQL)
+
+    assert_equals(["id", "id", "at", "tags"], list(df.columns))
+    assert_equals([np.dtype("int64"), np.dtype("float64"), np.dtype("datetime64[ns]"), np.dtype("object")],
+                  list(df.dtypes))
+    assert_equals(np.datetime64("2016-01-01T10:00:00"), df.iloc[0, 2])
+    assert pd.isnull(df.iloc[1, 2])
+
+
+@raises(DataFrameParseException)
+def test_columnar_records_to_dataframe_bad_payload():
+    columnar_records_to_dataframe("""{"z":100, "y":50}""", True)
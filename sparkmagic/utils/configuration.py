@@ -3,6 +3,8 @@ import copy
 import sys
 import base64
 import getpass
+import threading
+import time
 import requests
 from hdijupyterutils.constants import EVENTS_HANDLER_CLASS_NAME, LOGGING_CONFIG_CLASS_NAME
 from hdijupyterutils.utils import join_paths
@@ -13,7 +15,8 @@ from hdijupyterutils.configuration import with_override
 from .constants import HOME_PATH, CONFIG_FILE, MAGICS_LOGGER_NAME, LIVY_KIND_PARAM, \
     LANG_SCALA, LANG_PYTHON, LANG_PYTHON3, LANG_R, LANG_SQL, \
     SESSION_KIND_SPARKR, SESSION_KIND_SPARK, SESSION_KIND_PYSPARK, SESSION_KIND_PYSPARK3, CONFIGURABLE_RETRY, \
-    SESSION_CONF_PARAM, SPARK_YARN_QUEUE_PARAM, SESSION_KIND_SQL
+    SESSION_CONF_PARAM, SPARK_YARN_QUEUE_PARAM, SESSION_KIND_SQL, ADAPTIVE_STATEMENT_WAIT, \
+    RESULT_FORMAT_JSON_LINES
 from sparkmagic.livyclientlib.exceptions import BadUserConfigurationException
 import sparkmagic.utils.constants as constants
 
@@ -74,6 +77,15 @@ def get_session_properties(language):
     return properties
 
 
+def get_http_timeouts(operation):
+    """Returns the (connect, read, deadline) seconds of the HTTP requests of the given operation, falling back to
+    those of the 'default' operation."""
+    timeouts = http_timeouts()
+    (connect_seconds, read_seconds, deadline_seconds) = timeouts.get(operation) or \
+        timeouts.get(constants.HTTP_OPERATION_DEFAULT) or constants.DEFAULT_HTTP_TIMEOUTS
+    return (connect_seconds, read_seconds, deadline_seconds)
+
+
 @_with_override
 def session_configs():
     return {}
@@ -162,6 +174,36 @@ def events_handler_class():
     return EVENTS_HANDLER_CLASS_NAME
 
 
+@_with_override
+def events_queue_size():
+    return 10000
+
+
+@_with_override
+def events_batch_size():
+    return 100
+
+
+@_with_override
+def metrics_enabled():
+    return False
+
+
+@_with_override
+def metrics_spool_dir():
+    return join_paths(HOME_PATH, u"metrics")
+
+
+@_with_override
+def metrics_write_interval_seconds():
+    return 15
+
+
+@_with_override
+def metrics_max_age_seconds():
+    return 300
+
+
 @_with_override
 def wait_for_idle_timeout_seconds():
     return 15
@@ -198,6 +240,16 @@ def coerce_dataframe():
     return True
 
 
+@_with_override
+def coerce_sample_size():
+    return 100
+
+
+@_with_override
+def coerce_schema_cache_size():
+    return 128
+
+
 @_with_override
 def use_auto_viz():
     return True
@@ -218,6 +270,11 @@ def default_samplefraction():
     return 0.1
 
 
+@_with_override
+def result_transfer_format():
+    return RESULT_FORMAT_JSON_LINES
+
+
 @_with_override
 def pyspark_dataframe_encoding():
     return u'utf-8'
@@ -238,6 +295,11 @@ def livy_server_heartbeat_timeout_seconds():
     return 0
 
 
+@_with_override
+def session_state_cache_seconds():
+    return 60
+
+
 @_with_override
 def server_extension_default_kernel_name():
     return "pysparkkernel"
@@ -248,6 +310,66 @@ def custom_headers():
     return {}
 
 
+@_with_override
+def http_pool_maxsize():
+    return 10
+
+
+@_with_override
+def init_livy_session_in_background():
+    return True
+
+
+@_with_override
+def async_cell_execution():
+    return True
+
+
+@_with_override
+def session_pool_size():
+    return 0
+
+
+@_with_override
+def session_pool_max_idle_seconds():
+    return 3600
+
+
+@_with_override
+def session_pool_max_sessions_per_user():
+    return 5
+
+
+@_with_override
+def session_refresh_max_workers():
+    return 8
+
+
+@_with_override
+def fan_out_max_workers():
+    return 8
+
+
+@_with_override
+def session_log_buffer_lines():
+    return 10000
+
+
+@_with_override
+def session_log_page_size():
+    return 1000
+
+
+@_with_override
+def logs_follow_interval_seconds():
+    return 2
+
+
+@_with_override
+def http_client_idle_ttl_seconds():
+    return 600
+
+
 @_with_override
 def retry_policy():
     return CONFIGURABLE_RETRY
@@ -264,6 +386,73 @@ def configurable_retry_policy_max_retries():
     # Plus 15 seconds more wanted, that's 3 more 5 second retries.
     return 8
 
+
+@_with_override
+def http_timeouts():
+    # Operation -> [connect timeout, read timeout, deadline of the whole retry loop], in seconds.
+    return {
+        constants.HTTP_OPERATION_SESSION_CREATE: [10, 120, 300],
+        constants.HTTP_OPERATION_STATEMENT_POST: [10, 60, 120],
+        constants.HTTP_OPERATION_POLL: [10, 30, 120],
+        constants.HTTP_OPERATION_LIST: [10, 30, 120],
+        constants.HTTP_OPERATION_LOGS: [10, 60, 120],
+        constants.HTTP_OPERATION_DEFAULT: constants.DEFAULT_HTTP_TIMEOUTS
+    }
+
+
+@_with_override
+def exponential_retry_initial_seconds():
+    return 0.5
+
+
+@_with_override
+def exponential_retry_max_seconds():
+    return 30
+
+
+@_with_override
+def exponential_retry_policy_max_retries():
+    return 8
+
+
+@_with_override
+def circuit_breaker_failure_threshold():
+    return 5
+
+
+@_with_override
+def circuit_breaker_reset_seconds():
+    return 30
+
+
+@_with_override
+def retry_budget_max_retries():
+    return 30
+
+
+@_with_override
+def retry_budget_window_seconds():
+    return 60
+
+@_with_override
+def statement_wait_policy():
+    return ADAPTIVE_STATEMENT_WAIT
+
+
+@_with_override
+def statement_wait_seconds_to_sleep_list():
+    return [0.2, 0.5, 0.5, 1, 1, 2]
+
+
+@_with_override
+def statement_wait_min_seconds():
+    return 0.1
+
+
+@_with_override
+def statement_wait_max_seconds():
+    return 5
+
 @_with_override
 def switch_to_user_database():
     return False
@@ -272,6 +461,11 @@ def switch_to_user_database():
 def user_database():
     return None
 
+
+@_with_override
+def session_init_code():
+    return {}
+
 @_with_override
 def is_sql_restrict():
     return True
@@ -336,23 +530,101 @@ def config_api_auth_token():
     return ""
 
 
+@_with_override
+def user_config_cache_ttl_seconds():
+    return 300
+
+
+@_with_override
+def user_config_stale_while_revalidate():
+    return True
+
+
+@_with_override
+def user_config_timeout_seconds():
+    return 5
+
+
+# username -> (user config, time it was fetched at)
+_user_config_cache = {}
+_user_config_revalidating = set()
+_user_config_lock = threading.Lock()
+
+
 def get_user_config():
+    """Returns the current user's config from the config API. Successful responses are cached for
+    user_config_cache_ttl_seconds. Once expired, the cached config is still returned while it is fetched again in
+    the background if user_config_stale_while_revalidate is set; otherwise it is fetched again right away. If the
+    config API fails, the last config fetched, or {}, is returned."""
     username = getpass.getuser()
+    with _user_config_lock:
+        cached = _user_config_cache.get(username)
+
+    if cached is not None:
+        (config, fetched_at) = cached
+        if time.time() - fetched_at <= user_config_cache_ttl_seconds():
+            return copy.deepcopy(config)
+        if user_config_stale_while_revalidate():
+            _revalidate_user_config(username)
+            return copy.deepcopy(config)
+
+    config = _fetch_and_cache_user_config(username)
+    if config is None:
+        config = cached[0] if cached is not None else {}
+    return copy.deepcopy(config)
+
+
+def invalidate_user_config_cache(username=None):
+    """Forgets the cached config of the given user, or of every user if username is None."""
+    with _user_config_lock:
+        if username is None:
+            _user_config_cache.clear()
+        else:
+            _user_config_cache.pop(username, None)
+
+
+def _revalidate_user_config(username):
+    with _user_config_lock:
+        if username in _user_config_revalidating:
+            return
+        _user_config_revalidating.add(username)
+
+    def revalidate():
+        try:
+            _fetch_and_cache_user_config(username)
+        finally:
+            with _user_config_lock:
+                _user_config_revalidating.discard(username)
+
+    thread = threading.Thread(target=revalidate)
+    thread.daemon = True
+    thread.start()
+
+
+def _fetch_and_cache_user_config(username):
+    config = _fetch_user_config(username)
+    if config is not None:
+        with _user_config_lock:
+            _user_config_cache[username] = (config, time.time())
+    return config
+
+
+def _fetch_user_config(username):
     api = config_api()
     try:
         url = f"{api}/user/yarn/{username}"
         headers = {"Authorization": "Bearer {}".format(config_api_auth_token())}
 
-        res = requests.get(url, headers=headers)
+        res = requests.get(url, headers=headers, timeout=user_config_timeout_seconds())
         if res.status_code == 200:
             result = res.json()
             if result['code'] == 0:
                 data = result.get("data", {})
                 return data
     except:
-        return {}
+        return None
 
-    return {}
+    return None
 
 
 def get_user_yarn_queue_conf():
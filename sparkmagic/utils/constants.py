@@ -28,6 +28,7 @@ SQL_EXECUTION_START_EVENT = "notebookSqlExecutionStart"
 SQL_EXECUTION_END_EVENT = "notebookSqlExecutionEnd"
 MAGIC_EXECUTION_START_EVENT = "notebookMagicExecutionStart"
 MAGIC_EXECUTION_END_EVENT = "notebookMagicExecutionEnd"
+STATEMENT_TIMING_EVENT = "notebookStatementTiming"
 
 CLUSTER_DNS_NAME = "ClusterDnsName"
 SESSION_ID = "SessionId"
@@ -47,6 +48,7 @@ MAX_ROWS = "MaxRows"
 SAMPLE_FRACTION = "SampleFraction"
 ERROR_MESSAGE = "ErrorMessage"
 STATUS_CODE = "StatusCode"
+TIMING = "Timing"
 
 CONTEXT_NAME_SPARK = "spark"
 CONTEXT_NAME_SQL = "sql"
@@ -60,6 +62,12 @@ LANGS_SUPPORTED = [LANG_SCALA, LANG_PYTHON, LANG_PYTHON3, LANG_R, LANG_SQL]
 
 LONG_RANDOM_VARIABLE_NAME = "yQeKOYBsFgLWWGWZJu3y"
 
+RESULT_FORMAT_JSON_LINES = "json_lines"
+RESULT_FORMAT_COLUMNAR = "columnar"
+RESULT_FORMATS_SUPPORTED = [RESULT_FORMAT_JSON_LINES, RESULT_FORMAT_COLUMNAR]
+# Session kinds whose remote side can emit the columnar result format.
+COLUMNAR_RESULT_KINDS = [SESSION_KIND_PYSPARK, SESSION_KIND_PYSPARK3]
+
 MAGICS_LOGGER_NAME = "magicsLogger"
 
 IDLE_SESSION_STATUS = "idle"
@@ -103,6 +111,20 @@ AUTHS_SUPPORTED = [NO_AUTH, AUTH_KERBEROS, AUTH_BASIC]
 
 CONFIGURABLE_RETRY = "configurable"
 LINEAR_RETRY = "linear"
+EXPONENTIAL_RETRY = "exponential"
+
+HTTP_OPERATION_SESSION_CREATE = "session_create"
+HTTP_OPERATION_STATEMENT_POST = "statement_post"
+HTTP_OPERATION_POLL = "poll"
+HTTP_OPERATION_LIST = "list"
+HTTP_OPERATION_LOGS = "logs"
+HTTP_OPERATION_DEFAULT = "default"
+# Connect timeout, read timeout and deadline of the whole retry loop, in seconds, of operations http_timeouts
+# does not configure.
+DEFAULT_HTTP_TIMEOUTS = [10, 60, 120]
+
+FIXED_STATEMENT_WAIT = "fixed"
+ADAPTIVE_STATEMENT_WAIT = "adaptive"
 
 SESSION_CONF_PARAM = u"conf"
 SPARK_YARN_QUEUE_PARAM = u"spark.yarn.queue"
@@ -0,0 +1,245 @@
+# Distributed under the terms of the Modified BSD License.
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from glob import glob
+from time import sleep, time
+
+from hdijupyterutils.filesystemreaderwriter import FileSystemReaderWriter
+from hdijupyterutils.utils import expand_path, join_paths
+
+from . import configuration as conf
+from .sparklogger import SparkLog
+
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+ROWS_BUCKETS = (1, 10, 100, 1e3, 1e4, 1e5, 1e6)
+
+STATEMENT_DURATION = u"sparkmagic_statement_duration_seconds"
+HTTP_RETRIES = u"sparkmagic_http_retries_total"
+HTTP_REQUESTS_REJECTED = u"sparkmagic_http_requests_rejected_total"
+CIRCUIT_BREAKER_OPENED = u"sparkmagic_circuit_breaker_opened_total"
+SESSION_START_DURATION = u"sparkmagic_session_start_duration_seconds"
+ACTIVE_HEARTBEATS = u"sparkmagic_active_heartbeats"
+RESULT_ROWS = u"sparkmagic_result_rows"
+RESULT_BYTES = u"sparkmagic_result_bytes"
+COERCE_DURATION = u"sparkmagic_coerce_duration_seconds"
+
+COUNTER = u"counter"
+GAUGE = u"gauge"
+HISTOGRAM = u"histogram"
+
+# name -> (type, help, buckets of histograms)
+METRICS = {
+    STATEMENT_DURATION: (HISTOGRAM, u"Time to run a statement, by session kind.", SECONDS_BUCKETS),
+    HTTP_RETRIES: (COUNTER, u"Livy requests retried, by status code of the failed attempt.", None),
+    HTTP_REQUESTS_REJECTED: (COUNTER, u"Livy requests or retries not sent, by reason: circuit_open, "
+                                      u"retry_budget or deadline.", None),
+    CIRCUIT_BREAKER_OPENED: (COUNTER, u"Times the circuit breaker of a Livy server opened.", None),
+    SESSION_START_DURATION: (HISTOGRAM, u"Time for a new Livy session to become idle, by session kind.",
+                             SECONDS_BUCKETS),
+    ACTIVE_HEARTBEATS: (GAUGE, u"Livy sessions being heartbeated.", None),
+    RESULT_ROWS: (HISTOGRAM, u"Rows of the dataframes built from statement results.", ROWS_BUCKETS),
+    RESULT_BYTES: (HISTOGRAM, u"Size of statement results returned by Livy.", BYTES_BUCKETS),
+    COERCE_DURATION: (HISTOGRAM, u"Time to coerce the columns of result dataframes.", SECONDS_BUCKETS),
+}
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Returns the process' SparkMetrics, creating it on first use. When metrics are enabled, the kernel's snapshot
+    is written to the metrics spool directory, where the server extension collects the snapshots of all kernels."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            spool_path = None
+            if conf.metrics_enabled():
+                spool_path = join_paths(conf.metrics_spool_dir(), u"{}.json".format(os.getpid()))
+            _metrics = SparkMetrics(spool_path, conf.metrics_write_interval_seconds())
+            atexit.register(_metrics.remove_snapshot)
+        return _metrics
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class SparkMetrics(object):
+    """Counters, gauges and histograms of one kernel. The metrics are kept in memory; when spool_path is set, a
+    background thread writes a snapshot of them there every write_interval_seconds, whenever they changed, and
+    otherwise touches the snapshot to show the kernel is alive."""
+
+    def __init__(self, spool_path=None, write_interval_seconds=15):
+        self.logger = SparkLog(u"SparkMetrics")
+        self._spool_path = expand_path(spool_path) if spool_path is not None else None
+        self._write_interval_seconds = write_interval_seconds
+        # (name, labels) -> value, or [bucket counts..., sum, count] for histograms
+        self._values = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def increment(self, name, value=1, **labels):
+        with self._lock:
+            key = _key(name, labels)
+            self._values[key] = self._values.get(key, 0) + value
+            self._changed = True
+        self._start_thread()
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[_key(name, labels)] = value
+            self._changed = True
+        self._start_thread()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        with self._lock:
+            key = _key(name, labels)
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(buckets) + 2)
+            # Bucket counts are not cumulative here; they are summed up when rendered.
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+            self._changed = True
+        self._start_thread()
+
+    def record_statement_timing(self, kind, timing, rows=None):
+        """Records the metrics of a statement from its StatementTiming and, for results turned into dataframes, the
+        number of rows."""
+        if timing.total_seconds is not None:
+            self.observe(STATEMENT_DURATION, timing.total_seconds, kind=kind)
+        if timing.payload_bytes is not None:
+            self.observe(RESULT_BYTES, timing.payload_bytes)
+        if timing.coerce_seconds is not None:
+            self.observe(COERCE_DURATION, timing.coerce_seconds)
+        if rows is not None:
+            self.observe(RESULT_ROWS, rows)
+
+    def snapshot(self):
+        """Returns the metrics as a list of [name, labels, value] that can be dumped to JSON."""
+        with self._lock:
+            self._changed = False
+            return [[name, dict(labels), list(value) if isinstance(value, list) else value]
+                    for ((name, labels), value) in self._values.items()]
+
+    def write_snapshot(self):
+        if self._spool_path is None:
+            return
+        FileSystemReaderWriter(os.path.dirname(self._spool_path)).ensure_path_exists()
+        temp_path = u"{}.tmp".format(self._spool_path)
+        with open(temp_path, u"w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, self._spool_path)
+
+    def remove_snapshot(self):
+        if self._spool_path is not None and os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+    def _start_thread(self):
+        if self._spool_path is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._changed or not os.path.exists(self._spool_path):
+                    self.write_snapshot()
+                else:
+                    # Keeps the snapshot from looking like one left behind by a dead kernel.
+                    os.utime(self._spool_path, None)
+            except Exception as e:
+                self.logger.error(u"Could not write metrics to {}: {}".format(self._spool_path, e))
+            sleep(self._write_interval_seconds)
+
+
+def read_snapshots(spool_dir, max_age_seconds):
+    """Reads the snapshots of the kernels in spool_dir, skipping those not touched in the last max_age_seconds,
+    which belong to kernels that died without removing them. Returns {kernel pid: snapshot}."""
+    snapshots = {}
+    now = time()
+    for path in glob(join_paths(expand_path(spool_dir), u"*.json")):
+        try:
+            if now - os.path.getmtime(path) > max_age_seconds:
+                continue
+            with open(path) as f:
+                snapshots[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+        except (OSError, ValueError):
+            # The kernel removed or is rewriting its snapshot.
+            continue
+    return snapshots
+
+
+def aggregate_snapshots(snapshots):
+    """Merges the snapshots of several kernels, {kernel pid: snapshot}. Returns {(name, labels): value}.
+
+    Gauges are summed. Counters and histograms are labelled with the kernel they come from instead: summed, they
+    would go down when a kernel exits, which Prometheus would take for a reset of the whole counter."""
+    totals = {}
+    for (kernel, snapshot) in snapshots.items():
+        for (name, labels, value) in snapshot:
+            if name not in METRICS:
+                continue
+            if METRICS[name][0] != GAUGE:
+                labels = dict(labels, kernel=kernel)
+            key = _key(name, labels)
+            if isinstance(value, list):
+                total = totals.get(key)
+                totals[key] = value if total is None else [a + b for (a, b) in zip(total, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def to_prometheus_text(totals):
+    """Renders aggregated metrics in the Prometheus text exposition format."""
+    lines = []
+    for name in sorted(METRICS):
+        (metric_type, help_text, buckets) = METRICS[name]
+        series = sorted((labels, value) for ((series_name, labels), value) in totals.items() if series_name == name)
+        if not series:
+            continue
+        lines.append(u"# HELP {} {}".format(name, help_text))
+        lines.append(u"# TYPE {} {}".format(name, metric_type))
+        for (labels, value) in series:
+            if metric_type != HISTOGRAM:
+                lines.append(u"{}{} {}".format(name, _format_labels(labels), _format_number(value)))
+                continue
+            cumulative = 0
+            for (bucket, count) in zip(buckets, value):
+                cumulative += count
+                lines.append(u"{}_bucket{} {}".format(name, _format_labels(labels + ((u"le", _format_number(bucket)),)),
+                                                      cumulative))
+            lines.append(u"{}_bucket{} {}".format(name, _format_labels(labels + ((u"le", u"+Inf"),)), value[-1]))
+            lines.append(u"{}_sum{} {}".format(name, _format_labels(labels), _format_number(value[-2])))
+            lines.append(u"{}_count{} {}".format(name, _format_labels(labels), value[-1]))
+    return u"".join(u"{}\n".format(line) for line in lines)
+
+
+def _format_labels(labels):
+    if not labels:
+        return u""
+    return u"{{{}}}".format(u",".join(u'{}="{}"'.format(key, u"{}".format(value).replace(u"\\", u"\\\\")
+                                                         .replace(u'"', u'\\"').replace(u"\n", u"\\n"))
+                                      for (key, value) in labels))
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return u"{}".format(int(value)) if abs(value) < 1e15 else repr(value)
+    return u"{}".format(value)
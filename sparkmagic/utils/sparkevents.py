@@ -1,4 +1,12 @@
+import atexit
 import importlib
+import json
+import threading
+from time import sleep, time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 from hdijupyterutils.constants import EVENT_NAME, TIMESTAMP
 from hdijupyterutils.events import Events
 
@@ -6,6 +14,10 @@ from . import configuration as conf
 import sparkmagic.utils.constants as constants
 
 
+_events_bus = None
+_events_bus_lock = threading.Lock()
+
+
 def get_spark_events_handler():
     """
     Create an instance from the handler mentioned in the config file.
@@ -17,11 +29,104 @@ def get_spark_events_handler():
     return handler
 
 
+def get_events_bus():
+    """Returns the process' SparkEventsBus, creating it and the configured handler on first use."""
+    global _events_bus
+    with _events_bus_lock:
+        if _events_bus is None:
+            _events_bus = SparkEventsBus(get_spark_events_handler(), conf.events_queue_size(),
+                                         conf.events_batch_size())
+            atexit.register(_events_bus.flush)
+        return _events_bus
+
+
+class SparkEventsBus(object):
+    """Events handler that hands events to the wrapped handler from a background thread, so that emitting an
+    event never waits for the handler's I/O. Events wait in a queue of at most max_queue_size events; when it is
+    full, new events are dropped and counted. The writer handles up to batch_size queued events per wake-up.
+    Events the handler fails on are counted too, and logged at most once every FAILURES_LOG_INTERVAL_SECONDS."""
+
+    FAILURES_LOG_INTERVAL_SECONDS = 60
+
+    def __init__(self, handler, max_queue_size, batch_size):
+        self.handler = handler
+        self.dropped_count = 0
+        self.failed_count = 0
+        self._failures_logged_at = None
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def handle_event(self, kwargs_list):
+        self._start_thread()
+        try:
+            self._queue.put_nowait(kwargs_list)
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+
+    def flush(self, timeout=5):
+        """Waits up to timeout seconds for the queued events to be handled. Returns whether they all were."""
+        deadline = time() + timeout
+        while self._queue.unfinished_tasks:
+            if time() >= deadline:
+                return False
+            sleep(0.01)
+        return True
+
+    def _start_thread(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._handle_batch(batch)
+
+    def _handle_batch(self, batch):
+        with self._lock:
+            dropped_count, self.dropped_count = self.dropped_count, 0
+        if dropped_count and hasattr(self.handler, u"logger"):
+            self.handler.logger.error(u"Dropped {} events because the events queue was full.".format(dropped_count))
+
+        error = None
+        for kwargs_list in batch:
+            try:
+                self.handler.handle_event(kwargs_list)
+            except Exception as e:
+                # An event that cannot be handled must not stop the ones after it.
+                self.failed_count += 1
+                error = e
+            finally:
+                self._queue.task_done()
+        if error is not None:
+            self._log_failures(error)
+
+    def _log_failures(self, error):
+        now = time()
+        if self._failures_logged_at is not None and \
+                now - self._failures_logged_at < self.FAILURES_LOG_INTERVAL_SECONDS:
+            return
+        if hasattr(self.handler, u"logger"):
+            self.handler.logger.error(u"The events handler failed to handle {} events, most recently with: {}"
+                                      .format(self.failed_count, error))
+        self._failures_logged_at = now
+        self.failed_count = 0
+
+
 class SparkEvents(Events):
     def __init__(self):
-        handler = get_spark_events_handler()
-        super(SparkEvents, self).__init__(handler)
-    
+        super(SparkEvents, self).__init__(get_events_bus())
 
     def emit_library_loaded_event(self):
         event_name = constants.LIBRARY_LOADED_EVENT
@@ -185,6 +290,23 @@ class SparkEvents(Events):
 
         self.send_to_handler(kwargs_list)
 
+    def emit_statement_timing_event(self, session_guid, language, session_id, statement_guid, timing):
+        """Emits where the time of a statement went; timing is the dict of a StatementTiming."""
+        self._verify_language_ok(language)
+
+        event_name = constants.STATEMENT_TIMING_EVENT
+        time_stamp = self.get_utc_date_time()
+
+        kwargs_list = [(EVENT_NAME, event_name),
+                       (TIMESTAMP, time_stamp),
+                       (constants.SESSION_GUID, session_guid),
+                       (constants.LIVY_KIND, language),
+                       (constants.SESSION_ID, session_id),
+                       (constants.STATEMENT_GUID, statement_guid),
+                       (constants.TIMING, json.dumps(timing))]
+
+        self.send_to_handler(kwargs_list)
+
     def emit_magic_execution_start_event(self, magic_name, language, magic_guid):
         self._verify_language_ok(language)
         time_stamp = self.get_utc_date_time()
@@ -3,8 +3,12 @@ from IPython.core.error import UsageError
 from IPython.core.magic_arguments import parse_argstring
 import numpy as np
 import pandas as pd
+from six import string_types
 import json
+import threading
+from time import time
 from collections import OrderedDict
+from itertools import chain
 
 import sparkmagic.utils.configuration as conf
 import sparkmagic.utils.constants as constants
@@ -27,67 +31,207 @@ def parse_argstring_or_throw(magic_func, argstring, parse_argstring=parse_argstr
         raise BadUserDataException(str(e))
 
 
-def coerce_pandas_df_to_numeric_datetime(df):
-    for column_name in df.columns:
-        coerced = False
+_DATETIME = u"datetime"
+_NUMERIC = u"numeric"
+_COERCIONS = OrderedDict([
+    (_DATETIME, (lambda series: pd.to_datetime(series, errors="raise"), (ValueError, TypeError, OverflowError))),
+    (_NUMERIC, (lambda series: pd.to_numeric(series, errors="raise"), (ValueError, TypeError))),
+])
+
+# Coercion types inferred for previous results, keyed by (cache key, column names), least recently used first.
+_coerce_schema_cache = OrderedDict()
+_coerce_schema_cache_lock = threading.Lock()
+
 
-        if df[column_name].isnull().all():
+def coerce_pandas_df_to_numeric_datetime(df, schema_cache_key=None):
+    """Converts the object columns of df that hold dates or numbers, in place.
+
+    Each column is first classified from an evenly spaced sample of at most coerce_sample_size() of its non-null
+    values, and is only converted in full if its sample converts. When schema_cache_key is given (e.g. the query
+    text), the inferred types are cached and reused for the next dataframe with the same key and columns; if a
+    cached type no longer applies the column is classified again."""
+    cache_key = None
+    cached_schema = {}
+    if schema_cache_key is not None:
+        cache_key = (schema_cache_key, tuple(df.columns))
+        cached_schema = _get_cached_coerce_schema(cache_key)
+
+    schema = {}
+    for column_name in df.columns:
+        if df[column_name].dtype != np.dtype("object"):
             continue
 
-        if not coerced and df[column_name].dtype == np.dtype("object"):
-            try:
-                df[column_name] = pd.to_datetime(df[column_name], errors="raise")
-                coerced = True
-            except (ValueError, TypeError, OverflowError):
-                pass
+        cached_type = cached_schema.get(column_name, False)
+        if cached_type is None:
+            schema[column_name] = None
+        elif cached_type and _coerce_column(df, column_name, cached_type):
+            schema[column_name] = cached_type
+        else:
+            non_null = df[column_name].dropna()
+            if non_null.empty:
+                continue
+            sample = _sample_series(non_null, conf.coerce_sample_size())
+            schema[column_name] = None
+            for coerce_type in _sample_coerce_types(sample):
+                if _coerce_column(df, column_name, coerce_type):
+                    schema[column_name] = coerce_type
+                    break
+
+    if cache_key is not None:
+        _cache_coerce_schema(cache_key, schema)
+
+
+def clear_coerce_schema_cache():
+    with _coerce_schema_cache_lock:
+        _coerce_schema_cache.clear()
+
 
-        if not coerced and df[column_name].dtype == np.dtype("object"):
-            try:
-                df[column_name] = pd.to_numeric(df[column_name], errors="raise")
-                coerced = True
-            except (ValueError, TypeError):
-                pass
+def _sample_series(series, sample_size):
+    if len(series) <= sample_size:
+        return series
+    # Evenly spaced, starting with the first value, which is what to_datetime infers the date format from.
+    return series.iloc[np.linspace(0, len(series) - 1, sample_size).astype(int)]
 
 
-def records_to_dataframe(records_text, kind, coerce=None):
+def _sample_coerce_types(sample):
+    coerce_types = []
+    for coerce_type, (coerce, errors) in _COERCIONS.items():
+        try:
+            coerce(sample)
+            coerce_types.append(coerce_type)
+        except errors:
+            pass
+    return coerce_types
+
+
+def _coerce_column(df, column_name, coerce_type):
+    coerce, errors = _COERCIONS[coerce_type]
+    try:
+        df[column_name] = coerce(df[column_name])
+        return True
+    except errors:
+        return False
+
+
+def _get_cached_coerce_schema(cache_key):
+    with _coerce_schema_cache_lock:
+        schema = _coerce_schema_cache.pop(cache_key, {})
+        if schema:
+            _coerce_schema_cache[cache_key] = schema
+        return schema
+
+
+def _cache_coerce_schema(cache_key, schema):
+    max_size = conf.coerce_schema_cache_size()
+    with _coerce_schema_cache_lock:
+        _coerce_schema_cache.pop(cache_key, None)
+        if max_size <= 0:
+            return
+        _coerce_schema_cache[cache_key] = schema
+        while len(_coerce_schema_cache) > max_size:
+            _coerce_schema_cache.popitem(last=False)
+
+
+def records_to_dataframe(records_text, kind, coerce=None, schema_cache_key=None, timing=None):
+    """If timing is given, its json_parse_seconds, dataframe_seconds and coerce_seconds are set."""
     if kind == constants.SESSION_KIND_SQL and \
             isinstance(records_text, dict):
-        return convert_data_struct_to_dataframe(records_text)
+        start_time = time()
+        if coerce is None:
+            coerce = conf.coerce_dataframe()
+        df = convert_data_struct_to_dataframe(records_text, coerce)
+        if timing is not None:
+            timing.dataframe_seconds = time() - start_time
+        return df
 
     if records_text in ['', '[]']:
         strings = []
     else:
         strings = records_text.strip().split('\n')
     try:
-        data_array = [json.JSONDecoder(object_pairs_hook=OrderedDict).decode(s) for s in strings]
+        start_time = time()
+        # Decode all the lines in one pass as a single JSON array. Plain dicts keep their keys in
+        # insertion order, so there is no need for an OrderedDict per row.
+        data_array = json.loads(u"[{}]".format(u",".join(strings)))
+        parsed_time = time()
 
         if kind == constants.SESSION_KIND_SPARKR and len(data_array) > 0:
             data_array = data_array[0]
 
-        df = pd.DataFrame(data_array)
-
-        if len(data_array) > 0:
-            # This will assign the columns in the right order. If we simply did
-            # df = pd.DataFrame(data_array, columns=data_array[0].keys())
-            # in the code defining df, above, we could get an issue where the first element
-            # has some columns as null, and thus would drop the columns from the df altogether.
-            # Refer to https://github.com/jupyter-incubator/sparkmagic/issues/346 for
-            # more details.
-            for data in data_array:
-                if len(data.keys()) == len(df.columns):
-                    df = df[list(data.keys())]
-                    break
+        df = pd.DataFrame(data_array, columns=_records_columns(data_array))
+        built_time = time()
 
         if coerce is None:
             coerce = conf.coerce_dataframe()
         if coerce:
-            coerce_pandas_df_to_numeric_datetime(df)
+            coerce_pandas_df_to_numeric_datetime(df, schema_cache_key)
 
+        if timing is not None:
+            timing.json_parse_seconds = parsed_time - start_time
+            timing.dataframe_seconds = built_time - parsed_time
+            timing.coerce_seconds = time() - built_time
         return df
     except ValueError:
         raise DataFrameParseException(u"Cannot parse object as JSON: '{}'".format(strings))
 
 
+def _records_columns(records):
+    """Returns the column order of the given records. toJSON omits null values, so the first record
+    that has every column gives the right order. If there isn't one, the union of the keys in first-seen
+    order is used. Refer to https://github.com/jupyter-incubator/sparkmagic/issues/346 for more details."""
+    columns = list(OrderedDict.fromkeys(chain.from_iterable(records)))
+    for record in records:
+        if len(record) == len(columns):
+            return list(record)
+    return columns
+
+
+def columnar_records_to_dataframe(records_text, coerce=None, schema_cache_key=None, timing=None):
+    """Builds a dataframe from the columnar payload {"columns": [...], "data": [[column values], ...]},
+    one column at a time, without materializing a Python object per row. Unless coerce is False, the columns are
+    typed from the Spark schema's "fields" if the payload has them, and coerced otherwise. If timing is given, its
+    json_parse_seconds, dataframe_seconds and coerce_seconds are set."""
+    start_time = time()
+    try:
+        if records_text.strip():
+            payload = json.loads(records_text)
+        else:
+            payload = {u"columns": [], u"data": []}
+        columns = payload[u"columns"]
+        data = payload[u"data"]
+        fields = payload.get(u"fields")
+    except (ValueError, KeyError, TypeError):
+        raise DataFrameParseException(u"Cannot parse object as columnar JSON: '{}'".format(records_text))
+
+    parsed_time = time()
+
+    # Keyed by position until coerced, so that duplicated column names (e.g. from a join) are kept.
+    df = pd.DataFrame(OrderedDict(enumerate(data)), columns=range(len(columns)))
+    built_time = time()
+
+    if coerce is None:
+        coerce = conf.coerce_dataframe()
+    if coerce:
+        if fields is not None:
+            apply_spark_schema(df, fields)
+        else:
+            coerce_pandas_df_to_numeric_datetime(df, _columnar_schema_cache_key(schema_cache_key, columns))
+
+    df.columns = columns
+    if timing is not None:
+        timing.json_parse_seconds = parsed_time - start_time
+        timing.dataframe_seconds = built_time - parsed_time
+        timing.coerce_seconds = time() - built_time
+    return df
+
+
+def _columnar_schema_cache_key(schema_cache_key, columns):
+    # Columns are coerced while keyed by position, so the names have to be part of the cache key.
+    if schema_cache_key is None:
+        return None
+    return (schema_cache_key, tuple(columns))
+
+
 def get_sessions_info_html(info_sessions, current_session_id):
     html = u"""<table>
 <tr><th>ID</th><th>YARN Application ID</th><th>Kind</th><th>State</th><th>Spark UI</th><th>Driver log</th><th>Current session?</th></tr>""" + \
@@ -96,10 +240,42 @@ def get_sessions_info_html(info_sessions, current_session_id):
 
     return html
 
-def convert_data_struct_to_dataframe(struct):
+def convert_data_struct_to_dataframe(struct, coerce=True):
     schema = struct.get("schema", {})
-    fields = schema.get("fields", {})
+    fields = schema.get("fields", [])
     columns = [field['name'] for field in fields]
     data = struct.get("data", [])
-    df = pd.DataFrame.from_records(data, columns=columns)
+    # Keyed by position until typed, so that duplicated column names are kept.
+    df = pd.DataFrame.from_records(data, columns=range(len(columns)))
+    if coerce:
+        apply_spark_schema(df, fields)
+    df.columns = columns
     return df
+
+
+_SPARK_INTEGRAL_TYPES = {u"byte", u"short", u"integer", u"long"}
+_SPARK_FRACTIONAL_TYPES = {u"float", u"double"}
+_SPARK_DATETIME_TYPES = {u"date", u"timestamp"}
+
+
+def apply_spark_schema(df, fields):
+    """Converts the columns of df, which must be keyed by position, in place to the dtypes matching the Spark
+    types of the given schema fields ([{"name": ..., "type": ...}, ...] as returned by StructType.jsonValue()).
+    Integral columns become int64 (float64 if they hold nulls), fractional and decimal columns float64, boolean
+    columns bool (if they hold no nulls) and date and timestamp columns datetime64. Other columns are kept."""
+    for position, field in enumerate(fields):
+        spark_type = field.get(u"type")
+        if not isinstance(spark_type, string_types):
+            # Nested struct, array and map types.
+            continue
+
+        column = df[position]
+        if spark_type in _SPARK_INTEGRAL_TYPES:
+            df[position] = pd.to_numeric(column, errors="coerce")
+        elif spark_type in _SPARK_FRACTIONAL_TYPES or spark_type.startswith(u"decimal"):
+            df[position] = pd.to_numeric(column, errors="coerce").astype(np.float64)
+        elif spark_type == u"boolean":
+            if not column.isnull().any():
+                df[position] = column.astype(bool)
+        elif spark_type in _SPARK_DATETIME_TYPES:
+            df[position] = pd.to_datetime(column, errors="coerce")